@@ -1,6 +1,6 @@
 import { type NextRequest, NextResponse } from "next/server"
 import { createServerSupabaseClient } from "@/lib/supabase"
-import { spawn } from "child_process"
+import { getPythonWorker } from "@/lib/python-worker"
 import path from "path"
 
 export async function POST(request: NextRequest) {
@@ -84,11 +84,18 @@ export async function POST(request: NextRequest) {
       // Construir descripción del caso basada en las preguntas del usuario
       const caseDescription = userQuestions.map((q) => q.question).join(" ")
 
+      // Categoría más frecuente de sus preguntas: permite usar la matriz de afinidad precalculada
+      const categoryCounts = new Map<string, number>()
+      for (const q of userQuestions) {
+        if (q.category) categoryCounts.set(q.category, (categoryCounts.get(q.category) || 0) + 1)
+      }
+      const category = [...categoryCounts.entries()].sort((a, b) => b[1] - a[1])[0]?.[0]
+
       // Obtener recomendaciones de abogados usando ML
       recommendedLawyers = await getRecommendedLawyers(caseDescription, {
         preferred_experience: 5,
         preferred_rating: 4.5,
-      })
+      }, category)
     }
 
     return NextResponse.json({
@@ -138,56 +145,27 @@ export async function GET(request: NextRequest) {
   }
 }
 
-// Función para ejecutar el script de Python para recomendaciones de abogados
-async function getRecommendedLawyers(caseDescription: string, preferences: any): Promise<any[]> {
-  return new Promise((resolve, reject) => {
-    try {
-      const requestData = JSON.stringify({
-        case_description: caseDescription,
-        user_preferences: preferences,
-      })
-
-      // Ruta al script de Python
-      const scriptPath = path.join(process.cwd(), "scripts", "ml_lawyer_recommender.py")
-
-      // Ejecutar el script de Python como proceso hijo
-      const pythonProcess = spawn("python", [scriptPath, requestData])
-
-      let result = ""
-      let error = ""
-
-      pythonProcess.stdout.on("data", (data) => {
-        result += data.toString()
-      })
-
-      pythonProcess.stderr.on("data", (data) => {
-        error += data.toString()
-      })
+// Función para consultar el recomendador de abogados en Python.
+// El script se mantiene residente (--serve) para no recargar modelos y datos en cada cita.
+async function getRecommendedLawyers(caseDescription: string, preferences: any, category?: string): Promise<any[]> {
+  try {
+    // Ruta al script de Python
+    const scriptPath = path.join(process.cwd(), "scripts", "ml_lawyer_recommender.py")
+    const worker = getPythonWorker("python", [scriptPath, "--serve"])
+
+    const parsedResult = await worker.request({
+      case_description: caseDescription,
+      user_preferences: preferences,
+      category,
+    })
 
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          console.error(`Python process exited with code ${code}`)
-          console.error(`Error: ${error}`)
-          resolve([]) // Devolver array vacío en caso de error
-          return
-        }
-
-        try {
-          const parsedResult = JSON.parse(result)
-          if (parsedResult.status === "success" && Array.isArray(parsedResult.recommendations)) {
-            resolve(parsedResult.recommendations)
-          } else {
-            console.error("Invalid response format from Python script")
-            resolve([])
-          }
-        } catch (parseError) {
-          console.error("Error parsing Python script output:", parseError)
-          resolve([])
-        }
-      })
-    } catch (err) {
-      console.error("Error executing Python script:", err)
-      resolve([])
+    if (parsedResult.status === "success" && Array.isArray(parsedResult.recommendations)) {
+      return parsedResult.recommendations
     }
-  })
+    console.error("Invalid response format from Python script:", parsedResult.message)
+    return []
+  } catch (err) {
+    console.error("Error executing Python script:", err)
+    return [] // Devolver array vacío en caso de error
+  }
 }
@@ -1,7 +1,7 @@
 import { type NextRequest, NextResponse } from "next/server";
 import { createServerSupabaseClient } from "@/lib/supabase";
 import { generateLegalResponse } from "@/lib/ai";
-import { spawn } from "child_process";
+import { getPythonWorker } from "@/lib/python-worker";
 import path from "path";
 import { marked } from "marked";  // Asegúrate de que la librería esté importada correctamente
 
@@ -20,8 +20,12 @@ export async function POST(request: NextRequest) {
       return NextResponse.json({ error: "Mensaje requerido" }, { status: 400 });
     }
 
-    // Generar respuesta usando el modelo de IA real
-    const aiResponse = await generateLegalResponse(message);
+    // Reutilizar la respuesta de una consulta casi idéntica; si no hay, usar el modelo de IA real
+    const cachedResponse = await lookupCachedResponse(message);
+    const aiResponse = cachedResponse ?? await generateLegalResponse(message);
+    if (!cachedResponse) {
+      storeCachedResponse(message, aiResponse);
+    }
 
     // Convertir las sugerencias a Markdown (unirlas en un solo string)
     const [htmlResponse, htmlSuggestions] = await Promise.all([
@@ -95,6 +99,37 @@ export async function POST(request: NextRequest) {
   }
 }
 
+// Caché semántica de respuestas (scripts/ml_response_cache.py en modo residente).
+// Se desactiva con RESPONSE_CACHE=off; cualquier error se trata como fallo de caché.
+function getResponseCacheWorker() {
+  if (process.env.RESPONSE_CACHE === "off") return null;
+  const scriptPath = path.join(process.cwd(), "scripts", "ml_response_cache.py");
+  return getPythonWorker("python3", [scriptPath, "--serve"]);
+}
+
+// La caché es opcional: si no responde pronto (o falla) se genera la respuesta sin ella
+const CACHE_LOOKUP_TIMEOUT_MS = 300;
+
+async function lookupCachedResponse(message: string) {
+  const worker = getResponseCacheWorker();
+  if (!worker) return null;
+  try {
+    const result = await worker.request({ op: "lookup", message }, CACHE_LOOKUP_TIMEOUT_MS);
+    return result?.status === "success" && result.hit ? result.response : null;
+  } catch (error) {
+    console.error("Error consultando la caché de respuestas:", error);
+    return null;
+  }
+}
+
+function storeCachedResponse(message: string, response: any) {
+  const worker = getResponseCacheWorker();
+  if (!worker) return;
+  worker.request({ op: "store", message, response }).catch((error) => {
+    console.error("Error guardando en la caché de respuestas:", error);
+  });
+}
+
 async function getSystemRecommendations(supabase: any, topic: string | null) {
   if (!topic) return [];
   
@@ -117,64 +152,40 @@ async function getSystemRecommendations(supabase: any, topic: string | null) {
   }
 }
 
-// Función para ejecutar el script de Python para recomendaciones
+// Función para consultar el script de Python para recomendaciones.
+// El script corre en modo residente (--serve) con ML_QUESTION_WORKERS procesos,
+// y el historial viaja por stdin en lugar de argv.
 async function getRecommendedQuestions(userHistory: any[]): Promise<any[]> {
-  return new Promise((resolve, reject) => {
-    try {
-      // Preparar los datos para Python en el formato correcto
-      const historyForML = userHistory.map(item => ({
-        question: item.question,
-        category: item.category || 'general' // Asegurar que siempre haya categoría
+  try {
+    // Preparar los datos para Python en el formato correcto
+    const historyForML = userHistory.map(item => ({
+      question: item.question,
+      category: item.category || 'general' // Asegurar que siempre haya categoría
+    }));
+
+    const scriptPath = path.join(process.cwd(), "scripts", "ml_question_recommender.py");
+    const workers = process.env.ML_QUESTION_WORKERS || "1";
+    const worker = getPythonWorker("python3", [scriptPath, "--serve", "--workers", workers]);
+
+    const parsed = await worker.request({
+      user_history: historyForML  // Ahora coincide con lo que Python espera
+    });
+
+    if (parsed.status === "success") {
+      // Mapear a la estructura que espera tu frontend
+      return parsed.recommendations.map((rec: any, idx: number) => ({
+        id: idx + 1,
+        question: rec.question,
+        category: rec.category,
+        count: Math.round(rec.similarity * 100) // Convertir similitud a porcentaje
       }));
-
-      const requestData = JSON.stringify({
-        user_history: historyForML  // Ahora coincide con lo que Python espera
-      });
-
-      const scriptPath = path.join(process.cwd(), "scripts", "ml_question_recommender.py");
-      const pythonProcess = spawn("python3", [scriptPath, requestData]);
-
-      let result = "";
-      pythonProcess.stdout.on("data", (data) => {
-        result += data.toString();
-      });
-
-      pythonProcess.stderr.on("data", (data) => {
-        console.error(`Python Error: ${data}`);
-      });
-
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          console.error(`Python process exited with code ${code}`);
-          resolve([]);
-          return;
-        }
-
-        try {
-          const parsed = JSON.parse(result);
-          if (parsed.status === "success") {
-            // Mapear a la estructura que espera tu frontend
-            const recommendations = parsed.recommendations.map((rec: any, idx: number) => ({
-              id: idx + 1,
-              question: rec.question,
-              category: rec.category,
-              count: Math.round(rec.similarity * 100) // Convertir similitud a porcentaje
-            }));
-            resolve(recommendations);
-          } else {
-            console.error("Python script returned error:", parsed.message);
-            resolve([]);
-          }
-        } catch (e) {
-          console.error("Error parsing Python output:", e);
-          resolve([]);
-        }
-      });
-    } catch (err) {
-      console.error("Error executing Python script:", err);
-      resolve([]);
     }
-  });
+    console.error("Python script returned error:", parsed.message);
+    return [];
+  } catch (err) {
+    console.error("Error executing Python script:", err);
+    return [];
+  }
 }
 
 // Función para mejorar el formato del contenido HTML (aplicar clases de Tailwind)
@@ -0,0 +1,387 @@
+"""
+Clasificación por lotes de preguntas con LegalAIChatbot.
+
+Pensado para completar o recalcular la categoría de user_questions (millones
+de filas) cuando cambia la base de conocimiento, o para clasificar archivos
+de preguntas fuera de línea:
+
+- Lee los mensajes por bloques de un archivo (NDJSON con "id" y "question" o
+  "message", o texto plano con una pregunta por línea) o de la base de datos
+  con un cursor del lado del servidor, en orden de id.
+- Clasifica cada bloque en un pool de procesos (LegalAIChatbot.classify, sin
+  estado de sesión). El modo es determinista: la base de conocimiento
+  compilada se comparte por memoria mapeada, los empates se resuelven por el
+  orden de los temas y las respuestas opcionales (--responses) se eligen por
+  hash del mensaje, nunca con random.choice. El resultado no depende del
+  número de procesos.
+- Escribe los resultados por bloques, en orden: NDJSON en un archivo o en
+  stdout, y/o un UPDATE agrupado de user_questions.category por bloque. La
+  categoría es la de la aplicación (chatbot_ml.TOPIC_CATEGORIES, las de
+  lib/ai.ts), no el nombre del tema de la base de conocimiento.
+- Guarda un punto de control tras cada bloque escrito (posición de entrada,
+  bytes de salida, versión de la base de conocimiento). Con --resume un
+  trabajo interrumpido continúa desde ahí; la salida se trunca al último
+  bloque confirmado, así que no quedan filas duplicadas.
+- Informa progreso y rendimiento en stderr cada --progress-interval segundos.
+
+Uso:
+    python chatbot_batch.py --input preguntas.jsonl --output categorias.jsonl [--workers 4]
+    python chatbot_batch.py --db --write-db --only-general --checkpoint backfill.json
+    python chatbot_batch.py --db --write-db --checkpoint backfill.json --resume
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chatbot_ml import MIN_TOPIC_CONFIDENCE, LegalAIChatbot
+from ml_metrics import log_event
+
+# Mensajes por bloque: unidad de trabajo de los procesos, de escritura y de punto de control
+DEFAULT_CHUNK_SIZE = 1000
+
+# Bloques en curso por proceso (limita la memoria de la lectura adelantada)
+CHUNKS_IN_FLIGHT = 2
+
+DB_QUESTIONS_QUERY = """
+    SELECT id, question
+    FROM user_questions
+    WHERE (%(after)s::uuid IS NULL OR id > %(after)s::uuid)
+      AND (NOT %(only_general)s OR category IS NULL OR category IN ('', 'general'))
+    ORDER BY id
+"""
+
+DB_COUNT_QUERY = """
+    SELECT count(*)
+    FROM user_questions
+    WHERE (%(after)s::uuid IS NULL OR id > %(after)s::uuid)
+      AND (NOT %(only_general)s OR category IS NULL OR category IN ('', 'general'))
+"""
+
+UPDATE_CATEGORIES = """
+    UPDATE user_questions AS uq
+    SET category = v.category
+    FROM (VALUES %s) AS v (id, category)
+    WHERE uq.id = v.id::uuid AND uq.category IS DISTINCT FROM v.category
+"""
+
+
+def _message_text(record):
+    return record.get('question') or record.get('message') or ''
+
+
+def iter_file_records(path, start_line=0):
+    """(posición, id, texto) de cada pregunta del archivo a partir de la línea start_line"""
+    ndjson = path.endswith(('.jsonl', '.ndjson', '.json'))
+    with open(path, encoding='utf-8') as handle:
+        for line_number, line in enumerate(handle, 1):
+            if line_number <= start_line:
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            if ndjson:
+                record = json.loads(line)
+                yield line_number, record.get('id', line_number), _message_text(record)
+            else:
+                yield line_number, line_number, line
+
+
+def count_file_records(path, start_line=0):
+    with open(path, 'rb') as handle:
+        return sum(1 for line_number, line in enumerate(handle, 1) if line_number > start_line and line.strip())
+
+
+def iter_db_records(conn, after_id=None, only_general=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """(posición, id, texto) de user_questions en orden de id, con un cursor del lado del servidor"""
+    cursor = conn.cursor(name='chatbot_batch')
+    cursor.itersize = chunk_size
+    cursor.execute(DB_QUESTIONS_QUERY, {'after': after_id, 'only_general': only_general})
+    try:
+        for question_id, question in cursor:
+            yield str(question_id), str(question_id), question or ''
+    finally:
+        cursor.close()
+
+
+def count_db_records(conn, after_id=None, only_general=False):
+    cursor = conn.cursor()
+    cursor.execute(DB_COUNT_QUERY, {'after': after_id, 'only_general': only_general})
+    total = cursor.fetchone()[0]
+    cursor.close()
+    conn.rollback()
+    return total
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# LegalAIChatbot de cada proceso del pool y opciones de clasificación
+_worker_chatbot = None
+_worker_options = {}
+
+
+def _init_worker(options):
+    global _worker_chatbot, _worker_options
+    _worker_chatbot = LegalAIChatbot(max_sessions=1, deterministic=True)
+    _worker_options = options
+
+
+def _classify_chunk(chunk):
+    """Clasifica un bloque de (id, texto); devuelve un resultado por mensaje, en orden"""
+    min_confidence = _worker_options.get('min_confidence', MIN_TOPIC_CONFIDENCE)
+    responses = _worker_options.get('responses', False)
+    results = []
+    for question_id, text in chunk:
+        result = dict(id=question_id, **_worker_chatbot.classify(text, min_confidence))
+        if responses:
+            result['response'] = _worker_chatbot.generate_contextual_response(
+                result['topic'], result['confidence'], text)
+        results.append(result)
+    return results
+
+
+def classify_chunks(records, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, min_confidence=MIN_TOPIC_CONFIDENCE,
+                    responses=False):
+    """
+    Clasifica los registros (posición, id, texto) por bloques y entrega, en el
+    orden de entrada, (posición del último registro del bloque, resultados).
+    """
+    options = {'min_confidence': min_confidence, 'responses': responses}
+    chunks = (
+        (chunk[-1][0], [(question_id, text) for _, question_id, text in chunk])
+        for chunk in chunked(records, chunk_size)
+    )
+    if workers <= 1:
+        _init_worker(options)
+        for position, chunk in chunks:
+            yield position, _classify_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(options,)) as pool:
+        pending = deque()
+        for position, chunk in chunks:
+            pending.append((position, pool.submit(_classify_chunk, chunk)))
+            # Lectura adelantada acotada; los resultados salen en orden
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT:
+                position, future = pending.popleft()
+                yield position, future.result()
+        while pending:
+            position, future = pending.popleft()
+            yield position, future.result()
+
+
+class NdjsonOutput:
+    """Resultados NDJSON en un archivo (truncado al último bloque confirmado) o en stdout"""
+
+    def __init__(self, path=None, offset=0):
+        self.path = path
+        if path is None:
+            self.handle = sys.stdout.buffer
+            return
+        self.handle = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        # Descarta lo escrito después del último punto de control
+        self.handle.truncate(offset)
+        self.handle.seek(offset)
+
+    def write(self, results):
+        """Escribe un bloque y lo lleva a disco; devuelve el tamaño confirmado de la salida"""
+        self.handle.write(b''.join(json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n'
+                                   for result in results))
+        self.handle.flush()
+        if self.path is None:
+            return 0
+        os.fsync(self.handle.fileno())
+        return self.handle.tell()
+
+    def close(self):
+        if self.path is not None:
+            self.handle.close()
+
+
+class DatabaseOutput:
+    """Actualiza user_questions.category con un UPDATE agrupado y un commit por bloque"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows_updated = 0
+
+    def write(self, results):
+        from psycopg2.extras import execute_values
+
+        rows = sorted((str(result['id']), result['category']) for result in results)
+        cursor = self.conn.cursor()
+        try:
+            execute_values(cursor, UPDATE_CATEGORIES, rows, page_size=len(rows))
+            self.rows_updated += cursor.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save_checkpoint(path, state):
+    """Reemplaza el punto de control de forma atómica"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(dict(state, updated_at=time.time()), handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+class Progress:
+    """Progreso y rendimiento en stderr, como mucho cada `interval` segundos"""
+
+    def __init__(self, total=None, done=0, interval=10.0):
+        self.total = total
+        self.done = done
+        self.processed = 0
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def update(self, count):
+        self.processed += count
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            log_event('batch_progress', **self.summary(now))
+
+    def summary(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        fields = {'processed': self.done + self.processed, 'elapsed_s': round(elapsed, 1),
+                  'messages_per_s': round(rate, 1)}
+        if self.total is not None:
+            remaining = max(0, self.total - self.processed)
+            fields['total'] = self.done + self.total
+            fields['eta_s'] = round(remaining / rate, 1) if rate > 0 else None
+        return fields
+
+
+def run(args):
+    source = f"db:{'general' if args.only_general else 'all'}" if args.db else f"file:{os.path.abspath(args.input)}"
+    checkpoint = load_checkpoint(args.checkpoint) if args.resume else None
+    if args.resume and checkpoint is None:
+        log_event('batch_checkpoint_missing', level='warning', checkpoint=args.checkpoint)
+    if checkpoint is not None and checkpoint['source'] != source:
+        raise ValueError(f"El punto de control es de otra fuente: {checkpoint['source']}")
+
+    kb_version = getattr(LegalAIChatbot(max_sessions=1).knowledge_base, 'version', None)
+    if checkpoint is not None and checkpoint.get('kb_version') != kb_version:
+        log_event('batch_kb_changed', level='warning', checkpoint=checkpoint.get('kb_version'), current=kb_version)
+
+    position = checkpoint['position'] if checkpoint else None
+    state = {
+        'source': source,
+        'position': position,
+        'processed': checkpoint['processed'] if checkpoint else 0,
+        'output_offset': checkpoint.get('output_offset', 0) if checkpoint else 0,
+        'kb_version': kb_version
+    }
+
+    read_conn = write_conn = None
+    outputs = []
+    try:
+        if args.db:
+            from ml_db import get_connection
+            read_conn = get_connection()
+            total = count_db_records(read_conn, position, args.only_general)
+            records = iter_db_records(read_conn, position, args.only_general, args.chunk_size)
+        else:
+            total = count_file_records(args.input, position or 0)
+            records = iter_file_records(args.input, position or 0)
+
+        if args.write_db:
+            from ml_db import get_connection
+            write_conn = get_connection()
+            outputs.append(DatabaseOutput(write_conn))
+        if args.output or not args.write_db:
+            outputs.append(NdjsonOutput(args.output, state['output_offset']))
+
+        progress = Progress(total, state['processed'], args.progress_interval)
+        for position, results in classify_chunks(records, args.workers, args.chunk_size,
+                                                 args.min_confidence, args.responses):
+            for output in outputs:
+                offset = output.write(results)
+                if isinstance(output, NdjsonOutput):
+                    state['output_offset'] = offset
+            state['position'] = position
+            state['processed'] += len(results)
+            if args.checkpoint:
+                save_checkpoint(args.checkpoint, state)
+            progress.update(len(results))
+
+        summary = progress.summary()
+        if write_conn is not None:
+            summary['rows_updated'] = outputs[0].rows_updated
+        log_event('batch_done', workers=args.workers, **summary)
+        return summary
+    finally:
+        for output in outputs:
+            if isinstance(output, NdjsonOutput):
+                output.close()
+        if read_conn is not None or write_conn is not None:
+            from ml_db import close_pool, release_connection
+            release_connection(read_conn)
+            release_connection(write_conn)
+            close_pool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='archivo NDJSON (id, question) o de texto (una pregunta por línea)')
+    source.add_argument('--db', action='store_true', help='leer user_questions de la base de datos')
+    parser.add_argument('--only-general', action='store_true',
+                        help='con --db, solo las filas sin categoría o en "general"')
+    parser.add_argument('--output', help='archivo NDJSON de resultados (por defecto stdout, salvo con --write-db)')
+    parser.add_argument('--write-db', action='store_true', help='actualizar user_questions.category')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--min-confidence', type=float, default=MIN_TOPIC_CONFIDENCE,
+                        help='confianza mínima del tema (la del chatbot por defecto); por debajo la categoría '
+                             'es "general"')
+    parser.add_argument('--responses', action='store_true', help='incluir la respuesta (determinista) del chatbot')
+    parser.add_argument('--checkpoint', help='archivo de punto de control, actualizado tras cada bloque')
+    parser.add_argument('--resume', action='store_true', help='continuar desde el punto de control')
+    parser.add_argument('--progress-interval', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requiere --checkpoint')
+    if args.resume and args.output is None and not args.write_db:
+        parser.error('--resume requiere --output o --write-db')
+    if args.write_db and not args.db:
+        parser.error('--write-db requiere --db (los ids deben ser de user_questions)')
+
+    try:
+        run(args)
+    except Exception as e:
+        print(json.dumps({'status': 'error', 'message': f"Processing error: {str(e)}"}), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
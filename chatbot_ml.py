@@ -1,88 +1,240 @@
 import json
-import re
+import os
+import sys
+import time
+import zlib
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Mapping, Optional, Tuple
 import random
 
+# Los módulos compartidos de ML viven en scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+
+from ml_knowledge_base import KnowledgeBase, KnowledgeBaseStore, get_knowledge_store, keyword_pieces, keyword_tables
+from ml_metrics import span
+from ml_text import normalize, tokenize
+
+# Sesión usada cuando el llamador no indica una
+DEFAULT_SESSION = "default"
+
+# Categoría asignada cuando no se identifica un tema (como en app/api/chatbot)
+GENERAL_CATEGORY = "general"
+
+# Categorías de user_questions que usa la aplicación (lib/ai.ts)
+APP_CATEGORIES = frozenset({
+    "laboral", "pensiones", "herencias", "accesibilidad", "certificacion", "judicial",
+    "tributario", "ayudas", "transporte", "patrimonio", GENERAL_CATEGORY
+})
+
+# Tema de la base de conocimiento -> categoría de la aplicación; los temas sin
+# entrada (p. ej. uno nuevo en data/legal_knowledge.json) quedan en "general"
+TOPIC_CATEGORIES = {
+    "discapacidad_derechos": GENERAL_CATEGORY,
+    "pension_discapacidad": "pensiones",
+    "herencias_testamentos": "herencias",
+    "derechos_laborales": "laboral",
+    "accesibilidad": "accesibilidad",
+}
+
+# Confianza mínima para responder (y clasificar) según el tema identificado
+MIN_TOPIC_CONFIDENCE = 0.3
+
+class KeywordIndex:
+    """
+    Índice invertido de las palabras clave de la base de conocimiento.
+
+    Reproduce la regla de calculate_similarity (una palabra del usuario
+    coincide con un tema si alguna palabra clave del tema está contenida
+    en ella, o ella está contenida en alguna palabra clave del tema) sin
+    recorrer todos los temas:
+    - `keyword_topics`: palabra clave exacta -> temas, para buscar las
+      subcadenas de la palabra del usuario ("tk in keyword").
+    - `substring_topics`: cada subcadena de cada palabra clave -> temas,
+      para buscar la palabra del usuario completa ("keyword in tk").
+    """
+
+    def __init__(self, knowledge_base: Dict, min_length: int = 3):
+        self.topics = list(knowledge_base)
+        self.min_length = min_length
+        self.keyword_topics, self.substring_topics = keyword_tables(knowledge_base, min_length)
+        self.keyword_lengths = sorted({len(tk) for tk in self.keyword_topics})
+
+    def matching_topics(self, keyword: str) -> set:
+        """Temas con alguna palabra clave que coincide con la palabra del usuario"""
+        topics = set(self.substring_topics.get(keyword, ()))
+        for piece in keyword_pieces(keyword, self.keyword_lengths):
+            topics.update(self.keyword_topics.get(piece, ()))
+        return topics
+
+    def best_topic(self, user_keywords: List[str]) -> Tuple[str, float]:
+        """Tema con más palabras coincidentes; a igualdad gana el primero de la base"""
+        if not user_keywords:
+            return None, 0.0
+
+        matches: Dict[int, int] = {}
+        for keyword in user_keywords:
+            for order in self.matching_topics(keyword):
+                matches[order] = matches.get(order, 0) + 1
+
+        if not matches:
+            return None, 0.0
+        best_order = min(matches, key=lambda order: (-matches[order], order))
+        return self.topics[best_order], matches[best_order] / len(user_keywords)
+
+
+class ConversationEntry:
+    """Registro compacto de un intercambio (sin diccionario por instancia)"""
+    __slots__ = ("user_message", "bot_response", "topic", "confidence", "timestamp")
+
+    def __init__(self, user_message: str, bot_response: str, topic: Optional[str], confidence: float,
+                 timestamp: float):
+        self.user_message = user_message
+        self.bot_response = bot_response
+        self.topic = topic
+        self.confidence = confidence
+        self.timestamp = timestamp
+
+    def to_dict(self) -> Dict:
+        return {
+            "user_message": self.user_message,
+            "bot_response": self.bot_response,
+            "topic": self.topic,
+            "confidence": self.confidence,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+
+class ContextEntry:
+    """Mensaje guardado en el contexto de un tema"""
+    __slots__ = ("message", "timestamp")
+
+    def __init__(self, message: str, timestamp: float):
+        self.message = message
+        self.timestamp = timestamp
+
+    def to_dict(self) -> Dict:
+        return {"message": self.message, "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()}
+
+
+class SessionState:
+    """Historial y contexto de una sesión, acotados con buffers circulares"""
+    __slots__ = ("history", "context", "context_size")
+
+    def __init__(self, history_size: int, context_size: int):
+        self.history = deque(maxlen=history_size)
+        self.context: Dict[str, deque] = {}
+        self.context_size = context_size
+
+    def add_context(self, topic: str, entry: ContextEntry):
+        if topic not in self.context:
+            self.context[topic] = deque(maxlen=self.context_size)
+        self.context[topic].append(entry)
+
+
+class ConversationStats:
+    """Agregados acumulados de todas las conversaciones, sin recorrer historiales"""
+
+    def __init__(self):
+        self.total_messages = 0
+        self.confidence_sum = 0.0
+        self.topic_counts: Dict[str, int] = {}
+
+    def record(self, topic: Optional[str], confidence: float):
+        self.total_messages += 1
+        self.confidence_sum += confidence
+        if topic:
+            self.topic_counts[topic] = self.topic_counts.get(topic, 0) + 1
+
+    def average_confidence(self) -> float:
+        return self.confidence_sum / self.total_messages if self.total_messages else 0.0
+
+    def most_common_topics(self) -> List[Tuple[str, int]]:
+        return sorted(self.topic_counts.items(), key=lambda x: x[1], reverse=True)
+
+
 class LegalAIChatbot:
     """
     Sistema de chatbot con Machine Learning para asesoría legal 
     especializada en derechos de personas con discapacidad
     """
     
-    def __init__(self):
+    def __init__(self, history_size: int = 50, context_size: int = 10, max_sessions: int = 1000,
+                 max_message_length: int = 1000, response_cache=None,
+                 knowledge_store: Optional[KnowledgeBaseStore] = None, deterministic: bool = False):
+        self.knowledge_store = knowledge_store or get_knowledge_store()
         self.knowledge_base = self._load_legal_knowledge()
-        self.conversation_history = []
-        self.user_context = {}
+        # Base entregada por el almacén (una asignada a mano no se recarga)
+        self._stored_knowledge = self.knowledge_base
+        self.keyword_index = self._index_for(self.knowledge_base)
+        # Estado por sesión, acotado: historial y contexto por tema son buffers circulares y
+        # las sesiones menos recientes se descartan al superar max_sessions
+        self.history_size = history_size
+        self.context_size = context_size
+        self.max_sessions = max_sessions
+        self.max_message_length = max_message_length
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.stats = ConversationStats()
+        # Caché semántica opcional (ml_response_cache.SemanticResponseCache): consultas casi
+        # duplicadas del mismo tema reutilizan la respuesta ya generada
+        self.response_cache = response_cache
+        # Modo determinista (procesos por lotes, pruebas): la respuesta se elige por un hash
+        # estable del mensaje en lugar de random.choice, igual en cada ejecución y proceso
+        self.deterministic = deterministic
+    
+    def get_session(self, session_id: str = DEFAULT_SESSION) -> SessionState:
+        """Devuelve el estado de una sesión, creándolo si no existe"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = SessionState(self.history_size, self.context_size)
+            self.sessions[session_id] = session
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
+    
+    @property
+    def conversation_history(self) -> deque:
+        """Historial de la sesión por defecto"""
+        return self.get_session().history
+    
+    @property
+    def user_context(self) -> Dict[str, deque]:
+        """Contexto por tema de la sesión por defecto"""
+        return self.get_session().context
         
-    def _load_legal_knowledge(self) -> Dict:
+    def _load_legal_knowledge(self) -> Mapping:
         """Carga la base de conocimiento legal especializada"""
-        return {
-            "discapacidad_derechos": {
-                "keywords": ["discapacidad", "derechos", "inclusion", "accesibilidad"],
-                "responses": [
-                    "Las personas con discapacidad tienen derecho a la igualdad de oportunidades y no discriminación según la Convención de la ONU.",
-                    "Tienes derecho a adaptaciones razonables en el trabajo, educación y servicios públicos.",
-                    "La accesibilidad universal es un derecho fundamental reconocido internacionalmente."
-                ],
-                "legal_articles": ["Art. 14 Constitución", "Ley 1346 de 2009", "Decreto 1507 de 2014"]
-            },
-            "pension_discapacidad": {
-                "keywords": ["pension", "invalidez", "incapacidad", "beneficio"],
-                "responses": [
-                    "Para acceder a pensión por invalidez necesitas tener un grado de pérdida de capacidad laboral igual o superior al 50%.",
-                    "El proceso incluye evaluación médica, calificación de pérdida de capacidad laboral y solicitud ante el fondo de pensiones.",
-                    "Existen diferentes tipos: pensión de invalidez por enfermedad común, accidente de trabajo o enfermedad profesional."
-                ],
-                "requirements": ["Certificado médico", "Historia clínica", "Exámenes complementarios", "Formulario de solicitud"]
-            },
-            "herencias_testamentos": {
-                "keywords": ["herencia", "testamento", "sucesion", "patrimonio"],
-                "responses": [
-                    "Las personas con discapacidad tienen derecho a la legítima ampliada para garantizar su protección patrimonial.",
-                    "Es recomendable establecer un fideicomiso o patrimonio autónomo para proteger los bienes del beneficiario.",
-                    "El testamento debe incluir disposiciones especiales para garantizar el cuidado y manutención de la persona con discapacidad."
-                ],
-                "legal_protections": ["Legítima ampliada", "Fideicomiso", "Patrimonio autónomo", "Sustitución fideicomisaria"]
-            },
-            "derechos_laborales": {
-                "keywords": ["trabajo", "empleo", "laboral", "discriminacion"],
-                "responses": [
-                    "Los empleadores deben realizar adaptaciones razonables del puesto de trabajo sin que esto represente una carga desproporcionada.",
-                    "Existe una cuota de empleo del 4% para personas con discapacidad en el sector público.",
-                    "La discriminación laboral por motivos de discapacidad está prohibida y es sancionable."
-                ],
-                "protections": ["Estabilidad laboral reforzada", "Adaptaciones razonables", "Cuota de empleo", "No discriminación"]
-            },
-            "accesibilidad": {
-                "keywords": ["accesibilidad", "barreras", "arquitectonicas", "transporte"],
-                "responses": [
-                    "Todos los espacios públicos y privados de uso público deben cumplir con normas de accesibilidad universal.",
-                    "Puedes presentar una acción de tutela si encuentras barreras arquitectónicas que limiten tu acceso.",
-                    "El transporte público debe ser accesible y contar con espacios preferenciales para personas con discapacidad."
-                ],
-                "regulations": ["NTC 4143", "NTC 4144", "Decreto 1538 de 2005", "Ley 361 de 1997"]
-            }
-        }
+        # Compilada desde data/legal_knowledge.json y con memoria mapeada: se comparte entre procesos
+        return self.knowledge_store.get()
+    
+    @staticmethod
+    def _index_for(knowledge_base: Mapping):
+        """Índice precalculado de la base compilada, o uno en memoria para un diccionario"""
+        if isinstance(knowledge_base, KnowledgeBase):
+            return knowledge_base.keyword_index
+        return KeywordIndex(knowledge_base)
+    
+    def refresh_knowledge(self):
+        """Recarga en caliente la base de conocimiento si su archivo cambió"""
+        if self.knowledge_base is not self._stored_knowledge:
+            # Base modificada en memoria: se mantiene hasta que se reemplace
+            return
+        knowledge_base = self.knowledge_store.get()
+        if knowledge_base is not self.knowledge_base:
+            self.knowledge_base = self._stored_knowledge = knowledge_base
+            self.keyword_index = self._index_for(knowledge_base)
     
     def preprocess_message(self, message: str) -> str:
         """Preprocesa el mensaje del usuario"""
-        # Convertir a minúsculas y limpiar
-        message = message.lower().strip()
-        # Remover caracteres especiales excepto espacios y tildes
-        message = re.sub(r'[^\w\sáéíóúñü]', '', message)
-        return message
+        # Minúsculas, sin tildes ni caracteres especiales (pipeline compartido y cacheado)
+        return normalize(message)
     
     def extract_keywords(self, message: str) -> List[str]:
         """Extrae palabras clave del mensaje"""
-        processed_message = self.preprocess_message(message)
-        words = processed_message.split()
-        
-        # Filtrar palabras comunes (stop words)
-        stop_words = {'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'es', 'se', 'no', 'te', 'lo', 'le', 'da', 'su', 'por', 'son', 'con', 'para', 'como', 'pero', 'sus', 'del', 'al', 'me', 'mi', 'tu', 'si', 'yo', 'he', 'ha', 'mi'}
-        
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]
-        return keywords
+        # Filtrar palabras comunes (stop words en español) y palabras de hasta 2 letras
+        return list(tokenize(message, min_length=3))
     
     def calculate_similarity(self, user_keywords: List[str], topic_keywords: List[str]) -> float:
         """Calcula la similitud entre las palabras clave del usuario y un tema"""
@@ -92,27 +244,30 @@ class LegalAIChatbot:
         matches = sum(1 for keyword in user_keywords if any(tk in keyword or keyword in tk for tk in topic_keywords))
         return matches / len(user_keywords)
     
+    def rebuild_index(self):
+        """Reconstruye el índice de palabras clave tras reemplazar la base por un diccionario editado"""
+        self.keyword_index = KeywordIndex(self.knowledge_base)
+    
     def find_best_topic(self, message: str) -> Tuple[str, float]:
         """Encuentra el tema más relevante para el mensaje"""
+        self.refresh_knowledge()
         user_keywords = self.extract_keywords(message)
-        best_topic = None
-        best_score = 0.0
-        
-        for topic, data in self.knowledge_base.items():
-            score = self.calculate_similarity(user_keywords, data["keywords"])
-            if score > best_score:
-                best_score = score
-                best_topic = topic
-        
-        return best_topic, best_score
+        # Mismo resultado que aplicar calculate_similarity a cada tema, vía índice invertido
+        return self.keyword_index.best_topic(user_keywords)
     
-    def generate_contextual_response(self, topic: str, confidence: float) -> str:
+    def _choose(self, options: List[str], message: str) -> str:
+        """Elige una de las respuestas posibles (al azar, o por hash del mensaje en modo determinista)"""
+        if self.deterministic:
+            return options[zlib.crc32(self.preprocess_message(message).encode("utf-8")) % len(options)]
+        return random.choice(options)
+
+    def generate_contextual_response(self, topic: str, confidence: float, message: str = "") -> str:
         """Genera una respuesta contextual basada en el tema identificado"""
-        if confidence < 0.3:
-            return self._generate_general_response()
+        if confidence < MIN_TOPIC_CONFIDENCE:
+            return self._generate_general_response(message)
         
         topic_data = self.knowledge_base[topic]
-        base_response = random.choice(topic_data["responses"])
+        base_response = self._choose(topic_data["responses"], message)
         
         # Agregar información adicional según el tema
         additional_info = ""
@@ -127,7 +282,7 @@ class LegalAIChatbot:
         
         return base_response + additional_info
     
-    def _generate_general_response(self) -> str:
+    def _generate_general_response(self, message: str = "") -> str:
         """Genera una respuesta general cuando no se identifica un tema específico"""
         general_responses = [
             "Entiendo tu consulta. Para brindarte la mejor asesoría, ¿podrías ser más específico sobre tu situación legal?",
@@ -135,39 +290,40 @@ class LegalAIChatbot:
             "Basándome en mi análisis, necesito más información para darte una respuesta precisa. ¿Puedes contarme más detalles sobre tu caso?",
             "Como asistente legal especializado en derechos de discapacidad, puedo ayudarte con temas de pensiones, herencias, derechos laborales y accesibilidad. ¿Cuál es tu consulta específica?"
         ]
-        return random.choice(general_responses)
+        return self._choose(general_responses, message)
     
-    def update_user_context(self, message: str, topic: str):
+    def update_user_context(self, message: str, topic: str, session_id: str = DEFAULT_SESSION):
         """Actualiza el contexto del usuario para mejorar futuras respuestas"""
-        if topic not in self.user_context:
-            self.user_context[topic] = []
-        
-        self.user_context[topic].append({
-            "message": message,
-            "timestamp": datetime.now().isoformat()
-        })
+        entry = ContextEntry(message[:self.max_message_length], time.time())
+        self.get_session(session_id).add_context(topic, entry)
     
-    def process_message(self, message: str) -> Dict:
+    def process_message(self, message: str, session_id: str = DEFAULT_SESSION) -> Dict:
         """Procesa un mensaje y genera una respuesta completa"""
         # Encontrar el mejor tema
-        topic, confidence = self.find_best_topic(message)
+        with span("chatbot.topic_matching"):
+            topic, confidence = self.find_best_topic(message)
         
-        # Generar respuesta
-        response = self.generate_contextual_response(topic, confidence)
+        # Generar respuesta (o reutilizar la de una consulta equivalente)
+        with span("chatbot.response"):
+            response = None
+            if self.response_cache is not None:
+                response, _ = self.response_cache.get(message, topic)
+            if response is None:
+                response = self.generate_contextual_response(topic, confidence, message)
+                if self.response_cache is not None:
+                    self.response_cache.put(message, response, topic)
         
-        # Actualizar contexto
-        if topic and confidence > 0.3:
-            self.update_user_context(message, topic)
-        
-        # Guardar en historial
-        conversation_entry = {
-            "user_message": message,
-            "bot_response": response,
-            "topic": topic,
-            "confidence": confidence,
-            "timestamp": datetime.now().isoformat()
-        }
-        self.conversation_history.append(conversation_entry)
+        with span("chatbot.context"):
+            # Actualizar contexto
+            if topic and confidence > 0.3:
+                self.update_user_context(message, topic, session_id)
+            
+            # Guardar en historial (acotado) y actualizar los agregados
+            conversation_entry = ConversationEntry(
+                message[:self.max_message_length], response, topic, confidence, time.time()
+            )
+            self.get_session(session_id).history.append(conversation_entry)
+            self.stats.record(topic, confidence)
         
         return {
             "response": response,
@@ -176,6 +332,19 @@ class LegalAIChatbot:
             "suggestions": self._generate_suggestions(topic)
         }
     
+    def classify(self, message: str, min_confidence: float = MIN_TOPIC_CONFIDENCE) -> Dict:
+        """
+        Clasifica un mensaje sin generar respuesta ni modificar sesiones ni
+        estadísticas (seguro para procesos por lotes). La categoría es la de
+        la aplicación para el tema (TOPIC_CATEGORIES) si su confianza alcanza
+        min_confidence; si no, "general".
+        """
+        topic, confidence = self.find_best_topic(message)
+        category = GENERAL_CATEGORY
+        if topic and confidence >= min_confidence:
+            category = TOPIC_CATEGORIES.get(topic, GENERAL_CATEGORY)
+        return {"topic": topic, "confidence": confidence, "category": category}
+
     def _generate_suggestions(self, topic: str) -> List[str]:
         """Genera sugerencias de seguimiento basadas en el tema"""
         suggestions_map = {
@@ -240,23 +409,16 @@ def main():
         print(f"Sugerencias: {', '.join(result['suggestions'][:2])}")
         print()
     
-    # Mostrar estadísticas del historial
+    # Mostrar estadísticas acumuladas (sin recorrer el historial)
     print("=== ESTADÍSTICAS DE CONVERSACIÓN ===")
-    topics_count = {}
-    for entry in chatbot.conversation_history:
-        topic = entry['topic']
-        if topic:
-            topics_count[topic] = topics_count.get(topic, 0) + 1
-    
     print("Temas más consultados:")
-    for topic, count in sorted(topics_count.items(), key=lambda x: x[1], reverse=True):
+    for topic, count in chatbot.stats.most_common_topics():
         print(f"- {topic}: {count} consultas")
     
-    print(f"\nTotal de consultas procesadas: {len(chatbot.conversation_history)}")
+    print(f"\nTotal de consultas procesadas: {chatbot.stats.total_messages}")
     
     # Análisis de confianza promedio
-    avg_confidence = sum(entry['confidence'] for entry in chatbot.conversation_history) / len(chatbot.conversation_history)
-    print(f"Confianza promedio del sistema: {avg_confidence:.2f}")
+    print(f"Confianza promedio del sistema: {chatbot.stats.average_confidence():.2f}")
 
 if __name__ == "__main__":
     main()
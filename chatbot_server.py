@@ -0,0 +1,335 @@
+"""
+Servidor concurrente para LegalAIChatbot.
+
+LegalAIChatbot.process_message modifica el estado de la sesión sin locks,
+así que no puede llamarse desde varios hilos a la vez. Este servidor:
+
+- Reparte las sesiones entre fragmentos (shards) por hash estable del
+  session_id. Cada fragmento tiene su propio LegalAIChatbot y un ejecutor
+  de un solo trabajador (hilo o proceso), de modo que los mensajes de una
+  sesión se procesan en orden y nunca en paralelo, sin locks.
+- Atiende las solicitudes con asyncio: miles de conexiones y sesiones
+  esperando no ocupan hilos.
+- Limita las solicitudes en curso (las que exceden CHATBOT_MAX_PENDING se
+  rechazan de inmediato) y aplica un tiempo máximo por solicitud.
+
+En modo "process" cada fragmento vive en su propio proceso y la búsqueda
+de temas se ejecuta en paralelo real; la base de conocimiento compilada se
+comparte entre procesos por memoria mapeada.
+
+Protocolo NDJSON (una solicitud por línea, la respuesta lleva el mismo "id"):
+    {"id": 1, "message": "...", "session_id": "usuario-1"}
+    {"id": 2, "op": "stats"} / {"id": 3, "op": "ping"} / {"id": 4, "op": "metrics"}
+Con "timings": true la respuesta incluye los tramos de ml_metrics, y con
+"profile": true el informe de cProfile de esa solicitud. --metrics-port
+expone las métricas de todos los fragmentos en GET /metrics (Prometheus).
+
+Uso:
+    python chatbot_server.py --serve [--shards 4] [--mode thread|process]
+    python chatbot_server.py --tcp 127.0.0.1:8766 [--shards 4] [--mode process] [--metrics-port 9100]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from chatbot_ml import DEFAULT_SESSION, LegalAIChatbot
+from ml_metrics import REGISTRY, MetricsRegistry, RequestTrace, log_event, start_metrics_server
+
+# LegalAIChatbot del fragmento que corre en este proceso (modo "process")
+_worker_chatbot = None
+
+
+def _init_worker(options):
+    global _worker_chatbot
+    _worker_chatbot = LegalAIChatbot(**options)
+
+
+def _process_message(chatbot, message, session_id, timings=False, profile=False):
+    # La traza se abre en el hilo o proceso del fragmento, donde se registran los tramos
+    with RequestTrace('message', profile=profile) as trace:
+        result = chatbot.process_message(message, session_id)
+    if timings:
+        result['timings'] = trace.to_dict()
+    if trace.profile_report is not None:
+        result['profile'] = trace.profile_report
+    return result
+
+
+def _worker_process_message(message, session_id, timings=False, profile=False):
+    return _process_message(_worker_chatbot, message, session_id, timings, profile)
+
+
+def _worker_metrics():
+    return REGISTRY.snapshot()
+
+
+def _chatbot_stats(chatbot):
+    stats = chatbot.stats
+    return {
+        'total_messages': stats.total_messages,
+        'confidence_sum': stats.confidence_sum,
+        'topic_counts': dict(stats.topic_counts),
+        'sessions': len(chatbot.sessions)
+    }
+
+
+def _worker_stats():
+    return _chatbot_stats(_worker_chatbot)
+
+
+def _error_response(message):
+    return {'status': 'error', 'message': message}
+
+
+class ChatbotShard:
+    """Un LegalAIChatbot y el único trabajador que lo toca"""
+
+    def __init__(self, mode, options):
+        if mode == 'process':
+            self.executor = ProcessPoolExecutor(1, initializer=_init_worker, initargs=(options,))
+            self.chatbot = None
+        else:
+            self.executor = ThreadPoolExecutor(1, thread_name_prefix='chatbot-shard')
+            self.chatbot = LegalAIChatbot(**options)
+
+    def process_message(self, message, session_id, timings=False, profile=False):
+        loop = asyncio.get_running_loop()
+        if self.chatbot is None:
+            return loop.run_in_executor(self.executor, _worker_process_message, message, session_id,
+                                        timings, profile)
+        return loop.run_in_executor(self.executor, _process_message, self.chatbot, message, session_id,
+                                    timings, profile)
+
+    def stats(self):
+        loop = asyncio.get_running_loop()
+        if self.chatbot is None:
+            return loop.run_in_executor(self.executor, _worker_stats)
+        return loop.run_in_executor(self.executor, _chatbot_stats, self.chatbot)
+
+    def metrics(self):
+        """Métricas del proceso del fragmento (None si comparte el proceso del servidor)"""
+        if self.chatbot is not None:
+            return None
+        return asyncio.get_running_loop().run_in_executor(self.executor, _worker_metrics)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ChatbotServer:
+    """Capa asyncio sobre fragmentos de LegalAIChatbot, con control de carga y tiempo máximo"""
+
+    def __init__(self, shards=None, mode=None, max_pending=None, timeout=None, max_sessions=1000, **chatbot_options):
+        self.mode = mode or os.getenv("CHATBOT_WORKER_MODE", "thread")
+        if self.mode not in ('thread', 'process'):
+            raise ValueError(f"Modo de trabajo desconocido: {self.mode}")
+        shard_count = int(shards or os.getenv("CHATBOT_SHARDS", str(os.cpu_count() or 1)))
+        self.max_pending = int(max_pending or os.getenv("CHATBOT_MAX_PENDING", "512"))
+        self.timeout = float(timeout or os.getenv("CHATBOT_TIMEOUT", "5"))
+        # El límite de sesiones se reparte entre los fragmentos
+        chatbot_options['max_sessions'] = max(1, -(-max_sessions // shard_count))
+        self.shards = [ChatbotShard(self.mode, chatbot_options) for _ in range(shard_count)]
+        self.in_flight = 0
+        self.stats = {'completed': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+        self.started_at = time.monotonic()
+
+    def shard_for(self, session_id):
+        # crc32 y no hash(): el reparto no cambia entre procesos ni reinicios
+        return self.shards[zlib.crc32(session_id.encode('utf-8')) % len(self.shards)]
+
+    def _count(self, result):
+        self.stats[result] += 1
+        REGISTRY.inc('chatbot_server_requests_total', (('result', result),))
+
+    async def process_message(self, message, session_id=DEFAULT_SESSION, timings=False, profile=False):
+        """Procesa un mensaje en el fragmento de su sesión"""
+        if self.in_flight >= self.max_pending:
+            self._count('rejected')
+            return _error_response("Servidor ocupado, intenta de nuevo en unos segundos")
+
+        self.in_flight += 1
+        try:
+            shard = self.shard_for(session_id)
+            result = await asyncio.wait_for(shard.process_message(message, session_id, timings, profile),
+                                            self.timeout)
+        except asyncio.TimeoutError:
+            # Si aún no había empezado, la solicitud se cancela en la cola del fragmento
+            self._count('timeouts')
+            log_event('timeout', level='warning', session_id=session_id, timeout=self.timeout)
+            return _error_response(f"Tiempo de respuesta agotado ({self.timeout:g} s)")
+        except Exception as e:
+            self._count('errors')
+            log_event('error', level='error', session_id=session_id, error=str(e))
+            return _error_response(str(e))
+        finally:
+            self.in_flight -= 1
+
+        self._count('completed')
+        return dict(result, status='success')
+
+    async def render_metrics(self):
+        """Métricas Prometheus del servidor y de todos sus fragmentos"""
+        pending = [metrics for metrics in (shard.metrics() for shard in self.shards) if metrics is not None]
+        if not pending:
+            return REGISTRY.render()
+        registry = MetricsRegistry(REGISTRY.buckets)
+        registry.merge(REGISTRY.snapshot())
+        for snapshot in await asyncio.gather(*pending):
+            registry.merge(snapshot)
+        return registry.render()
+
+    async def snapshot_stats(self):
+        """Agregados de todos los fragmentos más los contadores del servidor"""
+        shard_stats = await asyncio.gather(*(shard.stats() for shard in self.shards))
+        total_messages = sum(stats['total_messages'] for stats in shard_stats)
+        topic_counts = {}
+        for stats in shard_stats:
+            for topic, count in stats['topic_counts'].items():
+                topic_counts[topic] = topic_counts.get(topic, 0) + count
+        return dict(
+            self.stats,
+            in_flight=self.in_flight,
+            shards=len(self.shards),
+            mode=self.mode,
+            sessions=sum(stats['sessions'] for stats in shard_stats),
+            total_messages=total_messages,
+            average_confidence=(sum(stats['confidence_sum'] for stats in shard_stats) / total_messages
+                                if total_messages else 0.0),
+            most_common_topics=sorted(topic_counts.items(), key=lambda x: x[1], reverse=True),
+            uptime=time.monotonic() - self.started_at
+        )
+
+    async def handle(self, request):
+        """Atiende una solicitud NDJSON ya decodificada"""
+        op = request.get('op', 'message')
+        if op == 'ping':
+            return {'status': 'success', 'shards': len(self.shards), 'in_flight': self.in_flight}
+        if op == 'stats':
+            return {'status': 'success', 'stats': await self.snapshot_stats()}
+        if op == 'metrics':
+            return {'status': 'success', 'metrics': await self.render_metrics()}
+        if op == 'message':
+            message = request.get('message')
+            if not isinstance(message, str) or not message.strip():
+                return _error_response("Mensaje requerido")
+            return await self.process_message(message, str(request.get('session_id') or DEFAULT_SESSION),
+                                              bool(request.get('timings')), bool(request.get('profile')))
+        return _error_response(f"Operación desconocida: {op}")
+
+    async def handle_line(self, line):
+        """Procesa una línea NDJSON; mismas respuestas de error que ml_worker.handle_line"""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return dict(_error_response(f"JSON inválido: {e}"), id=None)
+        if not isinstance(request, dict):
+            return dict(_error_response("La solicitud debe ser un objeto JSON"), id=None)
+        try:
+            response = await self.handle(request)
+        except Exception as e:
+            response = _error_response(str(e))
+        response['id'] = request.get('id')
+        return response
+
+    async def serve_lines(self, readline, write):
+        """Lee solicitudes con `readline` y escribe cada respuesta en cuanto termina"""
+        pending = set()
+
+        async def respond(line):
+            await write(json.dumps(await self.handle_line(line)) + '\n')
+
+        while True:
+            line = await readline()
+            if not line:
+                break
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            task = asyncio.create_task(respond(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+async def serve_stdio(server):
+    """NDJSON por stdin/stdout (modo usado por lib/python-worker.ts)"""
+    loop = asyncio.get_running_loop()
+
+    async def readline():
+        return await loop.run_in_executor(None, sys.stdin.readline)
+
+    async def write(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    await server.serve_lines(readline, write)
+
+
+async def serve_tcp(server, host, port):
+    """NDJSON sobre TCP: cada conexión puede enviar muchas solicitudes concurrentes"""
+
+    async def client_connected(reader, writer):
+        async def write(text):
+            writer.write(text.encode('utf-8'))
+            await writer.drain()
+
+        try:
+            await server.serve_lines(reader.readline, write)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    tcp_server = await asyncio.start_server(client_connected, host, port)
+    print(f"Servidor de chatbot escuchando en {host}:{port}", file=sys.stderr)
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    frontend = parser.add_mutually_exclusive_group(required=True)
+    frontend.add_argument('--serve', action='store_true', help='NDJSON por stdin/stdout')
+    frontend.add_argument('--tcp', metavar='[HOST:]PORT', help='NDJSON sobre TCP')
+    parser.add_argument('--shards', type=int)
+    parser.add_argument('--mode', choices=['thread', 'process'])
+    parser.add_argument('--max-pending', type=int)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--metrics-port', type=int, help='expone GET /metrics en este puerto')
+    args = parser.parse_args()
+
+    server = ChatbotServer(args.shards, args.mode, args.max_pending, args.timeout)
+
+    async def run():
+        if args.metrics_port:
+            loop = asyncio.get_running_loop()
+            # El endpoint corre en otro hilo: las métricas se reúnen en el bucle de eventos
+            start_metrics_server(args.metrics_port, render=lambda: asyncio.run_coroutine_threadsafe(
+                server.render_metrics(), loop).result(server.timeout))
+        if args.serve:
+            await serve_stdio(server)
+        else:
+            host, _, port = args.tcp.rpartition(':')
+            await serve_tcp(server, host or '127.0.0.1', int(port))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
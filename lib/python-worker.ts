@@ -0,0 +1,111 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process"
+import readline from "readline"
+
+// Proceso Python residente que atiende solicitudes JSON delimitadas por líneas.
+// Mantiene los modelos cargados entre solicitudes en lugar de lanzar un proceso por cada una.
+type PendingRequest = {
+  resolve: (value: any) => void
+  reject: (error: Error) => void
+  timer: NodeJS.Timeout
+}
+
+export class PythonWorker {
+  private child: ChildProcessWithoutNullStreams | null = null
+  private pending = new Map<number, PendingRequest>()
+  private nextId = 1
+
+  constructor(
+    private command: string,
+    private args: string[],
+    private timeoutMs = 15000,
+  ) {}
+
+  private start(): ChildProcessWithoutNullStreams {
+    const child = spawn(this.command, this.args, { stdio: ["pipe", "pipe", "pipe"] })
+
+    readline.createInterface({ input: child.stdout }).on("line", (line) => {
+      let message: any
+      try {
+        message = JSON.parse(line)
+      } catch (error) {
+        console.error("Respuesta no válida del proceso Python:", line)
+        return
+      }
+      const pending = this.pending.get(message.id)
+      if (!pending) return
+      clearTimeout(pending.timer)
+      this.pending.delete(message.id)
+      pending.resolve(message)
+    })
+
+    child.stderr.on("data", (data) => {
+      console.error(`Python Error: ${data}`)
+    })
+
+    child.on("exit", (code) => {
+      console.error(`Python worker exited with code ${code}`)
+      this.fail(child, new Error(`El proceso Python terminó (código ${code})`))
+    })
+
+    // Fallo al lanzar el proceso (p. ej. comando inexistente) o canal roto
+    child.on("error", (error) => {
+      console.error("Error executing Python worker:", error)
+      this.fail(child, error)
+    })
+    child.stdin.on("error", (error) => {
+      console.error("Error escribiendo al proceso Python:", error)
+      this.fail(child, error)
+    })
+
+    return child
+  }
+
+  // Descarta el proceso (la próxima solicitud lanza uno nuevo) y rechaza las solicitudes en curso,
+  // que ya no recibirán respuesta
+  private fail(child: ChildProcessWithoutNullStreams, error: Error) {
+    if (this.child !== child) return
+    this.child = null
+    child.kill()
+    this.pending.forEach((pending) => {
+      clearTimeout(pending.timer)
+      pending.reject(error)
+    })
+    this.pending.clear()
+  }
+
+  // timeoutMs permite a una solicitud opcional (p. ej. una consulta de caché) esperar menos que el resto
+  request(payload: Record<string, any>, timeoutMs = this.timeoutMs): Promise<any> {
+    if (!this.child) {
+      this.child = this.start()
+    }
+
+    const child = this.child
+    const id = this.nextId++
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id)
+        resolve({ id, status: "error", message: "Tiempo de espera agotado" })
+      }, timeoutMs)
+
+      this.pending.set(id, { resolve, reject, timer })
+      child.stdin.write(JSON.stringify({ ...payload, id }) + "\n", (error) => {
+        if (error) this.fail(child, error)
+      })
+    })
+  }
+}
+
+// Un único proceso por script, compartido entre solicitudes (y entre recargas en desarrollo)
+const globalForWorkers = globalThis as unknown as { pythonWorkers?: Map<string, PythonWorker> }
+const workers = globalForWorkers.pythonWorkers ?? new Map<string, PythonWorker>()
+globalForWorkers.pythonWorkers = workers
+
+export const getPythonWorker = (command: string, args: string[]): PythonWorker => {
+  const key = [command, ...args].join(" ")
+  let worker = workers.get(key)
+  if (!worker) {
+    worker = new PythonWorker(command, args)
+    workers.set(key, worker)
+  }
+  return worker
+}
@@ -0,0 +1,20 @@
+-- Agregado de calificaciones por abogado (suma y cantidad de votos), que
+-- ml_rating_store.py actualiza con upserts agrupados en lugar de un UPDATE
+-- de lawyers por voto. lawyers.rating guarda la media redondeada.
+
+CREATE TABLE IF NOT EXISTS public.lawyer_rating_aggregates (
+  lawyer_id UUID REFERENCES public.lawyers(id) ON DELETE CASCADE PRIMARY KEY,
+  rating_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  rating_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- El historial de votos anterior se perdió en la media móvil: la calificación
+-- actual de cada abogado cuenta como un voto
+INSERT INTO public.lawyer_rating_aggregates (lawyer_id, rating_sum, rating_count)
+SELECT id, rating, 1
+FROM public.lawyers
+WHERE rating IS NOT NULL
+ON CONFLICT (lawyer_id) DO NOTHING;
+
+ALTER TABLE public.lawyer_rating_aggregates ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,21 @@
+-- Columnas updated_at para detectar cambios desde los scripts de ML
+-- (instantáneas compartidas y sincronización incremental)
+
+ALTER TABLE public.lawyers
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
+-- Mantener updated_at al día en cada modificación
+CREATE OR REPLACE FUNCTION public.set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = CURRENT_TIMESTAMP;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS lawyers_set_updated_at ON public.lawyers;
+CREATE TRIGGER lawyers_set_updated_at
+  BEFORE UPDATE ON public.lawyers
+  FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+
+CREATE INDEX IF NOT EXISTS lawyers_updated_at_idx ON public.lawyers (updated_at);
@@ -0,0 +1,77 @@
+"""
+Benchmark de concurrencia de chatbot_server.ChatbotServer.
+
+Simula muchas sesiones simultáneas; cada una envía sus mensajes en orden
+(espera la respuesta antes de enviar el siguiente). Verifica que ninguna
+respuesta se pierda y, en modo "thread", que el historial de cada sesión
+contenga sus mensajes en el orden enviado.
+
+Uso:
+    python scripts/bench_chatbot_server.py --sessions 500 --messages 10 --shards 4 --mode thread
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot_server import ChatbotServer
+from ml_synthetic import make_cases
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    server = ChatbotServer(args.shards, args.mode, max_pending=args.sessions * 2, timeout=args.timeout,
+                           max_sessions=args.sessions)
+    messages = make_cases(args.messages)
+    latencies = []
+    failures = []
+
+    async def session(session_id):
+        for i, message in enumerate(messages):
+            start = time.perf_counter()
+            response = await server.process_message(f"{message} #{i}", session_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response['status'] != 'success':
+                failures.append(response['message'])
+
+    # Calentar los fragmentos (arranque de procesos en modo "process")
+    await asyncio.gather(*(server.process_message("hola", f"warmup-{i}") for i in range(args.shards * 4)))
+    start = time.perf_counter()
+    await asyncio.gather(*(session(f"sesion-{i}") for i in range(args.sessions)))
+    elapsed = time.perf_counter() - start
+
+    if args.mode == 'thread':
+        for i in range(args.sessions):
+            session_id = f"sesion-{i}"
+            history = [entry.user_message for entry in server.shard_for(session_id).chatbot.sessions[session_id].history]
+            assert history == [f"{message} #{j}" for j, message in enumerate(messages)], session_id
+    stats = await server.snapshot_stats()
+    server.close()
+
+    total = args.sessions * args.messages
+    print(f"modo={args.mode} fragmentos={args.shards} sesiones={args.sessions} mensajes={total}")
+    print(f"  rendimiento: {total / elapsed:,.0f} mensajes/s ({elapsed:.2f} s)")
+    print(f"  latencia p50={percentile(latencies, 0.5):.2f} ms p99={percentile(latencies, 0.99):.2f} ms")
+    print(f"  fallos={len(failures)} completados={stats['completed']} sesiones activas={stats['sessions']}")
+    assert not failures, failures[:3]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=10)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--timeout', type=float, default=30)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Microbenchmark y verificación de equivalencia de la base de conocimiento compilada.
+
+Compara cargar el JSON como diccionario y construir chatbot_ml.KeywordIndex
+en cada proceso con abrir el artefacto compilado (memoria mapeada) de
+ml_knowledge_base: tiempo de arranque, memoria Python asignada por el
+proceso (tracemalloc; las páginas mapeadas se comparten y no cuentan) y
+latencia de find_best_topic.
+
+Uso:
+    python scripts/bench_knowledge_base.py --sizes 1000 10000 --queries 2000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot_ml import KeywordIndex
+from ml_knowledge_base import KnowledgeBaseStore
+from ml_synthetic import make_cases, make_knowledge_base
+from ml_text import tokenize
+
+
+def measure(load):
+    """Tiempo (ms) y memoria Python retenida (MiB) de una carga"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = (time.perf_counter() - start) * 1000
+    retained = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    tracemalloc.stop()
+    return result, elapsed, retained
+
+
+def make_messages(knowledge_base, count, seed=7):
+    """Mensajes con palabras clave de la base mezcladas con texto de casos"""
+    rng = random.Random(seed)
+    keywords = [tk for data in knowledge_base.values() for tk in data['keywords']]
+    cases = make_cases(count, seed)
+    return [f"{case} {' '.join(rng.sample(keywords, rng.randint(0, 3)))}" for case in cases]
+
+
+def timed(index, messages):
+    start = time.perf_counter()
+    for message in messages:
+        index.best_topic(list(tokenize(message, min_length=3)))
+    return (time.perf_counter() - start) * 1000 / len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'temas':>8} {'carga dict (ms)':>16} {'MiB dict':>9} {'carga mmap (ms)':>16} {'MiB mmap':>9} "
+          f"{'consulta dict (ms)':>19} {'consulta mmap (ms)':>19}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            source = os.path.join(workdir, 'knowledge.json')
+            with open(source, 'w', encoding='utf-8') as handle:
+                json.dump(make_knowledge_base(size), handle, ensure_ascii=False)
+            artifact_dir = os.path.join(workdir, 'compiled')
+            # Compilación única (fuera de la medición, como en producción)
+            KnowledgeBaseStore(source, artifact_dir).get()
+
+            def load_dict():
+                with open(source, encoding='utf-8') as handle:
+                    knowledge_base = json.load(handle)
+                return knowledge_base, KeywordIndex(knowledge_base)
+
+            def load_compiled():
+                knowledge_base = KnowledgeBaseStore(source, artifact_dir).get()
+                return knowledge_base, knowledge_base.keyword_index
+
+            (knowledge_base, dict_index), dict_ms, dict_mib = measure(load_dict)
+            (_, compiled_index), mmap_ms, mmap_mib = measure(load_compiled)
+
+            # Verificación de equivalencia antes de medir
+            messages = make_messages(knowledge_base, args.queries)
+            for message in messages:
+                keywords = list(tokenize(message, min_length=3))
+                expected, actual = dict_index.best_topic(keywords), compiled_index.best_topic(keywords)
+                assert expected == actual, (message, expected, actual)
+
+            dict_query = timed(dict_index, messages)
+            compiled_index._matches.clear()
+            mmap_query = timed(compiled_index, messages)
+            print(f"{size:>8} {dict_ms:>16.1f} {dict_mib:>9.1f} {mmap_ms:>16.1f} {mmap_mib:>9.2f} "
+                  f"{dict_query:>19.4f} {mmap_query:>19.4f}")
+
+
+if __name__ == '__main__':
+    main()
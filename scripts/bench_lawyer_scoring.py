@@ -0,0 +1,122 @@
+"""
+Microbenchmark y verificación de equivalencia del motor de puntuación de abogados.
+
+Compara recommend_lawyers (LawyerScoringEngine: arreglos NumPy, argpartition)
+con la implementación anterior basada en copias de DataFrame, sort_values e
+iterrows, sobre rosters sintéticos de distintos tamaños.
+
+Uso:
+    python scripts/bench_lawyer_scoring.py --sizes 1000 10000 100000 --queries 50
+"""
+import argparse
+import time
+
+from sklearn.metrics.pairwise import cosine_similarity
+
+from ml_lawyer_recommender import LawyerRecommender
+from ml_scoring import DEFAULT_WEIGHTS
+from ml_synthetic import make_cases, make_lawyers
+
+PREFERENCES = [None, {'preferred_experience': 10, 'preferred_rating': 4.5}]
+
+
+def legacy_recommend_lawyers(recommender, case_description, user_preferences=None, top_n=3):
+    """Implementación anterior de recommend_lawyers, usada como referencia"""
+    case_vector = recommender.get_case_vector(case_description)
+    similarities = cosine_similarity(case_vector, recommender.specialty_vectors).flatten()
+
+    recommendations_df = recommender.lawyers_df.copy()
+    recommendations_df['similarity'] = similarities
+    recommendations_df = recommendations_df[recommendations_df['available'] == True]
+    recommendations_df['score'] = (
+        0.5 * recommendations_df['similarity'] +
+        0.3 * recommendations_df['normalized_rating'] +
+        0.2 * recommendations_df['normalized_experience']
+    )
+
+    if user_preferences:
+        if 'preferred_experience' in user_preferences and user_preferences['preferred_experience'] > 0:
+            recommendations_df = recommendations_df[
+                recommendations_df['experience_years'] >= user_preferences['preferred_experience']]
+        if 'preferred_rating' in user_preferences and user_preferences['preferred_rating'] > 0:
+            recommendations_df = recommendations_df[
+                recommendations_df['rating'] >= user_preferences['preferred_rating']]
+
+    recommendations_df = recommendations_df.sort_values('score', ascending=False).head(top_n)
+
+    recommendations = []
+    for _, row in recommendations_df.iterrows():
+        recommendations.append({
+            'id': str(row['id']),
+            'full_name': row['full_name'],
+            'specialty': row['specialty'],
+            'experience_years': int(row['experience_years']),
+            'rating': float(row['rating']),
+            'similarity_score': float(row['similarity']),
+            'overall_score': float(row['score']),
+            'avatar_url': row.get('avatar_url')
+        })
+    return recommendations
+
+
+def check_equivalent(expected, actual, tolerance=1e-9):
+    """
+    Verifica que ambos resultados tengan el mismo esquema y los mismos puntajes.
+    Los empates pueden aparecer en distinto orden (sort_values no es estable),
+    así que los ids se comparan por grupo de puntaje.
+    """
+    if len(expected) != len(actual):
+        raise AssertionError(f"Longitudes distintas: {len(expected)} != {len(actual)}")
+    for old, new in zip(expected, actual):
+        if set(old) != set(new):
+            raise AssertionError(f"Esquemas distintos: {sorted(old)} != {sorted(new)}")
+        if abs(old['overall_score'] - new['overall_score']) > tolerance:
+            raise AssertionError(f"Puntajes distintos: {old} != {new}")
+
+    def ids_by_score(results):
+        groups = {}
+        for rec in results:
+            groups.setdefault(round(rec['overall_score'], 9), set()).add(rec['id'])
+        return groups
+
+    old_groups, new_groups = ids_by_score(expected), ids_by_score(actual)
+    # El último grupo puede estar truncado por top_n: basta con que coincidan los demás
+    last_score = round(expected[-1]['overall_score'], 9) if expected else None
+    for score, ids in old_groups.items():
+        if score != last_score and ids != new_groups.get(score):
+            raise AssertionError(f"Abogados distintos con puntaje {score}: {ids} != {new_groups.get(score)}")
+
+
+def timed(function, cases):
+    start = time.perf_counter()
+    for i, case in enumerate(cases):
+        function(case, PREFERENCES[i % len(PREFERENCES)])
+    return (time.perf_counter() - start) / len(cases) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-n', type=int, default=3)
+    args = parser.parse_args()
+
+    cases = make_cases(args.queries)
+    print(f"{'abogados':>10} {'anterior (ms)':>14} {'motor (ms)':>11} {'aceleración':>12}")
+    for size in args.sizes:
+        # Pesos por defecto: la referencia usa 0.5/0.3/0.2 aunque exista un weights.json entrenado
+        recommender = LawyerRecommender(lawyers_df=make_lawyers(size), ranking_weights=DEFAULT_WEIGHTS)
+
+        # Verificación de equivalencia antes de medir
+        for i, case in enumerate(cases):
+            preferences = PREFERENCES[i % len(PREFERENCES)]
+            check_equivalent(legacy_recommend_lawyers(recommender, case, preferences, args.top_n),
+                             recommender.recommend_lawyers(case, preferences, args.top_n))
+
+        legacy_ms = timed(lambda case, prefs: legacy_recommend_lawyers(recommender, case, prefs, args.top_n), cases)
+        engine_ms = timed(lambda case, prefs: recommender.recommend_lawyers(case, prefs, args.top_n), cases)
+        print(f"{size:>10} {legacy_ms:>14.3f} {engine_ms:>11.3f} {legacy_ms / engine_ms:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark del recomendador de preguntas con historiales grandes: la
+agrupación anterior con pandas (DataFrame + fillna/str.strip + iterrows)
+frente a group_by_category, en pasada lineal sobre los diccionarios.
+
+Se mide la agrupación sola y la solicitud completa (recommend_questions
+con una caché de modelos vacía en cada repetición, es decir, ajustando
+los modelos TF-IDF), y se verifica que ambas versiones devuelvan
+exactamente la misma respuesta.
+
+Uso:
+    python scripts/bench_question_history.py [--sizes 10 1000 50000] [--repeats 5]
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+import ml_question_recommender
+from ml_question_cache import TfidfModelCache
+from ml_question_recommender import group_by_category, recommend_questions
+from ml_synthetic import make_question_history
+
+
+def legacy_group(user_history):
+    """Agrupación anterior, con pandas"""
+    df = pd.DataFrame(user_history)
+    df['category'] = df['category'].fillna('general')
+    df['question'] = df['question'].str.strip()
+    category_questions = defaultdict(list)
+    for _, row in df.iterrows():
+        category_questions[row['category']].append(row['question'])
+    return category_questions
+
+
+def legacy_recommend(user_history):
+    """recommend_questions anterior (agrupación con pandas, mismo cálculo de similitud)"""
+    if not user_history:
+        return {'status': 'success', 'recommendations': []}
+    category_questions = legacy_group(user_history)
+    model_cache = ml_question_recommender.get_model_cache()
+    recommendations = []
+    for category, questions in category_questions.items():
+        if len(questions) >= 2:
+            tfidf = model_cache.get_matrix(questions)
+            similarities = cosine_similarity(tfidf[-1:], tfidf[:-1])
+            top_indices = similarities.argsort()[0][-2:][::-1]
+            for idx in top_indices:
+                recommendations.append({
+                    'question': questions[idx],
+                    'category': category,
+                    'similarity': float(similarities[0][idx])
+                })
+    recommendations.sort(key=lambda x: x['similarity'], reverse=True)
+    return {'status': 'success', 'recommendations': recommendations[:3]}
+
+
+def best_time(function, history, repeats, fresh_cache=False):
+    """Mejor tiempo (ms) y resultado de la última repetición"""
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        if fresh_cache:
+            # Sin memoria de solicitudes anteriores ni disco: se ajustan los modelos
+            ml_question_recommender._model_cache = TfidfModelCache(cache_dir='')
+        start = time.perf_counter()
+        result = function(history)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'preguntas':>10} {'agrupar pandas':>15} {'agrupar nuevo':>14} {'x':>6} "
+          f"{'solicitud pandas':>17} {'solicitud nueva':>16} {'x':>6}")
+    for size in args.sizes:
+        history = make_question_history(size, seed=size)
+        # Algunas filas sin categoría y con espacios, como llegan desde la API
+        for i in range(0, size, 7):
+            history[i] = {'question': f"  {history[i]['question']}  ", 'category': None}
+
+        legacy_group_ms, legacy_groups = best_time(legacy_group, history, args.repeats)
+        group_ms, groups = best_time(group_by_category, history, args.repeats)
+        if dict(legacy_groups) != dict(groups) or list(legacy_groups) != list(groups):
+            print(f"DIFERENCIA en la agrupación con {size} preguntas", file=sys.stderr)
+            sys.exit(1)
+
+        legacy_ms, legacy_result = best_time(legacy_recommend, history, args.repeats, fresh_cache=True)
+        new_ms, result = best_time(recommend_questions, history, args.repeats, fresh_cache=True)
+        if json.dumps(legacy_result) != json.dumps(result):
+            print(f"DIFERENCIA en las recomendaciones con {size} preguntas", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"{size:>10} {legacy_group_ms:>13.2f}ms {group_ms:>12.2f}ms {legacy_group_ms / group_ms:>5.1f}x "
+              f"{legacy_ms:>15.2f}ms {new_ms:>14.2f}ms {legacy_ms / new_ms:>5.1f}x")
+    print("Resultados idénticos en todos los tamaños")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark del recomendador de preguntas: un proceso por solicitud frente
+al modo residente (--serve), con uno o varios workers.
+
+Uso:
+    python scripts/bench_question_recommender.py --requests 50 --history 10 --workers 1 4
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_question_recommender.py')
+
+CATEGORIES = ['pensiones', 'laboral', 'herencias', 'accesibilidad', 'general']
+WORDS = ['pensión', 'invalidez', 'trabajo', 'despido', 'adaptaciones', 'testamento', 'herencia',
+         'rampa', 'edificio', 'certificado', 'discapacidad', 'derechos', 'solicitud', 'rechazada',
+         'empleador', 'patrimonio', 'transporte', 'barreras', 'calificación', 'fondo']
+
+
+def make_history(size, rng):
+    """Genera un historial sintético de preguntas"""
+    return [
+        {
+            'question': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))),
+            'category': rng.choice(CATEGORIES)
+        }
+        for _ in range(size)
+    ]
+
+
+def bench_spawn(payloads):
+    """Lanza un proceso de Python por solicitud, como hacía la ruta del chatbot"""
+    start = time.perf_counter()
+    for payload in payloads:
+        subprocess.run([sys.executable, SCRIPT_PATH, json.dumps(payload)],
+                       check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def bench_serve(payloads, workers):
+    """Envía todas las solicitudes a un único proceso residente y espera todas las respuestas"""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SCRIPT_PATH, '--serve', '--workers', str(workers)],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    # Se escribe todo por adelantado: las respuestas se multiplexan por id
+    for request_id, payload in enumerate(payloads):
+        process.stdin.write(json.dumps(dict(payload, id=request_id)) + '\n')
+    process.stdin.close()
+
+    received = set()
+    for line in process.stdout:
+        received.add(json.loads(line)['id'])
+    process.wait()
+    elapsed = time.perf_counter() - start
+
+    if len(received) != len(payloads):
+        raise RuntimeError(f"Se esperaban {len(payloads)} respuestas, llegaron {len(received)}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--history', type=int, default=10, help='preguntas por historial')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = [{'user_history': make_history(args.history, rng)} for _ in range(args.requests)]
+
+    print(f"{args.requests} solicitudes, {args.history} preguntas por historial")
+    elapsed = bench_spawn(payloads)
+    print(f"spawn por solicitud: {args.requests / elapsed:8.1f} req/s ({elapsed:.2f}s)")
+    # El modo residente incluye su propio arranque en el tiempo medido
+    for workers in args.workers:
+        elapsed = bench_serve(payloads, workers)
+        print(f"--serve --workers {workers}: {args.requests / elapsed:8.1f} req/s ({elapsed:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark de una ráfaga de calificaciones intercalada con recomendaciones.
+
+Compara la actualización en su lugar del motor (LawyerScoringEngine.update_value,
+usada al registrar votos con RatingStore) con la relectura completa de las
+columnas numéricas que se hacía antes con cada cambio de calificación, y
+verifica que ambas produzcan las mismas recomendaciones.
+
+Los votos se acumulan en memoria (sin volcarlos a la base de datos).
+
+Uso:
+    python scripts/bench_rating_updates.py --sizes 10000 100000 --votes 2000
+"""
+import argparse
+import random
+import time
+
+from ml_lawyer_recommender import LawyerRecommender
+from ml_rating_store import RatingStore
+from ml_synthetic import make_cases, make_lawyers
+
+PREFERENCES = [None, {'preferred_experience': 10, 'preferred_rating': 4.5}]
+
+
+def burst(recommender, votes, cases, full_reread):
+    """Aplica los votos con una recomendación cada `len(votes) // len(cases)` votos"""
+    store = RatingStore()
+    # Sin base de datos: se parte de agregados vacíos
+    store.loaded = True
+    every = max(1, len(votes) // len(cases))
+    results = []
+    start = time.perf_counter()
+    for i, (lawyer_id, rating) in enumerate(votes):
+        recommender.update_lawyer_rating(lawyer_id, rating, rating_store=store)
+        if full_reread:
+            # Comportamiento anterior: cada cambio obligaba a releer todas las columnas
+            recommender._engine_features_stale = True
+        if i % every == 0:
+            case = cases[(i // every) % len(cases)]
+            results.append(recommender.recommend_lawyers(case, PREFERENCES[i % 2], 5))
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--votes', type=int, default=2000)
+    parser.add_argument('--cases', type=int, default=200)
+    args = parser.parse_args()
+
+    cases = make_cases(args.cases)
+    print(f"{'abogados':>9} {'relectura (ms)':>15} {'en su lugar (ms)':>17} {'aceleración':>12}")
+    for size in args.sizes:
+        rng = random.Random(size)
+        lawyers = make_lawyers(size)
+        # Votos concentrados en pocos abogados, como al terminar una tanda de sesiones
+        voted = rng.sample(list(lawyers['id']), min(size, 200))
+        votes = [(rng.choice(voted), rng.choice([1, 2, 3, 4, 5, 5, 5])) for _ in range(args.votes)]
+
+        timings = []
+        outputs = []
+        for full_reread in (True, False):
+            recommender = LawyerRecommender(lawyers_df=lawyers.copy())
+            recommender.recommend_lawyers(cases[0])
+            seconds, results = burst(recommender, votes, cases, full_reread)
+            timings.append(seconds)
+            outputs.append(results)
+            recommender.close()
+        if outputs[0] != outputs[1]:
+            raise AssertionError(f"Recomendaciones distintas con {size} abogados")
+        print(f"{size:>9} {timings[0] * 1000:>15.1f} {timings[1] * 1000:>17.1f} {timings[0] / timings[1]:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
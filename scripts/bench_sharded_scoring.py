@@ -0,0 +1,89 @@
+"""
+Benchmark de escalado de la puntuación repartida entre procesos
+(ml_sharded_scoring) frente al motor de un solo proceso.
+
+Para cada tamaño de roster y número de procesos mide la latencia de una
+solicitud (p50) y el rendimiento en modo batch, y verifica que las
+recomendaciones sean idénticas a las del motor de un solo proceso, también
+después de cambiar disponibilidad y calificaciones.
+
+Uso:
+    python scripts/bench_sharded_scoring.py --sizes 100000 500000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+from ml_lawyer_recommender import LawyerRecommender
+from ml_synthetic import make_cases, make_lawyers
+
+PREFERENCES = [None, {'preferred_experience': 10, 'preferred_rating': 4.5}]
+
+
+def run(recommender, cases, top_n):
+    """Latencias (ms) de solicitudes sueltas, segundos del batch y todos los resultados"""
+    latencies = []
+    single = []
+    for i, case in enumerate(cases):
+        start = time.perf_counter()
+        single.append(recommender.recommend_lawyers(case, PREFERENCES[i % 2], top_n))
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    batch = recommender.recommend_lawyers_batch(cases, [PREFERENCES[i % 2] for i in range(len(cases))], top_n)
+    batch_seconds = time.perf_counter() - start
+    latencies.sort()
+    return latencies[len(latencies) // 2], batch_seconds, (single, batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 500000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--cases', type=int, default=200)
+    parser.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"CPU disponibles: {os.cpu_count()}")
+    print(f"{'abogados':>9} {'procesos':>9} {'p50 (ms)':>9} {'batch (casos/s)':>16} {'x batch':>8}")
+    for size in args.sizes:
+        recommender = LawyerRecommender(lawyers_df=make_lawyers(size))
+        cases = make_cases(args.cases)
+        # Cambios posteriores a la construcción: deben llegar a la memoria compartida
+        ids = list(recommender.lawyers_df['id'][:50])
+        try:
+            recommender.scoring_workers = 0
+            p50, batch_seconds, expected = run(recommender, cases, args.top_n)
+            baseline = batch_seconds
+            print(f"{size:>9} {'1 (sin)':>9} {p50:>9.2f} {len(cases) / batch_seconds:>16.1f} {1.0:>7.2f}x")
+            for workers in args.workers:
+                recommender.scoring_workers = workers
+                start = time.perf_counter()
+                recommender.get_sharded_scorer()
+                setup = time.perf_counter() - start
+                p50, batch_seconds, results = run(recommender, cases, args.top_n)
+                if results != expected:
+                    print(f"DIFERENCIA con {workers} procesos y {size} abogados", file=sys.stderr)
+                    sys.exit(1)
+                print(f"{size:>9} {workers:>9} {p50:>9.2f} {len(cases) / batch_seconds:>16.1f} "
+                      f"{baseline / batch_seconds:>7.2f}x  (preparación {setup:.2f} s)")
+
+            # Equivalencia tras actualizar columnas numéricas
+            for lawyer_id in ids[:25]:
+                recommender.set_availability(lawyer_id, False)
+            for lawyer_id in ids[25:]:
+                recommender.update_rating(lawyer_id, 1.0)
+            recommender.scoring_workers = 0
+            _, _, expected = run(recommender, cases[:20], args.top_n)
+            recommender.scoring_workers = args.workers[-1]
+            _, _, results = run(recommender, cases[:20], args.top_n)
+            if results != expected:
+                print(f"DIFERENCIA tras actualizar abogados ({size})", file=sys.stderr)
+                sys.exit(1)
+        finally:
+            recommender.close()
+    print("Resultados idénticos al motor de un solo proceso")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Suite de benchmarks de los tres puntos de entrada de ML, sin base de datos.
+
+Puntos de entrada medidos:
+- chatbot:   LegalAIChatbot.process_message (bases de conocimiento sintéticas)
+- lawyers:   LawyerRecommender.recommend_lawyers (rosters sintéticos)
+- questions: ml_question_recommender (recommend_questions, historiales sintéticos)
+
+Por cada punto de entrada y tamaño se ejecuta un proceso nuevo que mide
+latencia (p50/p90/p99), rendimiento y RSS máximo del proceso. El arranque
+en frío se mide como el tiempo total de un proceso que importa, carga los
+datos de ejemplo de respaldo (sin base de datos) y responde una consulta.
+
+Los resultados se escriben en JSON (con commit, versión de Python y CPU)
+para comparar entre commits; con --baseline se comparan contra una
+ejecución anterior y el código de salida es 1 si hay regresiones.
+
+Uso:
+    python scripts/bench_suite.py --output bench.json
+    python scripts/bench_suite.py --quick --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+
+DEFAULT_SIZES = {
+    'chatbot': [1000, 10000],
+    'lawyers': [1000, 10000, 100000],
+    'questions': [10, 100, 1000],
+}
+QUICK_SIZES = {
+    'chatbot': [100],
+    'lawyers': [1000],
+    'questions': [10, 100],
+}
+
+# Entorno de los procesos hijos: la conexión a la base falla al instante y se usan los datos de ejemplo
+OFFLINE_ENV = {'DB_HOST': '127.0.0.1', 'DB_PORT': '1', 'QUESTION_MODEL_CACHE_DIR': ''}
+
+COLD_START_COMMANDS = {
+    'chatbot': [sys.executable, '-c',
+                "from chatbot_ml import LegalAIChatbot; "
+                "LegalAIChatbot().process_message('¿Cómo solicito pensión por invalidez?')"],
+    'lawyers': [sys.executable, os.path.join(SCRIPTS_DIR, 'ml_lawyer_recommender.py'),
+                json.dumps({'case_description': 'Discriminación laboral por discapacidad motriz'})],
+    'questions': [sys.executable, os.path.join(SCRIPTS_DIR, 'ml_question_recommender.py'), '-'],
+}
+COLD_START_INPUT = {
+    'questions': json.dumps({'user_history': [
+        {'question': '¿Cómo solicito la pensión por invalidez?', 'category': 'pensiones'},
+        {'question': '¿Qué requisitos tiene la pensión de invalidez?', 'category': 'pensiones'},
+        {'question': '¿Qué documentos necesito para la pensión?', 'category': 'pensiones'},
+    ]})
+}
+
+
+def setup_chatbot(size, workdir):
+    sys.path.insert(0, REPO_ROOT)
+    from chatbot_ml import LegalAIChatbot
+    from ml_knowledge_base import KnowledgeBaseStore
+    from ml_synthetic import make_cases, make_knowledge_base
+
+    knowledge_base = make_knowledge_base(size)
+    source = os.path.join(workdir, 'knowledge.json')
+    with open(source, 'w', encoding='utf-8') as handle:
+        json.dump(knowledge_base, handle, ensure_ascii=False)
+    chatbot = LegalAIChatbot(knowledge_store=KnowledgeBaseStore(source, os.path.join(workdir, 'kb')))
+
+    keywords = [tk for data in knowledge_base.values() for tk in data['keywords']]
+    messages = [f"{case} {keywords[i * 7919 % len(keywords)]}" for i, case in enumerate(make_cases(1000))]
+    return lambda i: chatbot.process_message(messages[i % len(messages)], f"sesion-{i % 100}")
+
+
+def setup_lawyers(size, workdir):
+    from ml_lawyer_recommender import LawyerRecommender
+    from ml_synthetic import make_cases, make_lawyers
+
+    recommender = LawyerRecommender(lawyers_df=make_lawyers(size))
+    cases = make_cases(1000)
+    preferences = [None, {'preferred_experience': 10, 'preferred_rating': 4.5}]
+    return lambda i: recommender.recommend_lawyers(cases[i % len(cases)], preferences[i % 2])
+
+
+def setup_questions(size, workdir):
+    from ml_question_recommender import recommend_questions
+    from ml_synthetic import make_question_history
+
+    # Ventana deslizante: cada solicitud tiene un historial distinto (como usuarios distintos)
+    pool = make_question_history(size + 1000)
+    return lambda i: recommend_questions(pool[i % 1000:i % 1000 + size])
+
+
+SCENARIOS = {'chatbot': setup_chatbot, 'lawyers': setup_lawyers, 'questions': setup_questions}
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_scenario(entry, size, iterations, warmup):
+    """Ejecuta un escenario en este proceso y devuelve sus métricas"""
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        call = SCENARIOS[entry](size, workdir)
+        setup_ms = (time.perf_counter() - start) * 1000
+
+        for i in range(warmup):
+            call(i)
+        latencies = []
+        total_start = time.perf_counter()
+        for i in range(warmup, warmup + iterations):
+            start = time.perf_counter()
+            call(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+        total = time.perf_counter() - total_start
+
+    latencies.sort()
+    return {
+        'entry': entry,
+        'size': size,
+        'iterations': iterations,
+        'setup_ms': setup_ms,
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p90_ms': percentile(latencies, 0.90),
+        'p99_ms': percentile(latencies, 0.99),
+        'throughput_per_s': iterations / total,
+        # ru_maxrss está en KiB en Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def child_env():
+    env = dict(os.environ, **OFFLINE_ENV)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SCRIPTS_DIR, REPO_ROOT, env.get('PYTHONPATH')]))
+    return env
+
+
+def measure_scenario(entry, size, iterations, warmup):
+    """Ejecuta el escenario en un proceso nuevo (RSS máximo aislado)"""
+    completed = subprocess.run(
+        [sys.executable, __file__, '--scenario', entry, '--size', str(size),
+         '--iterations', str(iterations), '--warmup', str(warmup)],
+        capture_output=True, text=True, env=child_env(), check=True
+    )
+    return json.loads(completed.stdout)
+
+
+def measure_cold_start(entry, repeats):
+    """Mediana del tiempo total de un proceso que carga los datos de respaldo y responde una consulta"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(COLD_START_COMMANDS[entry], input=COLD_START_INPUT.get(entry, ''), capture_output=True,
+                       text=True, env=child_env(), cwd=REPO_ROOT, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {'entry': entry, 'repeats': repeats, 'cold_start_ms': samples[len(samples) // 2],
+            'min_ms': samples[0], 'max_ms': samples[-1]}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=REPO_ROOT,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Regresiones de p50 y rendimiento frente a una ejecución anterior"""
+    previous = {(item['entry'], item['size']): item for item in baseline.get('results', [])}
+    regressions = []
+    for item in results['results']:
+        old = previous.get((item['entry'], item['size']))
+        if old is None:
+            continue
+        if item['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{item['entry']}[{item['size']}] p50 {old['p50_ms']:.3f} -> {item['p50_ms']:.3f} ms")
+        if item['throughput_per_s'] < old['throughput_per_s'] / (1 + tolerance):
+            regressions.append(f"{item['entry']}[{item['size']}] rendimiento "
+                               f"{old['throughput_per_s']:.1f} -> {item['throughput_per_s']:.1f} /s")
+    old_cold = {item['entry']: item for item in baseline.get('cold_start', [])}
+    for item in results['cold_start']:
+        old = old_cold.get(item['entry'])
+        if old is not None and item['cold_start_ms'] > old['cold_start_ms'] * (1 + tolerance):
+            regressions.append(f"{item['entry']} arranque en frío "
+                               f"{old['cold_start_ms']:.0f} -> {item['cold_start_ms']:.0f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--quick', action='store_true', help='tamaños pequeños, para pruebas rápidas')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--cold-repeats', type=int, default=3)
+    parser.add_argument('--output', help='archivo JSON de resultados (por defecto stdout)')
+    parser.add_argument('--baseline', help='resultados anteriores con los que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    # Uso interno: ejecutar un solo escenario en este proceso
+    parser.add_argument('--scenario', choices=list(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.size, args.iterations, args.warmup)))
+        return
+
+    sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'iterations': args.iterations,
+        },
+        'results': [],
+        'cold_start': [],
+    }
+
+    print(f"{'entrada':>10} {'tamaño':>8} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'ops/s':>9} {'RSS (MiB)':>10}", file=sys.stderr)
+    for entry in args.entries:
+        for size in sizes[entry]:
+            item = measure_scenario(entry, size, args.iterations, args.warmup)
+            results['results'].append(item)
+            print(f"{entry:>10} {size:>8} {item['p50_ms']:>9.3f} {item['p90_ms']:>9.3f} {item['p99_ms']:>9.3f} "
+                  f"{item['throughput_per_s']:>9.1f} {item['peak_rss_mb']:>10.1f}", file=sys.stderr)
+    for entry in args.entries:
+        item = measure_cold_start(entry, args.cold_repeats)
+        results['cold_start'].append(item)
+        print(f"{entry:>10} arranque en frío {item['cold_start_ms']:.0f} ms", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESIÓN: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Empaqueta los scripts de ML en un zipapp con bytecode precompilado.
+
+El archivo contiene los módulos ml_*.py junto con su .pyc (hash sin
+verificar, así zipimport no compara fechas) y un __main__.py que despacha
+al punto de entrada indicado. En entornos donde __pycache__ no se puede
+escribir (contenedores de solo lectura, funciones serverless) cada
+proceso evita recompilar los módulos, y el despliegue es un solo archivo.
+
+Las dependencias (numpy, pandas, scikit-learn, psycopg2) no se incluyen:
+deben estar instaladas en el intérprete que ejecuta el zipapp.
+
+Uso:
+    python scripts/build_ml_zipapp.py [--output dist/ml_scripts.pyz]
+    python dist/ml_scripts.pyz lawyers '{"case_description": "..."}' --timing
+    python dist/ml_scripts.pyz questions --serve
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import py_compile
+import sys
+import tempfile
+import zipfile
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+
+# Nombre del punto de entrada -> módulo que se ejecuta como __main__
+ENTRY_POINTS = {
+    'lawyers': 'ml_lawyer_recommender',
+    'questions': 'ml_question_recommender',
+    'question-index': 'ml_question_index',
+}
+
+MAIN_TEMPLATE = '''\
+import runpy
+import sys
+
+ENTRY_POINTS = {entry_points!r}
+
+if len(sys.argv) < 2 or sys.argv[1] not in ENTRY_POINTS:
+    sys.stderr.write("Uso: %s {{{choices}}} [argumentos...]\\n" % sys.argv[0])
+    sys.exit(2)
+module = ENTRY_POINTS[sys.argv[1]]
+sys.argv = [module + '.py'] + sys.argv[2:]
+runpy.run_module(module, run_name='__main__', alter_sys=True)
+'''
+
+
+def build(output, interpreter):
+    """Escribe el zipapp en `output` y devuelve la lista de módulos incluidos"""
+    modules = sorted(os.path.basename(path) for path in glob.glob(os.path.join(SCRIPTS_DIR, 'ml_*.py')))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    main_source = MAIN_TEMPLATE.format(entry_points=ENTRY_POINTS, choices=','.join(ENTRY_POINTS))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(output, 'wb') as handle:
+            if interpreter:
+                handle.write(f"#!{interpreter}\n".encode('utf-8'))
+            with zipfile.ZipFile(handle, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('__main__.py', main_source)
+                for name in modules:
+                    source = os.path.join(SCRIPTS_DIR, name)
+                    compiled = os.path.join(workdir, name + 'c')
+                    # zipimport busca módulo.pyc junto a módulo.py (no en __pycache__)
+                    py_compile.compile(source, cfile=compiled, dfile=name, doraise=True,
+                                       invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+                    archive.write(source, name)
+                    archive.write(compiled, name + 'c')
+    os.chmod(output, 0o755)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=os.path.join(REPO_ROOT, 'dist', 'ml_scripts.pyz'))
+    parser.add_argument('--python', default='/usr/bin/env python3', help='intérprete del shebang ("" sin shebang)')
+    args = parser.parse_args()
+
+    modules = build(args.output, args.python)
+    print(f"{args.output}: {len(modules)} módulos, bytecode para Python "
+          f"{sys.version_info.major}.{sys.version_info.minor} (magic {importlib.util.MAGIC_NUMBER.hex()})",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Acceso compartido a la base de datos para los scripts de ML.
+
+- Un pool de conexiones por proceso (psycopg2 ThreadedConnectionPool), en
+  lugar de una conexión nueva por cada recomendador.
+- Instantáneas versionadas de los datos: una sola carga se comparte entre
+  todos los recomendadores e hilos del proceso, y se renueva por TTL o
+  cuando cambia la marca de actualización de las tablas. Un fallo de la
+  base de datos conserva la instantánea anterior.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from ml_metrics import log_event, log_exception
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Devuelve el pool de conexiones del proceso, creándolo en el primer uso"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # psycopg2 se importa al crear el pool, no al importar el módulo
+                from psycopg2.pool import ThreadedConnectionPool
+                _pool = ThreadedConnectionPool(
+                    int(os.getenv("DB_POOL_MIN", "1")),
+                    int(os.getenv("DB_POOL_MAX", "5")),
+                    host=os.getenv("DB_HOST"),
+                    database=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    port=os.getenv("DB_PORT")
+                )
+    return _pool
+
+
+def get_connection():
+    """Toma una conexión del pool; debe devolverse con release_connection"""
+    return get_pool().getconn()
+
+
+def release_connection(conn):
+    """Devuelve una conexión al pool"""
+    if conn is not None and _pool is not None:
+        _pool.putconn(conn)
+
+
+@contextmanager
+def pooled_connection():
+    """Conexión prestada del pool durante el bloque"""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+def close_pool():
+    """Cierra todas las conexiones del pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+class Snapshot:
+    """Datos cargados en un momento dado; se tratan como inmutables"""
+
+    def __init__(self, version, data, marker, loaded_at):
+        self.version = version
+        self.data = data
+        self.marker = marker
+        self.loaded_at = loaded_at
+
+
+class SnapshotStore:
+    """
+    Instantánea compartida y versionada.
+
+    `loader()` devuelve los datos y `marker_loader()` una marca barata de
+    consultar (p. ej. max(updated_at) y conteos) que cambia cuando cambian
+    los datos. Las lecturas no toman el lock: la instantánea se reemplaza
+    de forma atómica y cada lector conserva la que obtuvo.
+
+    Si `loader()` falla se conserva la instantánea anterior y se reintenta
+    tras `check_interval`; `fallback()` (p. ej. datos de ejemplo) solo se
+    usa cuando todavía no hay ninguna.
+    """
+
+    def __init__(self, loader, marker_loader=None, ttl=None, check_interval=None, fallback=None):
+        self.loader = loader
+        self.marker_loader = marker_loader
+        self.fallback = fallback
+        self.ttl = float(ttl if ttl is not None else os.getenv("SNAPSHOT_TTL", "300"))
+        self.check_interval = float(check_interval if check_interval is not None
+                                    else os.getenv("SNAPSHOT_CHECK_INTERVAL", "30"))
+        self._snapshot = None
+        self._last_check = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Devuelve la instantánea vigente, renovándola si expiró o cambiaron los datos"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is None or (now - snapshot.loaded_at >= self.ttl and now >= self._retry_at):
+            return self.refresh(expected=snapshot)
+        if self.marker_loader is not None and now - self._last_check >= self.check_interval:
+            self._last_check = now
+            marker = self._load_marker()
+            if marker is not None and marker != snapshot.marker:
+                return self.refresh(expected=snapshot)
+        return snapshot
+
+    def refresh(self, expected=None):
+        """Carga una nueva instantánea (una sola vez aunque varios hilos lo pidan)"""
+        with self._lock:
+            current = self._snapshot
+            if current is not expected and current is not None:
+                # Otro hilo ya la renovó mientras se esperaba el lock
+                return current
+            marker = self._load_marker() if self.marker_loader is not None else None
+            try:
+                data = self.loader()
+            except Exception:
+                if current is not None:
+                    # Una caída de la base de datos no reemplaza los datos vigentes
+                    log_exception("Error renovando la instantánea; se conserva la anterior",
+                                  version=current.version)
+                    self._retry_at = time.monotonic() + self.check_interval
+                    return current
+                if self.fallback is None:
+                    raise
+                log_exception("Error cargando la instantánea; se usan los datos de respaldo")
+                # Sin marca: la primera comprobación con la base de datos disponible la renueva
+                data, marker = self.fallback(), None
+            version = current.version + 1 if current is not None else 1
+            self._snapshot = Snapshot(version, data, marker, time.monotonic())
+            self._last_check = self._snapshot.loaded_at
+            return self._snapshot
+
+    def _load_marker(self):
+        try:
+            return self.marker_loader()
+        except Exception as e:
+            log_event("Error consultando la marca de actualización", level='warning', error=str(e))
+            return None
@@ -0,0 +1,458 @@
+"""
+Base de conocimiento del chatbot compilada a un artefacto binario con memoria mapeada.
+
+La fuente es un JSON (data/legal_knowledge.json) con la misma forma que el
+diccionario original: tema -> {"keywords": [...], "responses": [...], ...}.
+Se compila una vez a un directorio de arreglos NumPy que cada proceso abre
+con np.load(mmap_mode='r'), de modo que todos comparten las mismas páginas
+y el costo de arranque no crece con el tamaño de la base:
+
+- Cadenas internadas: un bloque UTF-8 con offsets; temas, palabras clave,
+  respuestas y listas de artículos guardan solo identificadores.
+- Campos por tema en formato CSR (tema -> campos -> cadenas).
+- Índice de palabras clave precalculado (el de chatbot_ml.KeywordIndex):
+  palabras clave y subcadenas normalizadas ordenadas, con sus temas en
+  CSR; la búsqueda es binaria (np.searchsorted) sobre el arreglo mapeado.
+
+Cada compilación se guarda en un subdirectorio con el hash del contenido
+de la fuente; KnowledgeBaseStore recarga en caliente cuando el archivo
+cambia, sin reiniciar el proceso. Si el directorio de artefactos no admite
+escritura (p. ej. un despliegue de solo lectura) se compila en el directorio
+temporal del sistema, y si aun así la carga falla se usa la fuente como
+diccionario en memoria (o una base vacía): el chatbot nunca deja de arrancar.
+
+Uso:
+    python scripts/ml_knowledge_base.py compile [--source data/legal_knowledge.json] [--output DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+
+import numpy as np
+
+from ml_metrics import log_event, log_exception
+from ml_text import normalize
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SOURCE = os.getenv("KNOWLEDGE_BASE_PATH", os.path.join(_REPO_ROOT, "data", "legal_knowledge.json"))
+DEFAULT_ARTIFACT_DIR = os.getenv("KNOWLEDGE_BASE_DIR", os.path.join(_REPO_ROOT, "models", "knowledge_base"))
+
+FORMAT_VERSION = 1
+
+# Tamaño máximo de la caché de palabras del usuario ya resueltas por índice
+_MATCH_CACHE_SIZE = 4096
+
+
+def source_hash(raw):
+    """Hash del contenido de la fuente (identifica la versión compilada)"""
+    return hashlib.sha1(raw).hexdigest()
+
+
+def keyword_tables(knowledge_base, min_length=3):
+    """
+    Tablas del índice de palabras clave (las de chatbot_ml.KeywordIndex y
+    del artefacto compilado), con los temas por posición en la base:
+
+    - palabra clave normalizada -> temas, para buscar las subcadenas de la
+      palabra del usuario ("tk in keyword");
+    - cada subcadena de al menos `min_length` caracteres de cada palabra
+      clave -> temas, para buscar la palabra del usuario completa
+      ("keyword in tk").
+    """
+    keyword_topics = {}
+    substring_topics = {}
+    for order, data in enumerate(knowledge_base.values()):
+        for tk in data.get("keywords", []):
+            # Mismo preprocesamiento que los mensajes (sin tildes)
+            tk = normalize(tk)
+            if not tk:
+                continue
+            keyword_topics.setdefault(tk, set()).add(order)
+            # Las palabras del usuario tienen al menos min_length caracteres
+            for start in range(len(tk)):
+                for end in range(start + min_length, len(tk) + 1):
+                    substring_topics.setdefault(tk[start:end], set()).add(order)
+    return keyword_topics, substring_topics
+
+
+def keyword_pieces(keyword, keyword_lengths):
+    """Subcadenas de la palabra del usuario con la longitud de alguna palabra clave"""
+    for length in keyword_lengths:
+        if length > len(keyword):
+            break
+        for start in range(len(keyword) - length + 1):
+            yield keyword[start:start + length]
+
+
+def _save_lookup(output_dir, name, mapping):
+    """Guarda cadena -> temas como claves ordenadas (S) más temas en CSR"""
+    keys = sorted(mapping)
+    encoded = [key.encode('utf-8') for key in keys]
+    width = max((len(key) for key in encoded), default=1)
+    np.save(os.path.join(output_dir, f'{name}.npy'), np.array(encoded, dtype=f'S{width}'))
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(mapping[key]) for key in keys], out=indptr[1:])
+    np.save(os.path.join(output_dir, f'{name}_indptr.npy'), indptr)
+    topics = [topic for key in keys for topic in sorted(mapping[key])]
+    np.save(os.path.join(output_dir, f'{name}_topics.npy'), np.array(topics, dtype=np.int32))
+
+
+def compile_knowledge_base(knowledge_base, output_dir, min_length=3, version=None):
+    """Compila el diccionario de la base de conocimiento en output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    string_ids = {}
+
+    def intern(text):
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(string_ids)
+        return string_id
+
+    fields = []
+    field_ids = {}
+    topic_names = []
+    topic_fields_indptr = [0]
+    field_kinds = []
+    field_items_indptr = [0]
+    field_items = []
+
+    for order, (topic, data) in enumerate(knowledge_base.items()):
+        topic_names.append(intern(topic))
+        for name, values in data.items():
+            if not isinstance(values, list):
+                raise ValueError(f"El campo '{name}' del tema '{topic}' debe ser una lista")
+            if name not in field_ids:
+                field_ids[name] = len(fields)
+                fields.append(name)
+            field_kinds.append(field_ids[name])
+            field_items.extend(intern(str(value)) for value in values)
+            field_items_indptr.append(len(field_items))
+        topic_fields_indptr.append(len(field_kinds))
+
+    keyword_topics, substring_topics = keyword_tables(knowledge_base, min_length)
+
+    def save(name, values, dtype):
+        np.save(os.path.join(output_dir, f'{name}.npy'), np.asarray(values, dtype=dtype))
+
+    strings = [text.encode('utf-8') for text in string_ids]
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in strings], out=offsets[1:])
+    with open(os.path.join(output_dir, 'strings.bin'), 'wb') as handle:
+        for chunk in strings:
+            handle.write(chunk)
+    save('strings_offsets', offsets, np.int64)
+
+    save('topic_names', topic_names, np.int32)
+    save('topic_fields_indptr', topic_fields_indptr, np.int32)
+    save('field_kinds', field_kinds, np.int16)
+    save('field_items_indptr', field_items_indptr, np.int64)
+    save('field_items', field_items, np.int32)
+    _save_lookup(output_dir, 'topic_keys', {topic: {order} for order, topic in enumerate(knowledge_base)})
+    _save_lookup(output_dir, 'keywords', keyword_topics)
+    _save_lookup(output_dir, 'substrings', substring_topics)
+
+    with open(os.path.join(output_dir, 'meta.json'), 'w', encoding='utf-8') as handle:
+        json.dump({
+            'format': FORMAT_VERSION,
+            'version': version,
+            'topics': len(topic_names),
+            'fields': fields,
+            'min_length': min_length,
+            'keyword_lengths': sorted({len(tk) for tk in keyword_topics}),
+            'built_at': time.time()
+        }, handle, ensure_ascii=False)
+    return len(topic_names)
+
+
+class _Lookup:
+    """Cadenas ordenadas (memoria mapeada) -> temas, por búsqueda binaria"""
+
+    def __init__(self, load, name):
+        self.keys = load(f'{name}.npy')
+        self.indptr = load(f'{name}_indptr.npy')
+        self.topics = load(f'{name}_topics.npy')
+        self.width = self.keys.dtype.itemsize
+
+    def find(self, queries):
+        """Temas de las cadenas consultadas que están en el índice"""
+        queries = [query for query in queries if len(query) <= self.width]
+        if not queries or len(self.keys) == 0:
+            return ()
+        queries = np.array(queries, dtype=self.keys.dtype)
+        positions = np.searchsorted(self.keys, queries)
+        found = positions < len(self.keys)
+        positions, queries = positions[found], queries[found]
+        positions = positions[self.keys[positions] == queries]
+        topics = set()
+        for position in positions:
+            topics.update(self.topics[self.indptr[position]:self.indptr[position + 1]].tolist())
+        return topics
+
+
+class CompiledKeywordIndex:
+    """Misma interfaz y resultados que chatbot_ml.KeywordIndex, sobre el artefacto compilado"""
+
+    def __init__(self, knowledge_base):
+        self.knowledge_base = knowledge_base
+        self.min_length = knowledge_base.min_length
+        self.keyword_lengths = knowledge_base.keyword_lengths
+        self.keywords = _Lookup(knowledge_base.load, 'keywords')
+        self.substrings = _Lookup(knowledge_base.load, 'substrings')
+        self._matches = {}
+
+    def matching_topics(self, keyword: str) -> set:
+        """Temas con alguna palabra clave que coincide con la palabra del usuario"""
+        topics = self._matches.get(keyword)
+        if topics is not None:
+            return topics
+
+        # La palabra completa dentro de una palabra clave
+        topics = set(self.substrings.find([keyword.encode('utf-8')]))
+        # Alguna palabra clave dentro de la palabra
+        pieces = [piece.encode('utf-8') for piece in keyword_pieces(keyword, self.keyword_lengths)]
+        topics.update(self.keywords.find(pieces))
+
+        if len(self._matches) >= _MATCH_CACHE_SIZE:
+            self._matches.clear()
+        self._matches[keyword] = topics
+        return topics
+
+    def best_topic(self, user_keywords):
+        """Tema con más palabras coincidentes; a igualdad gana el primero de la base"""
+        if not user_keywords:
+            return None, 0.0
+
+        matches = {}
+        for keyword in user_keywords:
+            for order in self.matching_topics(keyword):
+                matches[order] = matches.get(order, 0) + 1
+
+        if not matches:
+            return None, 0.0
+        best_order = min(matches, key=lambda order: (-matches[order], order))
+        return self.knowledge_base.topic_name(best_order), matches[best_order] / len(user_keywords)
+
+
+class KnowledgeBase(Mapping):
+    """
+    Base de conocimiento compilada, de solo lectura.
+
+    Se comporta como el diccionario original (tema -> campos); cada tema se
+    decodifica del artefacto al accederlo.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as handle:
+            meta = json.load(handle)
+        if meta['format'] != FORMAT_VERSION:
+            raise ValueError(f"Formato de base de conocimiento no soportado: {meta['format']}")
+        self.version = meta['version']
+        self.size = meta['topics']
+        self.fields = meta['fields']
+        self.min_length = meta['min_length']
+        self.keyword_lengths = meta['keyword_lengths']
+
+        self.string_offsets = self.load('strings_offsets.npy')
+        self.strings_blob = np.memmap(os.path.join(index_dir, 'strings.bin'), dtype=np.uint8, mode='r') \
+            if self.string_offsets[-1] > 0 else b''
+        self.topic_names = self.load('topic_names.npy')
+        self.topic_fields_indptr = self.load('topic_fields_indptr.npy')
+        self.field_kinds = self.load('field_kinds.npy')
+        self.field_items_indptr = self.load('field_items_indptr.npy')
+        self.field_items = self.load('field_items.npy')
+        self.topic_keys = _Lookup(self.load, 'topic_keys')
+        self._keyword_index = None
+
+    def load(self, name):
+        return np.load(os.path.join(self.index_dir, name), mmap_mode='r')
+
+    @property
+    def keyword_index(self) -> CompiledKeywordIndex:
+        if self._keyword_index is None:
+            self._keyword_index = CompiledKeywordIndex(self)
+        return self._keyword_index
+
+    def string(self, string_id):
+        start, end = int(self.string_offsets[string_id]), int(self.string_offsets[string_id + 1])
+        return bytes(self.strings_blob[start:end]).decode('utf-8')
+
+    def topic_name(self, order):
+        return self.string(int(self.topic_names[order]))
+
+    def topic_order(self, topic):
+        """Posición del tema en la base, o None si no existe"""
+        orders = self.topic_keys.find([topic.encode('utf-8')])
+        return next(iter(orders)) if orders else None
+
+    def topic_data(self, order):
+        """Campos del tema en la posición dada, como en el diccionario original"""
+        data = {}
+        for row in range(int(self.topic_fields_indptr[order]), int(self.topic_fields_indptr[order + 1])):
+            start, end = int(self.field_items_indptr[row]), int(self.field_items_indptr[row + 1])
+            data[self.fields[int(self.field_kinds[row])]] = [
+                self.string(int(string_id)) for string_id in self.field_items[start:end]
+            ]
+        return data
+
+    def __getitem__(self, topic):
+        order = self.topic_order(topic) if isinstance(topic, str) else None
+        if order is None:
+            raise KeyError(topic)
+        return self.topic_data(order)
+
+    def __contains__(self, topic):
+        return isinstance(topic, str) and self.topic_order(topic) is not None
+
+    def __iter__(self):
+        return (self.topic_name(order) for order in range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+class KnowledgeBaseStore:
+    """
+    Base de conocimiento vigente, recompilada y recargada cuando cambia la fuente.
+
+    Como mucho cada `check_interval` segundos se consulta la fecha de
+    modificación del archivo; si cambió, se compila (una vez por contenido,
+    compartido entre procesos) y se reemplaza la base de forma atómica.
+
+    get() no lanza excepciones: si la primera carga falla devuelve la fuente
+    como diccionario (o uno vacío) y vuelve a intentarlo cuando cambie.
+    """
+
+    def __init__(self, source=None, artifact_dir=None, check_interval=None):
+        self.source = source or DEFAULT_SOURCE
+        self.artifact_dir = artifact_dir or DEFAULT_ARTIFACT_DIR
+        self.check_interval = float(check_interval if check_interval is not None
+                                    else os.getenv("KNOWLEDGE_BASE_CHECK_INTERVAL", "5"))
+        self._knowledge_base = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> KnowledgeBase:
+        """Devuelve la base vigente, recargándola si el archivo fuente cambió"""
+        knowledge_base = self._knowledge_base
+        now = time.monotonic()
+        if knowledge_base is not None and now - self._last_check < self.check_interval:
+            return knowledge_base
+        with self._lock:
+            self._last_check = now
+            try:
+                # Una fuente ausente cuenta como una versión más: no se reintenta hasta que aparezca
+                mtime = os.stat(self.source).st_mtime_ns if os.path.exists(self.source) else None
+                if self._knowledge_base is None or mtime != self._mtime:
+                    # Se registra antes de cargar: una fuente inválida no se reintenta hasta que cambie
+                    self._mtime = mtime
+                    self._knowledge_base = self._load()
+            except Exception:
+                if self._knowledge_base is None:
+                    log_exception("Error cargando la base de conocimiento compilada", source=self.source)
+                    self._knowledge_base = self._fallback()
+                else:
+                    # Se conserva la versión anterior si la nueva fuente no es válida
+                    log_exception("Error recargando la base de conocimiento", source=self.source)
+            return self._knowledge_base
+
+    def _load(self):
+        with open(self.source, 'rb') as handle:
+            raw = handle.read()
+        version = source_hash(raw)
+        if getattr(self._knowledge_base, 'version', None) == version:
+            return self._knowledge_base
+        knowledge_base = None
+        error = None
+        for artifact_dir in self._artifact_dirs():
+            compiled_dir = os.path.join(artifact_dir, version)
+            try:
+                if not os.path.exists(os.path.join(compiled_dir, 'meta.json')):
+                    if knowledge_base is None:
+                        knowledge_base = json.loads(raw.decode('utf-8'))
+                    self._compile(knowledge_base, artifact_dir, version)
+                return KnowledgeBase(compiled_dir)
+            except OSError as e:
+                # Directorio de solo lectura o sin espacio: se prueba el siguiente
+                log_event("No se pudo compilar la base de conocimiento", level='warning',
+                          artifact_dir=artifact_dir, error=str(e))
+                error = e
+        raise error
+
+    def _artifact_dirs(self):
+        """Directorio configurado y, como alternativa, uno en el directorio temporal del sistema"""
+        return [self.artifact_dir, os.path.join(tempfile.gettempdir(), 'knowledge_base')]
+
+    def _fallback(self):
+        """La fuente como diccionario en memoria, o una base vacía si tampoco puede leerse"""
+        try:
+            with open(self.source, encoding='utf-8') as handle:
+                knowledge_base = json.load(handle)
+            log_event("Usando la base de conocimiento sin compilar", level='warning', topics=len(knowledge_base))
+            return knowledge_base
+        except Exception:
+            log_exception("Error leyendo la base de conocimiento; se usa una base vacía", source=self.source)
+            return {}
+
+    def _compile(self, knowledge_base, artifact_dir, version):
+        # Se compila en un directorio temporal y se renombra: otros procesos nunca ven un artefacto a medias
+        os.makedirs(artifact_dir, exist_ok=True)
+        tmp_dir = os.path.join(artifact_dir, f".tmp-{os.getpid()}-{version}")
+        try:
+            compile_knowledge_base(knowledge_base, tmp_dir, version=version)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        try:
+            os.rename(tmp_dir, os.path.join(artifact_dir, version))
+        except OSError:
+            # Otro proceso terminó antes la misma versión
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._prune(artifact_dir, keep=version)
+
+    def _prune(self, artifact_dir, keep, retain=2):
+        """Elimina versiones compiladas antiguas (las abiertas siguen mapeadas hasta cerrarse)"""
+        versions = [os.path.join(artifact_dir, name) for name in os.listdir(artifact_dir)
+                    if not name.startswith('.') and name != keep]
+        versions.sort(key=os.path.getmtime, reverse=True)
+        for path in versions[retain - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_store = None
+
+
+def get_knowledge_store():
+    """Almacén de la base de conocimiento del proceso, creado en el primer uso"""
+    global _store
+    if _store is None:
+        _store = KnowledgeBaseStore()
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help='compilar la base de conocimiento')
+    compile_parser.add_argument('--source', default=DEFAULT_SOURCE)
+    compile_parser.add_argument('--output', default=DEFAULT_ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = KnowledgeBaseStore(args.source, args.output)
+    # Sin la alternativa en memoria de get(): un error de compilación debe fallar aquí
+    knowledge_base = store._load()
+    print(json.dumps({'status': 'success', 'topics': len(knowledge_base), 'version': knowledge_base.version,
+                      'output': knowledge_base.index_dir, 'seconds': time.perf_counter() - start}))
+
+
+if __name__ == '__main__':
+    main()
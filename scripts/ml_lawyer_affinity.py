@@ -0,0 +1,273 @@
+"""
+Matriz de afinidad abogado x categoría legal, calculada fuera de línea.
+
+Cada celda combina dos señales:
+
+- Texto: similitud coseno entre la especialidad del abogado y el perfil de
+  la categoría (nombre de la categoría más el centroide TF-IDF de sus
+  preguntas frecuentes y de usuarios), con el mismo vectorizador que el
+  recomendador (ajustado sobre las especialidades, con stemming).
+- Resultados: citas completadas, confirmadas o canceladas con el abogado,
+  repartidas entre las categorías de las preguntas del usuario que la
+  agendó. Se combinan con la afinidad de texto como prior:
+  (PRIOR_STRENGTH * texto + suma de resultados) / (PRIOR_STRENGTH + citas).
+
+La matriz se guarda como float32 (categorías x abogados, una fila contigua
+por categoría) y se carga con memoria mapeada. Cada construcción escribe un
+directorio de versión nuevo (temporal y luego renombrado) y después
+reemplaza meta.json de forma atómica: los procesos que tienen mapeada la
+versión anterior no ven cambiar el archivo bajo sus pies. Cuando una solicitud ya trae
+la categoría (p. ej. la del chatbot), el recomendador usa esa fila como
+similitud y la combina con calificación y experiencia, sin TF-IDF.
+
+Uso:
+    python scripts/ml_lawyer_affinity.py build [--output DIR]
+    python scripts/ml_lawyer_affinity.py show laboral [--affinity DIR] [-k 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from ml_metrics import log_event, log_exception
+from ml_text import analyze_stemmed
+
+DEFAULT_AFFINITY_DIR = os.getenv(
+    "LAWYER_AFFINITY_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "lawyer_affinity")
+)
+
+# Valor de cada resultado de cita (las pendientes no cuentan)
+OUTCOME_VALUES = {'completed': 1.0, 'confirmed': 0.75, 'cancelled': 0.0}
+
+# Citas equivalentes que aporta la afinidad de texto
+PRIOR_STRENGTH = 5.0
+
+# Peso del nombre de la categoría frente al centroide de sus preguntas
+NAME_WEIGHT = 0.5
+
+
+def load_history(conn):
+    """Categorías de las preguntas de cada usuario y resultados de sus citas"""
+    if conn:
+        try:
+            from psycopg2.extras import RealDictCursor
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT user_id, category, count(*) AS questions
+                FROM user_questions
+                GROUP BY user_id, category
+            """)
+            user_categories = {}
+            for row in cursor.fetchall():
+                user_categories.setdefault(str(row['user_id']), {})[row['category']] = row['questions']
+            cursor.execute("""
+                SELECT user_id, lawyer_id, status
+                FROM appointments
+                WHERE status <> 'pending'
+            """)
+            appointments = [(str(row['user_id']), str(row['lawyer_id']), row['status'])
+                            for row in cursor.fetchall()]
+            cursor.close()
+            return user_categories, appointments
+        except Exception:
+            log_exception("Error cargando historial de citas")
+
+    log_event("Sin historial de citas: solo se usa la afinidad de texto", level='warning')
+    return {}, []
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def text_affinity(specialties, category_texts):
+    """Similitud coseno abogados x categorías entre especialidades y perfiles de categoría"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    categories = sorted(category_texts)
+    vectorizer = TfidfVectorizer(analyzer=analyze_stemmed)
+    specialty_vectors = vectorizer.fit_transform(specialties)
+
+    profiles = np.zeros((len(categories), specialty_vectors.shape[1]))
+    for i, category in enumerate(categories):
+        name = vectorizer.transform([category]).toarray()[0]
+        texts = category_texts[category]
+        centroid = np.asarray(vectorizer.transform(texts).mean(axis=0)).ravel() if texts else np.zeros_like(name)
+        centroid_norm = np.linalg.norm(centroid)
+        if centroid_norm > 0:
+            centroid /= centroid_norm
+        profiles[i] = NAME_WEIGHT * name + (1 - NAME_WEIGHT) * centroid
+    profiles = _normalize_rows(profiles)
+    return categories, np.asarray(specialty_vectors @ profiles.T)
+
+
+def outcome_totals(lawyer_ids, categories, user_categories, appointments):
+    """Suma de resultados y número de citas (ponderadas por categoría) por abogado y categoría"""
+    rows = {lawyer_id: i for i, lawyer_id in enumerate(lawyer_ids)}
+    columns = {category: j for j, category in enumerate(categories)}
+    totals = np.zeros((len(lawyer_ids), len(categories)))
+    counts = np.zeros_like(totals)
+    for user_id, lawyer_id, status in appointments:
+        row = rows.get(lawyer_id)
+        value = OUTCOME_VALUES.get(status)
+        shares = user_categories.get(user_id)
+        if row is None or value is None or not shares:
+            continue
+        questions = sum(shares.values())
+        for category, count in shares.items():
+            column = columns.get(category)
+            if column is not None:
+                weight = count / questions
+                totals[row, column] += weight * value
+                counts[row, column] += weight
+    return totals, counts
+
+
+def build_affinity(lawyers, corpus, user_categories, appointments, output_dir):
+    """Calcula la matriz de afinidad y escribe sus arreglos; devuelve sus dimensiones"""
+    lawyer_ids = [str(lawyer['id']) for lawyer in lawyers]
+    category_texts = {}
+    for row in corpus:
+        text = ' '.join(filter(None, [row.get('question'), row.get('answer')]))
+        category_texts.setdefault(row.get('category') or 'general', []).append(text)
+    # Categorías que solo aparecen en las preguntas de usuarios agregadas
+    for shares in user_categories.values():
+        for category in shares:
+            category_texts.setdefault(category or 'general', [])
+
+    categories, text = text_affinity([lawyer['specialty'] for lawyer in lawyers], category_texts)
+    totals, counts = outcome_totals(lawyer_ids, categories, user_categories, appointments)
+    affinity = (PRIOR_STRENGTH * text + totals) / (PRIOR_STRENGTH + counts)
+
+    built_at = time.time()
+    version = f"{int(built_at * 1000)}-{os.getpid()}"
+    os.makedirs(output_dir, exist_ok=True)
+    # La matriz va a un directorio temporal que se renombra: nunca se sobrescribe un archivo mapeado
+    tmp_dir = os.path.join(output_dir, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    try:
+        np.save(os.path.join(tmp_dir, 'affinity.npy'), np.ascontiguousarray(affinity.T, dtype=np.float32))
+        os.rename(tmp_dir, os.path.join(output_dir, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # meta.json apunta a la versión; su reemplazo atómico publica la matriz nueva
+    meta_path = os.path.join(output_dir, 'meta.json')
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump({
+            'version': version,
+            'lawyer_ids': lawyer_ids,
+            'categories': categories,
+            'appointments': int(counts.sum().round()),
+            'prior_strength': PRIOR_STRENGTH,
+            'name_weight': NAME_WEIGHT,
+            'built_at': built_at
+        }, handle, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+    _prune(output_dir, keep=version)
+    return len(lawyer_ids), len(categories)
+
+
+def _prune(output_dir, keep, retain=2):
+    """Elimina versiones antiguas de la matriz (las abiertas siguen mapeadas hasta cerrarse)"""
+    versions = [os.path.join(output_dir, name) for name in os.listdir(output_dir)
+                if not name.startswith('.') and name != keep and os.path.isdir(os.path.join(output_dir, name))]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[retain - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class LawyerAffinity:
+    """Matriz de afinidad cargada con memoria mapeada"""
+
+    def __init__(self, affinity_dir=DEFAULT_AFFINITY_DIR):
+        self.affinity_dir = affinity_dir
+        with open(os.path.join(affinity_dir, 'meta.json'), encoding='utf-8') as handle:
+            meta = json.load(handle)
+        self.lawyer_ids = meta['lawyer_ids']
+        self.categories = {category: i for i, category in enumerate(meta['categories'])}
+        self.built_at = meta['built_at']
+        # Los artefactos anteriores a las versiones guardaban la matriz junto a meta.json
+        matrix_dir = os.path.join(affinity_dir, meta['version']) if 'version' in meta else affinity_dir
+        self.matrix = np.load(os.path.join(matrix_dir, 'affinity.npy'), mmap_mode='r')
+        self._rows = None
+
+    def column(self, category):
+        """Afinidad de todos los abogados del artefacto con la categoría (None si no existe)"""
+        index = self.categories.get(category)
+        return None if index is None else self.matrix[index]
+
+    def aligned_column(self, category, lawyer_ids):
+        """
+        Afinidad con la categoría en el orden de `lawyer_ids`; los abogados
+        agregados después de construir la matriz quedan en 0 hasta reconstruirla.
+        """
+        column = self.column(category)
+        if column is None:
+            return None
+        if self._rows is None:
+            self._rows = {lawyer_id: i for i, lawyer_id in enumerate(self.lawyer_ids)}
+        rows = np.fromiter((self._rows.get(str(lawyer_id), -1) for lawyer_id in lawyer_ids),
+                           dtype=np.int64, count=len(lawyer_ids))
+        known = rows >= 0
+        aligned = np.zeros(len(lawyer_ids))
+        aligned[known] = column[rows[known]]
+        return aligned
+
+    def top(self, category, k=5):
+        """Los k abogados con mayor afinidad con la categoría"""
+        column = self.column(category)
+        if column is None:
+            return []
+        k = min(k, len(column))
+        top = np.argsort(-np.asarray(column), kind='stable')[:k]
+        return [{'id': self.lawyer_ids[i], 'affinity': float(column[i])} for i in top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='calcular la matriz desde la base de datos')
+    build_parser.add_argument('--output', default=DEFAULT_AFFINITY_DIR)
+    show_parser = subparsers.add_parser('show', help='abogados con mayor afinidad con una categoría')
+    show_parser.add_argument('category')
+    show_parser.add_argument('--affinity', default=DEFAULT_AFFINITY_DIR)
+    show_parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from ml_db import get_connection, release_connection
+        from ml_lawyer_recommender import load_env, load_lawyers
+        load_env()
+        from ml_question_index import load_corpus
+        conn = None
+        try:
+            conn = get_connection()
+        except Exception as e:
+            log_event("Error conectando a la base de datos", level='warning', error=str(e))
+        try:
+            lawyers = load_lawyers(conn).to_dict('records')
+            corpus = load_corpus(conn)
+            user_categories, appointments = load_history(conn)
+        finally:
+            release_connection(conn)
+        start = time.perf_counter()
+        lawyer_count, category_count = build_affinity(lawyers, corpus, user_categories, appointments, args.output)
+        print(json.dumps({'status': 'success', 'lawyers': lawyer_count, 'categories': category_count,
+                          'appointments': len(appointments), 'output': args.output,
+                          'seconds': time.perf_counter() - start}))
+    else:
+        affinity = LawyerAffinity(args.affinity)
+        print(json.dumps({'status': 'success', 'category': args.category,
+                          'results': affinity.top(args.category, args.k)}, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
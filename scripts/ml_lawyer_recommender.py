@@ -1,16 +1,257 @@
+import time
+_STARTED = time.perf_counter()
+
 import numpy as np
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+import sys
 import json
-from dotenv import load_dotenv
+from ml_metrics import RequestTrace, current_trace, log_event, log_exception, report_timing, span
+from ml_db import SnapshotStore, close_pool, get_connection, pooled_connection, release_connection
+from ml_scoring import CASE_CHUNK_SIZE, DEFAULT_WEIGHTS, LawyerScoringEngine
+from ml_text import analyze_stemmed
+
+# pandas, scikit-learn, SciPy, psycopg2.extras, dotenv y ml_sync se importan
+# al primer uso: las solicitudes triviales (top_n <= 0, JSON inválido)
+# responden sin cargarlos
+
+_env_loaded = False
+
+def load_env():
+    """
+    Carga las variables de entorno (.env del directorio del script o sus padres;
+    desde el zipapp de build_ml_zipapp.py, del directorio de trabajo), una vez
+    por proceso y justo antes de crear el pool de conexiones
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import find_dotenv, load_dotenv
+    load_dotenv(find_dotenv(usecwd=not os.path.exists(__file__)))
+    _env_loaded = True
+
+# Columnas normalizadas con min-max: columna original -> columna normalizada
+NORMALIZED_COLUMNS = {
+    'rating': 'normalized_rating',
+    'experience_years': 'normalized_experience'
+}
+
+# Casos recientes que se mantienen en memoria
+CASES_LIMIT = 100
+
+def load_lawyers(conn, fallback=True):
+    """
+    Carga los datos de abogados desde la base de datos (o datos de ejemplo si
+    no hay conexión; con fallback=False, un error de la consulta se propaga)
+    """
+    import pandas as pd
+    if conn:
+        try:
+            from psycopg2.extras import RealDictCursor
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT id, full_name, specialty, experience_years, rating, available, avatar_url 
+                FROM lawyers 
+                WHERE available = true
+            """)
+            lawyers = cursor.fetchall()
+            cursor.close()
+            return pd.DataFrame(lawyers)
+        except Exception:
+            log_exception("Error cargando abogados")
+            if not fallback:
+                raise
+
+    # Fallback a datos de ejemplo si hay error
+    log_event("Usando datos de ejemplo para abogados", level='warning')
+    lawyers = [
+        {"id": 1, "full_name": "Dra. María González", "specialty": "Derechos de Discapacidad, Accesibilidad, Inclusión", 
+         "experience_years": 15, "rating": 4.9, "available": True},
+        {"id": 2, "full_name": "Dr. Carlos Rodríguez", "specialty": "Derecho Laboral, Discapacidad, Discriminación", 
+         "experience_years": 12, "rating": 4.8, "available": True},
+        {"id": 3, "full_name": "Dra. Ana Martínez", "specialty": "Derecho Civil, Herencias, Testamentos, Patrimonio Protegido", 
+         "experience_years": 18, "rating": 4.9, "available": True},
+        {"id": 4, "full_name": "Dr. Javier López", "specialty": "Pensiones, Seguridad Social, Incapacidad Laboral", 
+         "experience_years": 10, "rating": 4.7, "available": True},
+        {"id": 5, "full_name": "Dra. Laura Sánchez", "specialty": "Accesibilidad, Derechos Humanos, Litigios", 
+         "experience_years": 14, "rating": 4.8, "available": True}
+    ]
+    return pd.DataFrame(lawyers)
+
+def load_cases(conn, fallback=True):
+    """
+    Carga los datos de casos legales desde la base de datos (o datos de
+    ejemplo si no hay conexión; con fallback=False, un error se propaga)
+    """
+    import pandas as pd
+    if conn:
+        try:
+            from psycopg2.extras import RealDictCursor
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT uq.id, uq.question as description, uq.category, uq.created_at,
+                       string_agg(lq.category, ', ') as keywords
+                FROM user_questions uq
+                LEFT JOIN legal_questions lq ON uq.category = lq.category
+                GROUP BY uq.id, uq.question, uq.category, uq.created_at
+                ORDER BY uq.created_at DESC
+                LIMIT %s
+            """, (CASES_LIMIT,))
+            cases = cursor.fetchall()
+            cursor.close()
+            return pd.DataFrame(cases)
+        except Exception:
+            log_exception("Error cargando casos")
+            if not fallback:
+                raise
+
+    # Fallback a datos de ejemplo si hay error
+    log_event("Usando datos de ejemplo para casos", level='warning')
+    cases = [
+        {"id": 1, "description": "Discriminación laboral por discapacidad motriz", 
+         "category": "laboral", "keywords": "discriminación, trabajo, adaptaciones"},
+        {"id": 2, "description": "Solicitud de pensión por invalidez rechazada", 
+         "category": "pensiones", "keywords": "pensión, invalidez, seguridad social"},
+        {"id": 3, "description": "Testamento con protección patrimonial para hijo con discapacidad", 
+         "category": "herencias", "keywords": "testamento, patrimonio, protección"},
+        {"id": 4, "description": "Denuncia por falta de accesibilidad en edificio público", 
+         "category": "accesibilidad", "keywords": "accesibilidad, barreras, edificio"}
+    ]
+    return pd.DataFrame(cases)
+
+def _latest_case(cases_df):
+    """created_at del caso más reciente, o None (los datos de ejemplo no tienen fecha)"""
+    if cases_df.empty or 'created_at' not in cases_df.columns:
+        return None
+    import pandas as pd
+    latest = cases_df['created_at'].max()
+    return None if pd.isna(latest) else pd.Timestamp(latest).to_pydatetime()
+
+def _same_value(left, right):
+    """Compara valores de fila tratando None y NaN como equivalentes"""
+    import pandas as pd
+    if pd.isna(left) and pd.isna(right):
+        return True
+    return left == right
+
+def load_update_marker(conn):
+    """
+    Marca barata que cambia cuando cambian los abogados (requiere la columna
+    updated_at). Los casos no entran: cada mensaje del chat los cambia y la
+    puntuación no los usa; se renuevan por su cuenta (ver get_cases_store)
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT max(updated_at), count(*) FROM lawyers")
+    marker = cursor.fetchone()
+    cursor.close()
+    conn.rollback()
+    return tuple(marker)
+
+def load_snapshot_data():
+    """Carga los abogados con una conexión prestada del pool; un fallo se propaga (ver SnapshotStore)"""
+    with span('lawyers.db_load'), pooled_connection() as conn:
+        return {'lawyers': load_lawyers(conn, fallback=False)}
+
+def load_sample_snapshot():
+    """Abogados de ejemplo, solo si la primera carga falla"""
+    return {'lawyers': load_lawyers(None)}
+
+def load_snapshot_marker():
+    with pooled_connection() as conn:
+        return load_update_marker(conn)
+
+def load_cases_data():
+    """Carga los casos recientes con una conexión prestada del pool"""
+    with span('cases.db_load'), pooled_connection() as conn:
+        return {'cases': load_cases(conn, fallback=False)}
+
+def load_sample_cases():
+    return {'cases': load_cases(None)}
+
+# Matriz de afinidad abogado x categoría (memoria mapeada), cargada en el primer uso
+_affinity = None
+
+def get_lawyer_affinity():
+    """Devuelve la matriz de afinidad, recargándola si se reconstruyó; None si no se ha construido"""
+    global _affinity
+    from ml_lawyer_affinity import DEFAULT_AFFINITY_DIR, LawyerAffinity
+
+    meta_path = os.path.join(DEFAULT_AFFINITY_DIR, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    mtime = os.path.getmtime(meta_path)
+    if _affinity is None or _affinity[0] != mtime:
+        _affinity = (mtime, LawyerAffinity(DEFAULT_AFFINITY_DIR))
+    return _affinity[1]
+
+# Pesos de la puntuación combinada aprendidos (ml_ranking_weights.py train): (mtime, pesos)
+_ranking_weights = None
+
+def get_ranking_weights():
+    """Pesos aprendidos, recargándolos si se reentrenaron; los de defecto si no hay artefacto"""
+    global _ranking_weights
+    from ml_ranking_weights import DEFAULT_WEIGHTS_DIR, load_weights
+
+    try:
+        mtime = os.path.getmtime(os.path.join(DEFAULT_WEIGHTS_DIR, 'weights.json'))
+    except OSError:
+        return DEFAULT_WEIGHTS
+    if _ranking_weights is None or _ranking_weights[0] != mtime:
+        try:
+            artifact = load_weights(DEFAULT_WEIGHTS_DIR)
+            weights = artifact['weights'] if artifact else DEFAULT_WEIGHTS
+            log_event("Pesos de ranking cargados", version=artifact and artifact['version'], **weights)
+        except Exception:
+            log_exception("Error cargando pesos de ranking")
+            weights = DEFAULT_WEIGHTS
+        _ranking_weights = (mtime, weights)
+    return _ranking_weights[1]
+
+# Almacén de calificaciones del proceso (ver ml_rating_store), creado con el primer voto
+_rating_store = None
+
+def get_rating_store():
+    """Devuelve el almacén de calificaciones, cargando los agregados e iniciando su volcado periódico"""
+    global _rating_store
+    if _rating_store is None:
+        import atexit
+        from ml_rating_store import RatingStore
+        _rating_store = RatingStore()
+        _rating_store.load()
+        _rating_store.start()
+        # Los votos pendientes se vuelcan al terminar el proceso
+        atexit.register(_rating_store.close)
+    return _rating_store
+
+# Instantánea compartida por todos los recomendadores del proceso
+_snapshot_store = None
+
+def get_snapshot_store():
+    """Devuelve la instantánea compartida de abogados del proceso"""
+    global _snapshot_store
+    if _snapshot_store is None:
+        _snapshot_store = SnapshotStore(load_snapshot_data, marker_loader=load_snapshot_marker,
+                                        fallback=load_sample_snapshot)
+    return _snapshot_store
 
-# Cargar variables de entorno
-load_dotenv()
+# Casos recientes: solo por TTL, sin reajustar el recomendador
+_cases_store = None
+
+def get_cases_store():
+    """Devuelve la instantánea compartida de casos recientes del proceso"""
+    global _cases_store
+    if _cases_store is None:
+        _cases_store = SnapshotStore(load_cases_data, ttl=os.getenv("CASES_TTL", "300"),
+                                     fallback=load_sample_cases)
+    return _cases_store
+
+def _preferences_list(preferences, count):
+    """Una preferencia por caso, a partir de un diccionario común o de una lista"""
+    if preferences is None or isinstance(preferences, dict):
+        return [preferences] * count
+    preferences_list = list(preferences)
+    if len(preferences_list) != count:
+        raise ValueError("Se necesita una preferencia por caso")
+    return preferences_list
 
 class LawyerRecommender:
     """
@@ -18,245 +259,669 @@ class LawyerRecommender:
     para personas con discapacidad motriz
     """
     
-    def __init__(self):
+    def __init__(self, lawyers_df=None, cases_df=None, ranking_weights=None):
+        # Con datos ya cargados (benchmarks, pruebas) no se abre conexión
+        preloaded = lawyers_df is not None
         # Conectar a la base de datos
-        self.conn = self.connect_to_db()
+        self.conn = None if preloaded else self.connect_to_db()
         # Cargar datos de abogados
-        self.lawyers_df = self.load_lawyers_from_db()
+        self.lawyers_df = lawyers_df.reset_index(drop=True) if preloaded else self.load_lawyers_from_db()
         # Cargar datos de casos
-        self.cases_df = self.load_cases_from_db()
+        if cases_df is not None:
+            self.cases_df = cases_df
+        else:
+            import pandas as pd
+            self.cases_df = pd.DataFrame() if preloaded else self.load_cases_from_db()
         
+        # Versiones de las instantáneas compartidas de las que provienen los datos
+        self.snapshot_version = None
+        self.cases_version = None
+
         # Vectorizar especialidades y casos para análisis de similitud
-        self.vectorizer = TfidfVectorizer()
+        # Tokenizador compartido: sin tildes ni stopwords, con stemming ligero (pensión ~ pensiones)
+        with span('import.sklearn'):
+            from sklearn.feature_extraction.text import TfidfVectorizer
+        self.vectorizer = TfidfVectorizer(analyzer=analyze_stemmed)
         self.specialty_vectors = self.vectorize_specialties()
         
-        # Normalizar ratings y experiencia
-        self.scaler = MinMaxScaler()
-        if not self.lawyers_df.empty:
-            self.lawyers_df[['normalized_rating', 'normalized_experience']] = self.scaler.fit_transform(
-                self.lawyers_df[['rating', 'experience_years']])
+        # Motor de puntuación NumPy, construido bajo demanda
+        # Pesos fijos (benchmarks, pruebas); sin ellos se usan los aprendidos (ver get_ranking_weights)
+        self.ranking_weights = ranking_weights
+        self._engine = None
+        self._engine_features_stale = False
+
+        # Puntuación repartida entre procesos para rosters muy grandes (ver ml_sharded_scoring)
+        self.scoring_workers = int(os.getenv("LAWYER_SCORING_WORKERS", "0"))
+        self._sharded_scorer = None
+
+        # Posición de cada abogado en lawyers_df / specialty_vectors
+        self._positions = {}
+        self._rebuild_positions()
+
+        # Normalizar ratings y experiencia (min-max, con límites mantenidos en memoria)
+        self.feature_bounds = {}
+        for column in NORMALIZED_COLUMNS:
+            self._normalize_column(column)
         
+    @classmethod
+    def from_snapshot(cls, snapshot, cases=None):
+        """Construye un recomendador sobre instantáneas compartidas, sin consultar la base de datos"""
+        recommender = cls(lawyers_df=snapshot.data['lawyers'], cases_df=cases.data['cases'] if cases else None)
+        recommender.snapshot_version = snapshot.version
+        recommender.cases_version = cases.version if cases else None
+        return recommender
+
     def connect_to_db(self):
-        """Conecta a la base de datos Supabase/PostgreSQL"""
+        """Obtiene una conexión del pool compartido de Supabase/PostgreSQL"""
         try:
-            conn = psycopg2.connect(
-                host=os.getenv("DB_HOST"),
-                database=os.getenv("DB_NAME"),
-                user=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASSWORD"),
-                port=os.getenv("DB_PORT")
-            )
-            return conn
+            load_env()
+            return get_connection()
         except Exception as e:
-            print(f"Error conectando a la base de datos: {e}")
+            log_event("Error conectando a la base de datos", level='warning', error=str(e))
             # Fallback a datos de ejemplo si no se puede conectar
             return None
     
     def load_lawyers_from_db(self):
         """Carga los datos de abogados desde la base de datos"""
-        if self.conn:
-            try:
-                cursor = self.conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute("""
-                    SELECT id, full_name, specialty, experience_years, rating, available, avatar_url 
-                    FROM lawyers 
-                    WHERE available = true
-                """)
-                lawyers = cursor.fetchall()
-                cursor.close()
-                return pd.DataFrame(lawyers)
-            except Exception as e:
-                print(f"Error cargando abogados: {e}")
-        
-        # Fallback a datos de ejemplo si hay error
-        print("Usando datos de ejemplo para abogados")
-        lawyers = [
-            {"id": 1, "full_name": "Dra. María González", "specialty": "Derechos de Discapacidad, Accesibilidad, Inclusión", 
-             "experience_years": 15, "rating": 4.9, "available": True},
-            {"id": 2, "full_name": "Dr. Carlos Rodríguez", "specialty": "Derecho Laboral, Discapacidad, Discriminación", 
-             "experience_years": 12, "rating": 4.8, "available": True},
-            {"id": 3, "full_name": "Dra. Ana Martínez", "specialty": "Derecho Civil, Herencias, Testamentos, Patrimonio Protegido", 
-             "experience_years": 18, "rating": 4.9, "available": True},
-            {"id": 4, "full_name": "Dr. Javier López", "specialty": "Pensiones, Seguridad Social, Incapacidad Laboral", 
-             "experience_years": 10, "rating": 4.7, "available": True},
-            {"id": 5, "full_name": "Dra. Laura Sánchez", "specialty": "Accesibilidad, Derechos Humanos, Litigios", 
-             "experience_years": 14, "rating": 4.8, "available": True}
-        ]
-        return pd.DataFrame(lawyers)
+        return load_lawyers(self.conn)
     
     def load_cases_from_db(self):
         """Carga los datos de casos legales desde la base de datos"""
-        if self.conn:
-            try:
-                cursor = self.conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute("""
-                    SELECT uq.id, uq.question as description, uq.category, 
-                           string_agg(lq.category, ', ') as keywords
-                    FROM user_questions uq
-                    LEFT JOIN legal_questions lq ON uq.category = lq.category
-                    GROUP BY uq.id, uq.question, uq.category
-                    ORDER BY uq.created_at DESC
-                    LIMIT 100
-                """)
-                cases = cursor.fetchall()
-                cursor.close()
-                return pd.DataFrame(cases)
-            except Exception as e:
-                print(f"Error cargando casos: {e}")
-        
-        # Fallback a datos de ejemplo si hay error
-        print("Usando datos de ejemplo para casos")
-        cases = [
-            {"id": 1, "description": "Discriminación laboral por discapacidad motriz", 
-             "category": "laboral", "keywords": "discriminación, trabajo, adaptaciones"},
-            {"id": 2, "description": "Solicitud de pensión por invalidez rechazada", 
-             "category": "pensiones", "keywords": "pensión, invalidez, seguridad social"},
-            {"id": 3, "description": "Testamento con protección patrimonial para hijo con discapacidad", 
-             "category": "herencias", "keywords": "testamento, patrimonio, protección"},
-            {"id": 4, "description": "Denuncia por falta de accesibilidad en edificio público", 
-             "category": "accesibilidad", "keywords": "accesibilidad, barreras, edificio"}
-        ]
-        return pd.DataFrame(cases)
+        return load_cases(self.conn)
     
     def vectorize_specialties(self):
         """Vectoriza las especialidades de los abogados para análisis de similitud"""
         if self.lawyers_df.empty:
             return None
         specialty_texts = self.lawyers_df['specialty'].tolist()
-        return self.vectorizer.fit_transform(specialty_texts)
+        with span('lawyers.fit'):
+            return self.vectorizer.fit_transform(specialty_texts)
     
+    def _rebuild_positions(self):
+        """Reconstruye el índice id -> posición de fila"""
+        if self.lawyers_df.empty:
+            self._positions = {}
+        else:
+            # Los ids se indexan como texto, que es como los reciben los clientes
+            self._positions = {str(lawyer_id): pos for pos, lawyer_id in enumerate(self.lawyers_df['id'])}
+
+    def _position(self, lawyer_id):
+        """Devuelve la posición de un abogado en el índice, o None si no está"""
+        return self._positions.get(str(lawyer_id))
+
+    def _normalize_column(self, column):
+        """Recalcula los límites de una columna y la normaliza completa (vectorizado, sin reajustar modelos)"""
+        if self.lawyers_df.empty:
+            self.feature_bounds.pop(column, None)
+            return
+        values = self.lawyers_df[column].to_numpy(dtype=float)
+        low, high = float(values.min()), float(values.max())
+        self.feature_bounds[column] = (low, high)
+        value_range = high - low
+        # Igual que MinMaxScaler: una columna constante se normaliza a 0
+        normalized = (values - low) / value_range if value_range > 0 else np.zeros_like(values)
+        self.lawyers_df[NORMALIZED_COLUMNS[column]] = normalized
+        self._engine_features_stale = True
+
+    def _set_feature(self, pos, column, value):
+        """Actualiza un valor normalizado; solo renormaliza la columna si cambian sus límites"""
+        old_value = float(self.lawyers_df.at[pos, column])
+        self.lawyers_df.at[pos, column] = value
+        low, high = self.feature_bounds.get(column, (value, value))
+
+        # El valor sale de los límites, o sale de un límite que podía ser único
+        if value < low or value > high or (old_value in (low, high) and value != old_value):
+            self._normalize_column(column)
+            return
+
+        self._normalize_value(pos, column)
+
+    def _normalize_value(self, pos, column):
+        """Normaliza un único valor con los límites actuales de su columna"""
+        low, high = self.feature_bounds[column]
+        value_range = high - low
+        value = float(self.lawyers_df.at[pos, column])
+        normalized = (value - low) / value_range if value_range > 0 else 0.0
+        self.lawyers_df.at[pos, NORMALIZED_COLUMNS[column]] = normalized
+        if self._engine is not None and not self._engine_features_stale:
+            # Solo cambia una fila: el motor la actualiza en su lugar
+            self._engine.update_value(pos, column, value, normalized)
+        else:
+            self._engine_features_stale = True
+
+    def add_lawyer(self, lawyer):
+        """Agrega un abogado al índice; solo reajusta el vectorizador si aparece vocabulario nuevo"""
+        if self._position(lawyer['id']) is not None:
+            raise ValueError(f"El abogado {lawyer['id']} ya está en el índice")
+
+        row = dict(lawyer)
+        row.setdefault('available', True)
+        pos = len(self.lawyers_df)
+        import pandas as pd
+        self.lawyers_df = pd.concat([self.lawyers_df, pd.DataFrame([row])], ignore_index=True)
+        self._positions[str(row['id'])] = pos
+
+        # Vectorizar solo la nueva especialidad si todos sus términos ya están en el vocabulario
+        if self.specialty_vectors is not None and self._is_known_vocabulary(row['specialty']):
+            from scipy import sparse
+            new_vector = self.vectorizer.transform([row['specialty']])
+            self.specialty_vectors = sparse.vstack([self.specialty_vectors, new_vector], format='csr')
+            self._refresh_idf()
+        else:
+            self.specialty_vectors = self.vectorize_specialties()
+        self._engine = None
+
+        for column in NORMALIZED_COLUMNS:
+            low, high = self.feature_bounds.get(column, (None, None))
+            value = float(row[column])
+            if low is None or value < low or value > high:
+                self._normalize_column(column)
+            else:
+                self._normalize_value(pos, column)
+
+    def remove_lawyer(self, lawyer_id):
+        """Elimina un abogado del índice; solo reajusta el vectorizador si un término se queda sin abogados"""
+        pos = self._position(lawyer_id)
+        if pos is None:
+            return False
+
+        removed = self.lawyers_df.iloc[pos]
+        keep = np.ones(len(self.lawyers_df), dtype=bool)
+        keep[pos] = False
+        self.lawyers_df = self.lawyers_df.drop(index=pos).reset_index(drop=True)
+        if self.specialty_vectors is not None:
+            self.specialty_vectors = self.specialty_vectors[keep] if keep.any() else None
+            if self.specialty_vectors is not None:
+                self._refresh_idf()
+        self._rebuild_positions()
+        self._engine = None
+
+        # Solo si el abogado eliminado definía un límite cambia la normalización
+        for column in NORMALIZED_COLUMNS:
+            if float(removed[column]) in self.feature_bounds.get(column, ()):
+                self._normalize_column(column)
+        return True
+
+    def _refresh_idf(self):
+        """
+        Recalcula el IDF tras agregar o eliminar filas, como lo haría un reajuste completo.
+
+        Cada fila es tf * idf normalizada (L2): reescalarla por idf nuevo / idf
+        anterior y volver a normalizarla da el mismo vector que reajustar, sin
+        volver a tokenizar las especialidades. Si un término se queda sin
+        abogados el vocabulario cambia y sí se reajusta el vectorizador.
+        """
+        document_frequency = np.bincount(self.specialty_vectors.indices, minlength=len(self.vectorizer.idf_))
+        if not document_frequency.all():
+            self.specialty_vectors = self.vectorize_specialties()
+            return
+        from scipy import sparse
+        from sklearn.preprocessing import normalize
+        # Mismo IDF suavizado que TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+        rows = self.specialty_vectors.shape[0]
+        idf = np.log((1 + rows) / (1 + document_frequency)) + 1
+        scale = sparse.diags(idf / self.vectorizer.idf_)
+        self.specialty_vectors = normalize(sparse.csr_matrix(self.specialty_vectors @ scale), copy=False)
+        self.vectorizer.idf_ = idf
+
+    def set_availability(self, lawyer_id, available):
+        """Marca un abogado como disponible o no disponible"""
+        pos = self._position(lawyer_id)
+        if pos is None:
+            return False
+        self.lawyers_df.at[pos, 'available'] = bool(available)
+        self._engine_features_stale = True
+        return True
+
+    def update_rating(self, lawyer_id, rating):
+        """Actualiza en memoria la calificación de un abogado"""
+        pos = self._position(lawyer_id)
+        if pos is None:
+            return False
+        self._set_feature(pos, 'rating', float(rating))
+        return True
+
+    def upsert_lawyer(self, lawyer):
+        """
+        Agrega o actualiza un abogado; los no disponibles se retiran del índice.
+        Devuelve si el índice cambió (una fila idéntica a la indexada no lo cambia)
+        """
+        if not lawyer.get('available', True):
+            return self.remove_lawyer(lawyer['id'])
+        pos = self._position(lawyer['id'])
+        if pos is None:
+            self.add_lawyer(lawyer)
+            return True
+
+        current = self.lawyers_df.iloc[pos]
+        descriptive_columns = ('full_name', 'specialty', 'avatar_url')
+        if any(not _same_value(lawyer.get(column), current.get(column)) for column in descriptive_columns):
+            # Cambian datos que el motor guarda por fila: se reindexa el abogado
+            self.remove_lawyer(lawyer['id'])
+            self.add_lawyer(lawyer)
+            return True
+        changed = False
+        for column in NORMALIZED_COLUMNS:
+            if float(lawyer[column]) != float(current[column]):
+                self._set_feature(pos, column, float(lawyer[column]))
+                changed = True
+        return changed
+
+    def merge_cases(self, new_cases_df):
+        """Incorpora casos nuevos conservando solo los CASES_LIMIT más recientes; devuelve cuántos eran nuevos"""
+        if new_cases_df.empty:
+            return 0
+        import pandas as pd
+        known = set(self.cases_df['id']) if 'id' in self.cases_df.columns else set()
+        added = int((~new_cases_df['id'].isin(known)).sum())
+        cases_df = pd.concat([self.cases_df, new_cases_df], ignore_index=True)
+        cases_df = cases_df.drop_duplicates(subset='id', keep='last')
+        if 'created_at' in cases_df.columns:
+            cases_df = cases_df.sort_values('created_at', ascending=False)
+        self.cases_df = cases_df.head(CASES_LIMIT).reset_index(drop=True)
+        return added
+
+    def _is_known_vocabulary(self, text):
+        """Indica si todos los términos del texto ya están en el vocabulario del vectorizador"""
+        vocabulary = self.vectorizer.vocabulary_
+        return all(term in vocabulary for term in self.vectorizer.build_analyzer()(text))
+
+    def get_scoring_engine(self):
+        """Devuelve el motor de puntuación, reconstruyéndolo solo si el índice cambió"""
+        weights = self.ranking_weights or get_ranking_weights()
+        if self._engine is None:
+            self._engine = LawyerScoringEngine(self.lawyers_df, self.specialty_vectors, weights)
+        elif self._engine_features_stale or self._engine.weights != weights:
+            # Cambios de calificación, disponibilidad o pesos: basta con releer las columnas numéricas
+            self._engine.update_features(self.lawyers_df, weights)
+        self._engine_features_stale = False
+        return self._engine
+
     def get_case_vector(self, case_description):
         """Genera un vector para un caso específico"""
         # Transformar la descripción del caso usando el mismo vectorizador
-        return self.vectorizer.transform([case_description])
+        with span('lawyers.vectorize'):
+            return self.vectorizer.transform([case_description])
     
-    def recommend_lawyers(self, case_description, user_preferences=None, top_n=3):
-        """Recomienda abogados basados en la descripción del caso y preferencias del usuario"""
+    def get_sharded_scorer(self):
+        """Puntuador repartido entre procesos sobre el motor actual, o None si no está activado"""
+        if self.scoring_workers <= 0 or self.specialty_vectors is None:
+            return None
+        engine = self.get_scoring_engine()
+        if (self._sharded_scorer is None or self._sharded_scorer.engine is not engine
+                or self._sharded_scorer.workers != self.scoring_workers):
+            from ml_sharded_scoring import ShardedScorer
+            self.close_sharded_scorer()
+            shards = int(os.getenv("LAWYER_SCORING_SHARDS", "0")) or None
+            self._sharded_scorer = ShardedScorer(engine, self.scoring_workers, shards)
+        return self._sharded_scorer
+
+    def close_sharded_scorer(self):
+        if self._sharded_scorer is not None:
+            self._sharded_scorer.close()
+            self._sharded_scorer = None
+
+    def category_similarities(self, category):
+        """Afinidad precalculada de cada abogado con la categoría, o None si no está disponible"""
+        affinity = get_lawyer_affinity()
+        if affinity is None:
+            return None
+        engine = self.get_scoring_engine()
+        key = (affinity.built_at, category)
+        if key not in engine.affinity_columns:
+            engine.affinity_columns[key] = affinity.aligned_column(category, engine.ids)
+        return engine.affinity_columns[key]
+
+    def recommend_lawyers(self, case_description, user_preferences=None, top_n=3, category=None):
+        """
+        Recomienda abogados basados en la descripción del caso y preferencias del usuario.
+
+        Si se indica la categoría del caso y existe la matriz de afinidad
+        (ml_lawyer_affinity.py build), la similitud sale de esa tabla y no se
+        vectoriza la descripción.
+        """
         if self.lawyers_df.empty or self.specialty_vectors is None:
             return []
+
+        if category:
+            with span('lawyers.affinity'):
+                similarities = self.category_similarities(category)
+            if similarities is not None:
+                return self.get_scoring_engine().rank(similarities, user_preferences, top_n)
             
         # Vectorizar la descripción del caso
         case_vector = self.get_case_vector(case_description)
+
+        sharded_scorer = self.get_sharded_scorer()
+        if sharded_scorer is not None:
+            return sharded_scorer.rank(case_vector, user_preferences, top_n)
         
-        # Calcular similitud entre el caso y las especialidades de los abogados
-        similarities = cosine_similarity(case_vector, self.specialty_vectors).flatten()
-        
-        # Crear DataFrame con similitudes
-        recommendations_df = self.lawyers_df.copy()
-        recommendations_df['similarity'] = similarities
-        
-        # Filtrar solo abogados disponibles
-        recommendations_df = recommendations_df[recommendations_df['available'] == True]
-        
-        # Calcular puntuación combinada (similitud + rating + experiencia)
-        recommendations_df['score'] = (
-            0.5 * recommendations_df['similarity'] + 
-            0.3 * recommendations_df['normalized_rating'] + 
-            0.2 * recommendations_df['normalized_experience']
-        )
-        
-        # Aplicar preferencias del usuario si existen
-        if user_preferences:
-            if 'preferred_experience' in user_preferences and user_preferences['preferred_experience'] > 0:
-                min_exp = user_preferences['preferred_experience']
-                recommendations_df = recommendations_df[recommendations_df['experience_years'] >= min_exp]
-            
-            if 'preferred_rating' in user_preferences and user_preferences['preferred_rating'] > 0:
-                min_rating = user_preferences['preferred_rating']
-                recommendations_df = recommendations_df[recommendations_df['rating'] >= min_rating]
-        
-        # Ordenar por puntuación y obtener los top_n
-        recommendations_df = recommendations_df.sort_values('score', ascending=False).head(top_n)
-        
-        # Convertir a formato de salida
-        recommendations = []
-        for _, row in recommendations_df.iterrows():
-            recommendations.append({
-                'id': str(row['id']),
-                'full_name': row['full_name'],
-                'specialty': row['specialty'],
-                'experience_years': int(row['experience_years']),
-                'rating': float(row['rating']),
-                'similarity_score': float(row['similarity']),
-                'overall_score': float(row['score']),
-                'avatar_url': row['avatar_url']
-            })
-            
-        return recommendations
+        # Filtros de disponibilidad/preferencias primero; similitud y puntuación combinada
+        # solo de los candidatos y selección parcial de los top_n; solo esas filas se
+        # convierten al formato de salida
+        return self.get_scoring_engine().rank_case(case_vector, user_preferences, top_n)
     
-    def update_lawyer_rating(self, lawyer_id, new_rating):
-        """Actualiza la calificación de un abogado en la base de datos"""
-        if self.conn:
-            try:
-                cursor = self.conn.cursor()
-                cursor.execute(
-                    "UPDATE lawyers SET rating = (rating + %s) / 2 WHERE id = %s RETURNING rating",
-                    (new_rating, lawyer_id)
-                )
-                updated_rating = cursor.fetchone()[0]
-                self.conn.commit()
-                cursor.close()
-                
-                # Actualizar también en el DataFrame local
-                idx = self.lawyers_df.index[self.lawyers_df['id'] == lawyer_id].tolist()
-                if idx:
-                    self.lawyers_df.at[idx[0], 'rating'] = updated_rating
-                    # Re-normalizar ratings
-                    self.lawyers_df[['normalized_rating', 'normalized_experience']] = self.scaler.fit_transform(
-                        self.lawyers_df[['rating', 'experience_years']])
-                
-                return updated_rating
-            except Exception as e:
-                print(f"Error actualizando calificación: {e}")
-                self.conn.rollback()
-        return None
+    def recommend_lawyers_batch(self, cases, preferences=None, top_n=3):
+        """
+        Recomienda abogados para muchos casos a la vez.
+
+        `preferences` puede ser un diccionario común a todos los casos o una
+        lista con las preferencias de cada caso. Devuelve una lista de
+        recomendaciones por caso, con el mismo formato que recommend_lawyers.
+        """
+        cases = list(cases)
+        if not cases:
+            return []
+        if self.lawyers_df.empty or self.specialty_vectors is None:
+            return [[] for _ in cases]
+        preferences_list = _preferences_list(preferences, len(cases))
+
+        # Un único transform para todos los casos
+        with span('lawyers.vectorize'):
+            case_vectors = self.vectorizer.transform(cases)
+        sharded_scorer = self.get_sharded_scorer()
+        if sharded_scorer is not None:
+            return sharded_scorer.rank_batch(case_vectors, preferences_list, top_n)
+        return self.get_scoring_engine().rank_batch(case_vectors, preferences_list, top_n)
+
+    def iter_recommend_lawyers_batch(self, cases, preferences=None, top_n=3):
+        """
+        Como recommend_lawyers_batch, pero vectoriza y puntúa por bloques de
+        CASE_CHUNK_SIZE casos y entrega las recomendaciones de cada caso en
+        cuanto su bloque está listo (salida en streaming).
+        """
+        cases = list(cases)
+        if self.lawyers_df.empty or self.specialty_vectors is None:
+            yield from ([] for _ in cases)
+            return
+        preferences_list = _preferences_list(preferences, len(cases))
+
+        for start in range(0, len(cases), CASE_CHUNK_SIZE):
+            with span('lawyers.vectorize'):
+                case_vectors = self.vectorizer.transform(cases[start:start + CASE_CHUNK_SIZE])
+            preferences_block = preferences_list[start:start + CASE_CHUNK_SIZE]
+            sharded_scorer = self.get_sharded_scorer()
+            if sharded_scorer is not None:
+                yield from sharded_scorer.rank_batch(case_vectors, preferences_block, top_n)
+            else:
+                yield from self.get_scoring_engine().iter_rank_batch(case_vectors, preferences_block, top_n)
+
+    def update_lawyer_rating(self, lawyer_id, new_rating, rating_store=None):
+        """
+        Registra una calificación de un abogado y devuelve su nueva media.
+
+        El voto se acumula en el almacén de calificaciones, que lo vuelca a la
+        base de datos en lotes (ver ml_rating_store); la media exacta se aplica
+        de inmediato al índice local, sin renormalizar todo. Mientras los
+        agregados no se hayan cargado, el voto se registra pero la media
+        devuelta es None y el índice no cambia.
+        """
+        from ml_rating_store import lawyer_key
+
+        lawyer_id = lawyer_key(lawyer_id)
+        if self._position(lawyer_id) is None:
+            raise ValueError(f"Abogado desconocido: {lawyer_id}")
+        rating_store = rating_store or get_rating_store()
+        mean = rating_store.add(lawyer_id, new_rating)
+        if mean is not None:
+            self.update_rating(lawyer_id, mean)
+        return mean
+
+    def apply_rating_updates(self, rating_store):
+        """Aplica las medias de los agregados volcados (incluidos votos de otros procesos)"""
+        for lawyer_id, mean in rating_store.drain_updates().items():
+            if mean is not None:
+                self.update_rating(lawyer_id, mean)
     
     def close(self):
-        """Cierra la conexión a la base de datos"""
+        """Devuelve la conexión al pool y detiene el puntuador repartido, si lo hay"""
+        self.close_sharded_scorer()
         if self.conn:
-            self.conn.close()
+            release_connection(self.conn)
+            self.conn = None
 
-# Función para procesar una solicitud de recomendación
-def process_recommendation_request(request_json):
-    try:
-        # Parsear la solicitud JSON
-        request_data = json.loads(request_json)
-        case_description = request_data.get('case_description', '')
-        user_preferences = request_data.get('user_preferences', {})
-        
-        # Inicializar el recomendador
+# Función para procesar una solicitud de recomendación ya decodificada
+def handle_recommendation_request(request_data, recommender=None):
+    """Atiende una solicitud de recomendación; reutiliza el recomendador si se proporciona"""
+    case_description = request_data.get('case_description', '')
+    user_preferences = request_data.get('user_preferences', {})
+    top_n = int(request_data.get('top_n', 3))
+    if top_n <= 0:
+        return {'status': 'success', 'recommendations': []}
+
+    # Inicializar el recomendador solo si no hay uno residente
+    owns_recommender = recommender is None
+    if owns_recommender:
         recommender = LawyerRecommender()
-        
+
+    try:
         # Obtener recomendaciones
         recommendations = recommender.recommend_lawyers(
             case_description=case_description,
             user_preferences=user_preferences,
-            top_n=3
+            top_n=top_n,
+            category=request_data.get('category')
         )
-        
-        # Cerrar conexión
-        recommender.close()
-        
+    finally:
+        # Cerrar conexión solo si el recomendador es de esta solicitud
+        if owns_recommender:
+            recommender.close()
+
+    return {
+        'status': 'success',
+        'recommendations': recommendations
+    }
+
+# Función para procesar una solicitud de recomendación
+def process_recommendation_request(request_json):
+    try:
+        # Parsear la solicitud JSON
+        request_data = json.loads(request_json)
+
         # Devolver resultado como JSON
-        return json.dumps({
-            'status': 'success',
-            'recommendations': recommendations
-        })
+        return json.dumps(handle_recommendation_request(request_data))
     except Exception as e:
         return json.dumps({
             'status': 'error',
             'message': str(e)
         })
 
+def stream_recommendation_request(request_data, stream):
+    """
+    Atiende una solicitud en streaming (ml_worker.NdjsonStream): encabezado
+    con los tiempos en cuanto el modelo está listo, luego cada recomendación
+    en orden (o, con "cases", las de cada caso en cuanto se puntúa su bloque)
+    y un cierre con los tiempos totales.
+    """
+    user_preferences = request_data.get('user_preferences', {})
+    top_n = int(request_data.get('top_n', 3))
+    cases = request_data.get('cases')
+    recommender = LawyerRecommender()
+    try:
+        trace = current_trace()
+        stream.header(timings=trace.to_dict() if trace else None,
+                      cases=len(cases) if cases is not None else None)
+        if cases is not None:
+            results = recommender.iter_recommend_lawyers_batch(cases, request_data.get('preferences'), top_n)
+            for case, recommendations in enumerate(results):
+                stream.record({'case': case, 'recommendations': recommendations}, 'result')
+        else:
+            recommendations = recommender.recommend_lawyers(
+                case_description=request_data.get('case_description', ''),
+                user_preferences=user_preferences,
+                top_n=top_n,
+                category=request_data.get('category')
+            )
+            for rank, recommendation in enumerate(recommendations, 1):
+                stream.record(dict(recommendation, rank=rank))
+    finally:
+        recommender.close()
+    stream.end(timings=trace.to_dict() if trace else None)
+
+def main(argv):
+    """
+    CLI de un solo uso. La solicitud llega como JSON en el primer argumento,
+    por stdin ("-") o por un descriptor (--input-fd N); --stream emite NDJSON
+    (encabezado, recomendaciones, cierre) y --timing informa los tiempos en stderr.
+    """
+    from ml_worker import NdjsonStream, parse_cli_args, read_request
+
+    arg, options = parse_cli_args(argv)
+    with RequestTrace('cli') as trace:
+        if options['stream']:
+            stream = NdjsonStream()
+            try:
+                stream_recommendation_request(json.loads(read_request(arg, options['input_fd'])), stream)
+            except Exception as e:
+                log_exception("Error atendiendo solicitud en streaming")
+                stream.fail(str(e))
+                trace.status = 'error'
+        else:
+            print(process_recommendation_request(read_request(arg, options['input_fd'])))
+    if options['timing']:
+        report_timing('ml_lawyer_recommender', _STARTED, trace)
+    if trace.status == 'error':
+        sys.exit(1)
+
+class RecommenderService:
+    """
+    Mantiene un LawyerRecommender ajustado en memoria para atender
+    solicitudes sin pagar el arranque en frío en cada una
+    """
+
+    def __init__(self, snapshot_store=None, delta_sync=None, cases_store=None):
+        self.snapshot_store = snapshot_store or get_snapshot_store()
+        self.cases_store = cases_store or get_cases_store()
+        # Con sincronización incremental, tras la carga inicial solo se traen los cambios
+        self.delta_sync = delta_sync
+        self._use_snapshot(self.snapshot_store.get())
+
+    def _use_snapshot(self, snapshot):
+        previous = getattr(self, 'recommender', None)
+        cases = self.cases_store.get()
+        self.recommender = LawyerRecommender.from_snapshot(snapshot, cases)
+        if previous is not None:
+            # Sin conexión propia: solo libera el pool y la memoria del puntuador repartido
+            previous.close()
+        if _rating_store is not None:
+            # La instantánea trae lawyers.rating redondeada: prevalece la media exacta
+            for lawyer_id, mean in _rating_store.means_for(self.recommender.lawyers_df['id']).items():
+                self.recommender.update_rating(lawyer_id, mean)
+        if self.delta_sync is not None:
+            self.delta_sync.reset(snapshot.marker, _latest_case(cases.data['cases']))
+
+    def current_recommender(self):
+        """Devuelve el recomendador al día con la base de datos"""
+        if self.delta_sync is not None:
+            self.delta_sync.maybe_sync(self.recommender, reload=self.reload, rating_store=_rating_store)
+        else:
+            # Sin sincronización incremental: reconstruir si la instantánea cambió de versión
+            snapshot = self.snapshot_store.get()
+            if snapshot.version != self.recommender.snapshot_version:
+                self._use_snapshot(snapshot)
+            # Los casos se reemplazan sin reajustar el recomendador
+            cases = self.cases_store.get()
+            if cases.version != self.recommender.cases_version:
+                self.recommender.cases_df = cases.data['cases']
+                self.recommender.cases_version = cases.version
+        # Después de sincronizar: la media exacta prevalece sobre la redondeada de lawyers.rating
+        if _rating_store is not None:
+            self.recommender.apply_rating_updates(_rating_store)
+        return self.recommender
+
+    def reload(self):
+        """Fuerza una nueva instantánea con los datos actuales de la base de datos"""
+        snapshot = self.snapshot_store.refresh(expected=self.snapshot_store.get())
+        # Si la carga falló se conserva la instantánea vigente: no hay nada que reconstruir
+        if snapshot.version != self.recommender.snapshot_version:
+            self._use_snapshot(snapshot)
+
+    def handle(self, request_data):
+        """Despacha una solicitud según su operación ('recommend' por defecto)"""
+        op = request_data.get('op', 'recommend')
+        if op in ('recommend', 'recommend_batch'):
+            self.current_recommender()
+        if op == 'recommend':
+            return handle_recommendation_request(request_data, self.recommender)
+        if op == 'recommend_batch':
+            results = self.recommender.recommend_lawyers_batch(
+                request_data.get('cases', []),
+                request_data.get('preferences'),
+                int(request_data.get('top_n', 3))
+            )
+            return {'status': 'success', 'results': results}
+        if op == 'reload':
+            self.reload()
+            return {'status': 'success'}
+        if op == 'sync':
+            if self.delta_sync is None:
+                return {'status': 'error', 'message': "La sincronización incremental no está activa"}
+            self.delta_sync.sync(self.recommender, reload=self.reload, rating_store=_rating_store)
+            return {'status': 'success', 'sync': self.delta_sync.stats}
+        if op == 'sync_stats':
+            return {'status': 'success', 'sync': self.delta_sync.stats if self.delta_sync else None}
+        if op == 'add_lawyer':
+            self.recommender.add_lawyer(request_data['lawyer'])
+            return {'status': 'success'}
+        if op == 'remove_lawyer':
+            return {'status': 'success', 'updated': self.recommender.remove_lawyer(request_data['lawyer_id'])}
+        if op == 'set_availability':
+            updated = self.recommender.set_availability(request_data['lawyer_id'], request_data['available'])
+            return {'status': 'success', 'updated': updated}
+        if op == 'update_rating':
+            updated = self.recommender.update_rating(request_data['lawyer_id'], request_data['rating'])
+            return {'status': 'success', 'updated': updated}
+        if op == 'rate':
+            rating = self.recommender.update_lawyer_rating(request_data['lawyer_id'], request_data['rating'])
+            return {'status': 'success', 'rating': rating}
+        if op == 'rating_stats':
+            rating_store = _rating_store
+            return {
+                'status': 'success',
+                'ratings': dict(rating_store.stats, pending=rating_store.pending_votes) if rating_store else None
+            }
+        if op == 'ping':
+            return {
+                'status': 'success',
+                'lawyers': len(self.recommender.lawyers_df),
+                'snapshot_version': self.recommender.snapshot_version
+            }
+        return {'status': 'error', 'message': f"Operación desconocida: {op}"}
+
+    def close(self):
+        self.recommender.close()
+        if _rating_store is not None:
+            _rating_store.close()
+        close_pool()
+
+def run_server(argv):
+    """Ejecuta el recomendador como proceso residente (NDJSON por stdin/stdout o HTTP)"""
+    from ml_sync import DeltaSync
+    from ml_worker import serve_http, serve_ndjson
+
+    # El proceso residente crea el pool (y lee SNAPSHOT_TTL, etc.) al cargar la primera instantánea
+    load_env()
+    delta_sync = DeltaSync(cases_limit=CASES_LIMIT) if '--delta-sync' in argv else None
+    service = RecommenderService(delta_sync=delta_sync)
+    try:
+        if argv[0] == '--http':
+            address = argv[1] if len(argv) > 1 and not argv[1].startswith('--') else '8765'
+            host, _, port = address.rpartition(':')
+            serve_http(service.handle, host or '127.0.0.1', int(port))
+        else:
+            serve_ndjson(service.handle)
+    finally:
+        service.close()
+
 # Punto de entrada para ejecución directa
 if __name__ == "__main__":
     # Si se ejecuta directamente, procesar argumentos de línea de comandos
-    import sys
-    
-    if len(sys.argv) > 1:
-        # El primer argumento es el JSON de solicitud
-        result = process_recommendation_request(sys.argv[1])
-        print(result)
+    if len(sys.argv) > 1 and sys.argv[1] in ('--serve', '--http'):
+        # Modo servidor: el modelo se carga una sola vez y atiende muchas solicitudes
+        run_server(sys.argv[1:])
+    elif len(sys.argv) > 1 and sys.argv[1:] != ['--timing']:
+        # Solicitud de un solo uso (ver main: argumento JSON, stdin o descriptor)
+        main(sys.argv[1:])
     else:
         # Ejemplo de uso
         recommender = LawyerRecommender()
@@ -0,0 +1,295 @@
+"""
+Instrumentación de los scripts de ML: tramos cronometrados, métricas,
+logs estructurados y perfilado por solicitud.
+
+- span("lawyers.similarity"): cronometra un tramo. La duración se acumula
+  en un histograma del registro del proceso y, si hay una solicitud en
+  curso en el hilo, en su traza.
+- RequestTrace(op): traza de una solicitud (tramos, duración, estado),
+  contador e histograma por operación; opcionalmente la perfila con cProfile.
+- REGISTRY.render(): métricas en formato de texto de Prometheus;
+  start_metrics_server(port) las expone en GET /metrics.
+- log_event / log_exception: logs en stderr, en JSON si ML_LOG_FORMAT=json.
+
+Variables de entorno:
+    ML_METRICS=off        desactiva los tramos (costo casi nulo)
+    ML_LOG_FORMAT=json    logs estructurados (por defecto texto)
+    ML_REQUEST_LOG=1      registra cada solicitud con sus tramos
+    ML_PROFILE_RATE=0.01  fracción de solicitudes perfiladas al azar
+    ML_PROFILE_DIR=DIR    guarda los perfiles (.prof) en DIR
+"""
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+# Límites de los histogramas, en segundos
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ENABLED = os.getenv("ML_METRICS", "on").lower() not in ('0', 'off', 'false')
+LOG_JSON = os.getenv("ML_LOG_FORMAT", "text").lower() == 'json'
+REQUEST_LOG = os.getenv("ML_REQUEST_LOG", "0").lower() in ('1', 'on', 'true')
+PROFILE_RATE = float(os.getenv("ML_PROFILE_RATE", "0"))
+PROFILE_DIR = os.getenv("ML_PROFILE_DIR")
+
+# Líneas del informe de cProfile devuelto en la respuesta
+PROFILE_TOP = 25
+
+
+class MetricsRegistry:
+    """Contadores e histogramas del proceso, con etiquetas"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        self.observe_key((name, labels), seconds)
+
+    def observe_key(self, key, seconds):
+        """observe() con la clave (nombre, etiquetas) ya construida"""
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Conteos por límite (más uno para +Inf), suma y total
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def snapshot(self):
+        """Copia serializable (JSON/pickle) de todas las métricas"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(counts), total, count]
+                               for (name, labels), (counts, total, count) in self._histograms.items()]
+            }
+
+    def merge(self, snapshot):
+        """Suma las métricas de otro proceso (p. ej. un fragmento del servidor del chatbot)"""
+        with self._lock:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                histogram = self._histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+
+    def render(self):
+        """Métricas en formato de texto de Prometheus"""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for name, labels, value in sorted(snapshot['counters'], key=lambda item: (item[0], item[1])):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, labels, counts, total, count in sorted(snapshot['histograms'], key=lambda item: (item[0], item[1])):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + escaped + '}'
+
+
+REGISTRY = MetricsRegistry()
+
+# Traza de la solicitud en curso en cada hilo
+_local = threading.local()
+
+# Claves del histograma de tramos, construidas una vez por nombre
+_span_keys = {}
+
+
+class span:
+    """Cronometra un tramo: `with span("lawyers.similarity"): ...`"""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if ENABLED else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is None:
+            return False
+        elapsed = time.perf_counter() - self.start
+        key = _span_keys.get(self.name)
+        if key is None:
+            key = _span_keys[self.name] = ('ml_span_seconds', (('span', self.name),))
+        REGISTRY.observe_key(key, elapsed)
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace.spans.append((self.name, elapsed))
+        return False
+
+
+def current_trace():
+    """Traza de la solicitud en curso en este hilo (None si no hay)"""
+    return getattr(_local, 'trace', None)
+
+
+class RequestTrace:
+    """
+    Traza de una solicitud: tramos del hilo, duración total y estado.
+
+    Con `profile=True` (o al azar según ML_PROFILE_RATE) la solicitud se
+    ejecuta bajo cProfile; el informe queda en `profile_report` y, si
+    ML_PROFILE_DIR está definido, el perfil completo se guarda en disco.
+    """
+
+    def __init__(self, op, request_id=None, profile=False):
+        self.op = str(op)
+        self.request_id = request_id
+        self.status = 'success'
+        self.spans = []
+        self.duration = 0.0
+        self.profile_requested = bool(profile)
+        self.profile_report = None
+        self._profiler = None
+        self._parent = None
+        self._start = None
+
+    def __enter__(self):
+        self._parent = getattr(_local, 'trace', None)
+        _local.trace = self
+        if self.profile_requested or (PROFILE_RATE > 0 and random.random() < PROFILE_RATE):
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._finish_profile()
+        _local.trace = self._parent
+        if exc_type is not None:
+            self.status = 'error'
+
+        labels = (('op', self.op),)
+        REGISTRY.inc('ml_requests_total', labels + (('status', self.status),))
+        REGISTRY.observe('ml_request_seconds', self.duration, labels)
+        if REQUEST_LOG:
+            log_event('request', op=self.op, id=self.request_id, status=self.status, **self.to_dict())
+        return False
+
+    def to_dict(self):
+        """
+        Duración total y por tramo, en milisegundos (los tramos repetidos se
+        suman); con la solicitud aún en curso, el total es el tiempo transcurrido.
+        """
+        spans = {}
+        for name, elapsed in self.spans:
+            spans[name] = spans.get(name, 0.0) + elapsed * 1000
+        duration = self.duration
+        if not duration and self._start is not None:
+            duration = time.perf_counter() - self._start
+        return {'total_ms': duration * 1000, 'spans': spans}
+
+    def _finish_profile(self):
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{self.op}-{time.time():.6f}-{os.getpid()}.prof")
+            self._profiler.dump_stats(path)
+            log_event('profile', op=self.op, id=self.request_id, path=path)
+        if self.profile_requested:
+            import io
+            import pstats
+            output = io.StringIO()
+            pstats.Stats(self._profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            self.profile_report = output.getvalue()
+
+
+def log_event(event, level='info', **fields):
+    """Escribe un evento en stderr (JSON de una línea si ML_LOG_FORMAT=json)"""
+    if LOG_JSON:
+        record = {'ts': time.time(), 'level': level, 'event': event, 'pid': os.getpid()}
+        record.update(fields)
+        line = json.dumps(record, default=str)
+    else:
+        details = ' '.join(f"{key}={value}" for key, value in fields.items())
+        line = f"[{level}] {event} {details}".rstrip()
+    sys.stderr.write(line + '\n')
+    sys.stderr.flush()
+
+
+def report_timing(script, started, trace):
+    """
+    Informe de --timing de un CLI de un solo uso: importación del módulo
+    (desde `started`, tomado antes de sus imports), tramos de la traza
+    (incluidas las importaciones diferidas) y total del proceso desde `started`.
+    """
+    log_event('timing', script=script, imports_ms=round((trace._start - started) * 1000, 2),
+              total_ms=round((time.perf_counter() - started) * 1000, 2),
+              spans={name: round(ms, 2) for name, ms in trace.to_dict()['spans'].items()})
+
+
+def log_exception(event, **fields):
+    """Registra la excepción en curso con su traza"""
+    import traceback
+    error_type, error, _ = sys.exc_info()
+    log_event(event, level='error', error=f"{error_type.__name__}: {error}" if error_type else None,
+              traceback=traceback.format_exc(), **fields)
+
+
+def start_metrics_server(port, host='127.0.0.1', render=None):
+    """Expone GET /metrics (Prometheus) en un hilo en segundo plano"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    render = render or REGISTRY.render
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='ml-metrics', daemon=True).start()
+    log_event('metrics_server', url=f"http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,243 @@
+"""
+Caché de modelos TF-IDF por categoría para el recomendador de preguntas.
+
+Cada entrada guarda el vocabulario, la matriz de frecuencias de términos y
+la matriz TF-IDF de una lista de preguntas, con clave en el hash de su
+contenido:
+
+- Acierto exacto: se reutiliza la matriz sin volver a ajustar.
+- La lista difiere de una cacheada en una sola pregunta al final o al
+  inicio: solo esa pregunta se tokeniza; su fila se agrega a las
+  frecuencias (con sus términos nuevos en el vocabulario) y el IDF se
+  recalcula sobre todas las filas. El resultado es el mismo que ajustar
+  un TfidfVectorizer nuevo (salvo el orden de las columnas).
+- Fallo: se cuentan los términos de todas las preguntas.
+
+En memoria se aplica LRU con un presupuesto de bytes; opcionalmente las
+entradas se persisten en disco (joblib) y sobreviven reinicios. El
+directorio en disco también tiene un presupuesto de bytes: al superarlo se
+eliminan los archivos usados hace más tiempo (cada acierto en disco
+actualiza la fecha de modificación del archivo).
+"""
+import hashlib
+import os
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+from scipy import sparse
+
+from ml_metrics import log_exception
+from ml_text import analyze
+
+# Estimación del costo en memoria de cada término del vocabulario (clave + entrada de dict)
+_VOCABULARY_TERM_BYTES = 120
+
+# Versión del formato en disco (forma parte del nombre del archivo)
+_DISK_FORMAT = 2
+
+
+def content_key(questions):
+    """Hash estable del contenido y orden de una lista de preguntas"""
+    digest = hashlib.sha1()
+    for question in questions:
+        digest.update(question.encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def count_terms(questions, vocabulary):
+    """Frecuencias de términos (CSR) de las preguntas; agrega al vocabulario los términos nuevos"""
+    indptr = [0]
+    indices = []
+    data = []
+    for question in questions:
+        counts = {}
+        for term in analyze(question):
+            column = vocabulary.setdefault(term, len(vocabulary))
+            counts[column] = counts.get(column, 0) + 1
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32),
+                              np.asarray(indptr, dtype=np.int64)), shape=(len(questions), len(vocabulary)))
+
+
+def tfidf_from_counts(counts):
+    """TF-IDF normalizado L2 con el IDF de las filas dadas (como TfidfVectorizer por defecto)"""
+    documents = counts.shape[0]
+    document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1 + documents) / (1 + document_frequency)) + 1
+    tfidf = counts.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(tfidf).tocsr()
+
+
+class CategoryModel:
+    """Vocabulario, frecuencias y matriz TF-IDF de una lista de preguntas"""
+
+    def __init__(self, vocabulary, counts):
+        self.vocabulary = vocabulary
+        self.counts = counts
+        self.matrix = tfidf_from_counts(counts)
+        self.nbytes = (sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (counts, self.matrix)) +
+                       len(vocabulary) * _VOCABULARY_TERM_BYTES)
+
+    @classmethod
+    def fit(cls, questions):
+        vocabulary = {}
+        counts = count_terms(questions, vocabulary)
+        if not vocabulary:
+            # Como TfidfVectorizer: sin términos no hay modelo
+            raise ValueError("Vocabulario vacío: las preguntas solo contienen stopwords")
+        return cls(vocabulary, counts)
+
+    def extended(self, question, at_start=False):
+        """Modelo con una pregunta más al final (o al inicio), con el IDF recalculado"""
+        # Copia del vocabulario: el modelo base sigue en la caché
+        vocabulary = dict(self.vocabulary)
+        row = count_terms([question], vocabulary)
+        base = self.counts
+        base = sparse.csr_matrix((base.data, base.indices, base.indptr), shape=(base.shape[0], len(vocabulary)))
+        rows = [row, base] if at_start else [base, row]
+        return CategoryModel(vocabulary, sparse.vstack(rows, format='csr'))
+
+
+class TfidfModelCache:
+    """Caché LRU de modelos TF-IDF con presupuesto de memoria y almacén opcional en disco"""
+
+    def __init__(self, max_bytes=None, cache_dir=None, max_disk_bytes=None):
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else os.getenv("QUESTION_MODEL_CACHE_BYTES", str(64 * 1024 * 1024)))
+        self.cache_dir = cache_dir if cache_dir is not None else os.getenv("QUESTION_MODEL_CACHE_DIR")
+        self.max_disk_bytes = int(max_disk_bytes if max_disk_bytes is not None
+                                  else os.getenv("QUESTION_MODEL_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'appends': 0, 'fits': 0, 'evictions': 0,
+                      'disk_evictions': 0}
+
+    def get_matrix(self, questions):
+        """Matriz TF-IDF de las preguntas (una fila por pregunta, en el mismo orden)"""
+        questions = list(questions)
+        key = content_key(questions)
+
+        model = self._get(key)
+        if model is not None:
+            self.stats['hits'] += 1
+            return model.matrix
+
+        model = self._load_from_disk(key)
+        if model is not None:
+            self.stats['disk_hits'] += 1
+            self._put(key, model)
+            return model.matrix
+
+        model = self._extend(questions)
+        if model is not None:
+            self.stats['appends'] += 1
+        else:
+            model = CategoryModel.fit(questions)
+            self.stats['fits'] += 1
+
+        self._put(key, model)
+        self._save_to_disk(key, model)
+        return model.matrix
+
+    def _extend(self, questions):
+        """Reutiliza un modelo que difiere en una sola pregunta al final o al inicio"""
+        if len(questions) < 2:
+            return None
+
+        base = self._get(content_key(questions[:-1]))
+        if base is not None:
+            return base.extended(questions[-1])
+
+        base = self._get(content_key(questions[1:]))
+        if base is not None:
+            return base.extended(questions[0], at_start=True)
+        return None
+
+    def _get(self, key):
+        model = self._entries.get(key)
+        if model is not None:
+            self._entries.move_to_end(key)
+        return model
+
+    def _put(self, key, model):
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key).nbytes
+        self._entries[key] = model
+        self.current_bytes += model.nbytes
+        # Expulsar las entradas menos recientes hasta volver al presupuesto
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            self.stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.v{_DISK_FORMAT}.joblib")
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            vocabulary, counts = joblib.load(path)
+            model = CategoryModel(vocabulary, counts)
+        except Exception:
+            log_exception("Error leyendo modelo cacheado", path=path)
+            return None
+        try:
+            # Uso reciente para el LRU en disco
+            os.utime(path)
+        except OSError:
+            pass
+        return model
+
+    def _save_to_disk(self, key, model):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        # Escritura atómica: otros procesos nunca leen un archivo a medias
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            joblib.dump((model.vocabulary, model.counts), tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            log_exception("Error guardando modelo cacheado", path=path)
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """Elimina los archivos usados hace más tiempo hasta volver al presupuesto en disco"""
+        files = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            # También los de formatos anteriores; los temporales en curso no
+            if not entry.name.endswith('.joblib'):
+                continue
+            try:
+                info = entry.stat()
+            except OSError:
+                continue
+            files.append((info.st_mtime, info.st_size, entry.path))
+            total += info.st_size
+        if total <= self.max_disk_bytes:
+            return
+        files.sort()
+        # El archivo recién escrito (el más reciente) se conserva aunque supere el presupuesto
+        for _, size, path in files[:-1]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats['disk_evictions'] += 1
+            if total <= self.max_disk_bytes:
+                break
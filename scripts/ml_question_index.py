@@ -0,0 +1,297 @@
+"""
+Índice global de preguntas similares sobre legal_questions y user_questions.
+
+El índice se construye por lotes y se guarda como arreglos NumPy que se
+cargan con memoria mapeada (np.load(mmap_mode='r')), de modo que varios
+procesos comparten las mismas páginas y la carga es casi instantánea:
+
+- La matriz TF-IDF en formato CSC (una columna por término): una consulta
+  solo recorre las listas de los términos que contiene.
+- Los textos de preguntas y respuestas en un bloque UTF-8 con offsets;
+  solo se decodifican los resultados devueltos.
+
+Cada construcción escribe un directorio de versión nuevo (temporal y luego
+renombrado) y después reemplaza meta.json de forma atómica, como
+ml_lawyer_affinity: los procesos que tienen mapeada la versión anterior no
+ven cambiar sus archivos.
+
+Las preguntas de usuarios se indexan sin user_id y con datos personales
+(correos, teléfonos, documentos) reemplazados.
+
+Uso:
+    python scripts/ml_question_index.py build [--output DIR]
+    python scripts/ml_question_index.py query "¿cómo solicito pensión?" [--index DIR] [-k 5]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+
+from ml_metrics import log_event, log_exception
+from ml_text import analyze
+
+# psycopg2 y scikit-learn solo se importan al construir: las consultas no los necesitan
+
+DEFAULT_INDEX_DIR = os.getenv(
+    "QUESTION_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "question_index")
+)
+
+SOURCES = ['legal_questions', 'user_questions']
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_LONG_NUMBER_RE = re.compile(r"\+?\d[\d\s-]{5,}\d")
+
+
+def anonymize(text):
+    """Reemplaza correos y números largos (teléfonos, documentos) por marcadores"""
+    text = _EMAIL_RE.sub("[correo]", text)
+    return _LONG_NUMBER_RE.sub("[numero]", text)
+
+
+def load_corpus(conn):
+    """Preguntas frecuentes con respuesta y preguntas de usuarios (distintas, sin user_id)"""
+    if conn:
+        try:
+            from psycopg2.extras import RealDictCursor
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("SELECT question, answer, category FROM legal_questions")
+            legal = [dict(row, source='legal_questions') for row in cursor.fetchall()]
+            cursor.execute("""
+                SELECT DISTINCT question, category
+                FROM user_questions
+            """)
+            users = [{'question': anonymize(row['question']), 'answer': None, 'category': row['category'],
+                      'source': 'user_questions'} for row in cursor.fetchall()]
+            cursor.close()
+            return legal + users
+        except Exception:
+            log_exception("Error cargando preguntas")
+
+    # Fallback a datos de ejemplo si hay error
+    log_event("Usando datos de ejemplo para preguntas", level='warning')
+    return [
+        {'question': '¿Qué derechos tengo como persona con discapacidad motriz en el ámbito laboral?',
+         'answer': 'Tienes derecho a adaptaciones razonables en tu puesto de trabajo y protección contra la discriminación.',
+         'category': 'laboral', 'source': 'legal_questions'},
+        {'question': '¿Cómo puedo solicitar una pensión por discapacidad?',
+         'answer': 'Necesitas un certificado médico, la calificación de pérdida de capacidad laboral y presentar la solicitud ante tu fondo de pensiones.',
+         'category': 'pensiones', 'source': 'legal_questions'},
+        {'question': '¿Qué es la legítima ampliada y cómo me beneficia?',
+         'answer': 'Es una protección patrimonial que aumenta la porción de la herencia que corresponde a la persona con discapacidad.',
+         'category': 'herencias', 'source': 'legal_questions'},
+        {'question': '¿Qué puedo hacer si un edificio público no tiene accesibilidad?',
+         'answer': 'Puedes presentar una queja formal, interponer una acción de tutela o denunciar ante la Procuraduría.',
+         'category': 'accesibilidad', 'source': 'legal_questions'},
+        {'question': '¿Cómo puedo certificar oficialmente mi discapacidad?',
+         'answer': 'Solicita una valoración por un equipo multidisciplinario autorizado y presenta tu historia clínica.',
+         'category': 'certificación', 'source': 'legal_questions'},
+    ]
+
+
+def _write_texts(path_prefix, texts):
+    """Guarda textos como un bloque UTF-8 más un arreglo de offsets"""
+    encoded = [(text or '').encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in encoded], out=offsets[1:])
+    with open(f"{path_prefix}.bin", 'wb') as handle:
+        for chunk in encoded:
+            handle.write(chunk)
+    np.save(f"{path_prefix}_offsets.npy", offsets)
+
+
+def _write_arrays(array_dir, rows, matrix, idf, category_ids):
+    """Escribe los arreglos y textos del índice en `array_dir`"""
+    np.save(os.path.join(array_dir, 'matrix_data.npy'), matrix.data)
+    np.save(os.path.join(array_dir, 'matrix_indices.npy'), matrix.indices)
+    np.save(os.path.join(array_dir, 'matrix_indptr.npy'), matrix.indptr)
+    np.save(os.path.join(array_dir, 'idf.npy'), idf.astype(np.float32))
+    np.save(os.path.join(array_dir, 'category_ids.npy'),
+            np.array([category_ids[row['category'] or 'general'] for row in rows], dtype=np.int32))
+    np.save(os.path.join(array_dir, 'source_ids.npy'),
+            np.array([SOURCES.index(row['source']) for row in rows], dtype=np.int8))
+    _write_texts(os.path.join(array_dir, 'questions'), [row['question'] for row in rows])
+    _write_texts(os.path.join(array_dir, 'answers'), [row.get('answer') for row in rows])
+
+
+def build_index(rows, output_dir):
+    """Ajusta TF-IDF sobre todo el corpus y publica una versión nueva del índice"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(analyzer=analyze, dtype=np.float32)
+    matrix = vectorizer.fit_transform([row['question'] for row in rows]).tocsc()
+    matrix.sort_indices()
+    categories = sorted({row['category'] or 'general' for row in rows})
+    category_ids = {category: i for i, category in enumerate(categories)}
+
+    built_at = time.time()
+    version = f"{time.time_ns()}-{os.getpid()}"
+    os.makedirs(output_dir, exist_ok=True)
+    # Los arreglos van a un directorio temporal que se renombra: nunca se sobrescribe un archivo mapeado
+    tmp_dir = os.path.join(output_dir, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    try:
+        _write_arrays(tmp_dir, rows, matrix, vectorizer.idf_, category_ids)
+        os.rename(tmp_dir, os.path.join(output_dir, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # meta.json apunta a la versión; su reemplazo atómico publica el índice nuevo
+    meta_path = os.path.join(output_dir, 'meta.json')
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump({
+            'version': version,
+            'rows': len(rows),
+            'vocabulary': {term: int(col) for term, col in vectorizer.vocabulary_.items()},
+            'categories': categories,
+            'built_at': built_at
+        }, handle, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+    _prune(output_dir, keep=version)
+    return len(rows)
+
+
+def _prune(output_dir, keep, retain=2):
+    """Elimina versiones antiguas del índice (las abiertas siguen mapeadas hasta cerrarse)"""
+    versions = [os.path.join(output_dir, name) for name in os.listdir(output_dir)
+                if not name.startswith('.') and name != keep and os.path.isdir(os.path.join(output_dir, name))]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[retain - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class QuestionIndex:
+    """Índice cargado con memoria mapeada; responde top-k de preguntas similares"""
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as handle:
+            meta = json.load(handle)
+        self.size = meta['rows']
+        self.vocabulary = meta['vocabulary']
+        self.categories = meta['categories']
+        self.built_at = meta['built_at']
+        # Los índices anteriores a las versiones guardaban los arreglos junto a meta.json
+        array_dir = os.path.join(index_dir, meta['version']) if 'version' in meta else index_dir
+
+        def load(name):
+            return np.load(os.path.join(array_dir, name), mmap_mode='r')
+
+        self.data = load('matrix_data.npy')
+        self.indices = load('matrix_indices.npy')
+        self.indptr = load('matrix_indptr.npy')
+        self.idf = load('idf.npy')
+        self.category_ids = load('category_ids.npy')
+        self.source_ids = load('source_ids.npy')
+        self.question_offsets = load('questions_offsets.npy')
+        self.answer_offsets = load('answers_offsets.npy')
+        self.questions_blob = np.memmap(os.path.join(array_dir, 'questions.bin'), dtype=np.uint8, mode='r') \
+            if self.question_offsets[-1] > 0 else b''
+        self.answers_blob = np.memmap(os.path.join(array_dir, 'answers.bin'), dtype=np.uint8, mode='r') \
+            if self.answer_offsets[-1] > 0 else b''
+
+    def query_vector(self, text):
+        """Pesos TF-IDF (normalizados L2) de los términos de la consulta presentes en el vocabulario"""
+        counts = {}
+        for token in analyze(text):
+            column = self.vocabulary.get(token)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        columns = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts)) * self.idf[columns]
+        return columns, weights / np.linalg.norm(weights)
+
+    def search(self, text, k=5, category=None):
+        """Top-k preguntas más similares (similitud coseno), opcionalmente de una categoría"""
+        columns, weights = self.query_vector(text)
+        if len(columns) == 0:
+            return []
+
+        # Recorrer solo las listas de filas de los términos de la consulta
+        rows_parts, score_parts = [], []
+        for column, weight in zip(columns, weights):
+            start, end = self.indptr[column], self.indptr[column + 1]
+            rows_parts.append(self.indices[start:end])
+            score_parts.append(self.data[start:end] * weight)
+        rows = np.concatenate(rows_parts)
+        contributions = np.concatenate(score_parts)
+
+        # Acumulación densa (sin ordenar): O(postings + filas)
+        all_scores = np.bincount(rows, weights=contributions, minlength=self.size)
+        candidates = np.flatnonzero(all_scores)
+        scores = all_scores[candidates]
+
+        if category is not None:
+            if category not in self.categories:
+                return []
+            keep = self.category_ids[candidates] == self.categories.index(category)
+            candidates, scores = candidates[keep], scores[keep]
+
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return [self._result(int(candidates[i]), float(scores[i])) for i in top]
+
+    def _text(self, blob, offsets, row):
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        if start == end:
+            return None
+        return bytes(blob[start:end]).decode('utf-8')
+
+    def _result(self, row, similarity):
+        return {
+            'question': self._text(self.questions_blob, self.question_offsets, row),
+            'answer': self._text(self.answers_blob, self.answer_offsets, row),
+            'category': self.categories[int(self.category_ids[row])],
+            'source': SOURCES[int(self.source_ids[row])],
+            'similarity': similarity
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='construir el índice desde la base de datos')
+    build_parser.add_argument('--output', default=DEFAULT_INDEX_DIR)
+    query_parser = subparsers.add_parser('query', help='consultar un índice ya construido')
+    query_parser.add_argument('text')
+    query_parser.add_argument('--index', default=DEFAULT_INDEX_DIR)
+    query_parser.add_argument('-k', type=int, default=5)
+    query_parser.add_argument('--category')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from ml_db import get_connection, release_connection
+        conn = None
+        try:
+            conn = get_connection()
+        except Exception as e:
+            log_event("Error conectando a la base de datos", level='warning', error=str(e))
+        try:
+            rows = load_corpus(conn)
+        finally:
+            release_connection(conn)
+        start = time.perf_counter()
+        count = build_index(rows, args.output)
+        print(json.dumps({'status': 'success', 'rows': count, 'output': args.output,
+                          'seconds': time.perf_counter() - start}))
+    else:
+        index = QuestionIndex(args.index)
+        start = time.perf_counter()
+        results = index.search(args.text, args.k, args.category)
+        print(json.dumps({'status': 'success', 'results': results,
+                          'query_ms': (time.perf_counter() - start) * 1000}, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,177 @@
+import time
+_STARTED = time.perf_counter()
+
+import os
 import sys
 import json
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from collections import defaultdict
-import nltk
+from ml_metrics import RequestTrace, current_trace, log_exception, report_timing, span
 
-# Verificar si las stopwords están descargadas, si no, descargarlas
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+# scikit-learn y la caché de modelos se importan al primer uso: un historial
+# vacío o sin categorías con dos preguntas responde sin cargarlos
 
-from nltk.corpus import stopwords
+# Modelos TF-IDF por categoría reutilizados entre solicitudes del mismo proceso
+_model_cache = None
 
-def main():
-    try:
-        # Leer datos de entrada
-        input_data = json.loads(sys.argv[1])
-        user_history = input_data.get('user_history', [])
-        
-        # Validación básica
-        if not user_history:
-            print(json.dumps({
-                'status': 'success',
-                'recommendations': []
-            }))
-            return
-
-        # Convertir a DataFrame
-        df = pd.DataFrame(user_history)
-        
-        # Limpieza básica
-        df['category'] = df['category'].fillna('general')
-        df['question'] = df['question'].str.strip()
-        
-        # Agrupar por categoría
-        category_questions = defaultdict(list)
-        for _, row in df.iterrows():
-            category_questions[row['category']].append(row['question'])
-        
-        # Procesamiento NLP usando stopwords de nltk
-        spanish_stopwords = stopwords.words('spanish')
-        vectorizer = TfidfVectorizer(stop_words=spanish_stopwords)
-        
-        recommendations = []
-        
-        for category, questions in category_questions.items():
-            if len(questions) >= 2:
-                try:
-                    # Vectorización y cálculo de similitud
-                    tfidf = vectorizer.fit_transform(questions)
-                    similarities = cosine_similarity(tfidf[-1:], tfidf[:-1])
-                    
-                    # Obtener las 2 preguntas más similares
-                    top_indices = similarities.argsort()[0][-2:][::-1]
-                    
-                    for idx in top_indices:
-                        recommendations.append({
-                            'question': questions[idx],
-                            'category': category,
-                            'similarity': float(similarities[0][idx])
-                        })
-                except Exception as e:
-                    print(f"Error processing category {category}: {str(e)}", file=sys.stderr)
-        
-        # Ordenar y limitar resultados
-        recommendations.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        print(json.dumps({
+def get_model_cache():
+    global _model_cache
+    if _model_cache is None:
+        with span('import.model_cache'):
+            from ml_question_cache import TfidfModelCache
+        _model_cache = TfidfModelCache()
+    return _model_cache
+
+def group_by_category(user_history):
+    """
+    Agrupa las preguntas del historial por categoría, en orden de aparición.
+
+    Equivale a la limpieza anterior con pandas (fillna('general') de la
+    categoría y str.strip de la pregunta) seguida de iterrows, en una sola
+    pasada lineal sobre los diccionarios.
+    """
+    category_questions = defaultdict(list)
+    for item in user_history:
+        category = item.get('category')
+        # None o NaN (lo que fillna reemplazaba) -> 'general'
+        if category is None or category != category:
+            category = 'general'
+        question = item.get('question')
+        # Como str.strip: lo que no es texto (None, ausente, números) queda como NaN
+        question = question.strip() if isinstance(question, str) else float('nan')
+        category_questions[category].append(question)
+    return category_questions
+
+def recommend_questions(user_history):
+    """Calcula las preguntas recomendadas a partir del historial del usuario"""
+    # Validación básica
+    if not user_history:
+        return {
             'status': 'success',
-            'recommendations': recommendations[:3]  # Top 3 recomendaciones
-        }))
-        
+            'recommendations': []
+        }
+
+    with span('questions.group'):
+        category_questions = group_by_category(user_history)
+
+    # Sin categorías con al menos dos preguntas no hay nada que comparar
+    if all(len(questions) < 2 for questions in category_questions.values()):
+        return {
+            'status': 'success',
+            'recommendations': []
+        }
+
+    # Procesamiento NLP con el tokenizador compartido, usando la caché de modelos
+    model_cache = get_model_cache()
+    with span('import.sklearn'):
+        from sklearn.metrics.pairwise import cosine_similarity
+
+    recommendations = []
+
+    for category, questions in category_questions.items():
+        if len(questions) >= 2:
+            try:
+                # Vectorización y cálculo de similitud
+                with span('questions.vectorize'):
+                    tfidf = model_cache.get_matrix(questions)
+                with span('questions.similarity'):
+                    similarities = cosine_similarity(tfidf[-1:], tfidf[:-1])
+
+                # Obtener las 2 preguntas más similares
+                top_indices = similarities.argsort()[0][-2:][::-1]
+
+                for idx in top_indices:
+                    recommendations.append({
+                        'question': questions[idx],
+                        'category': category,
+                        'similarity': float(similarities[0][idx])
+                    })
+            except Exception:
+                log_exception("Error processing category", category=category)
+
+    # Ordenar y limitar resultados
+    recommendations.sort(key=lambda x: x['similarity'], reverse=True)
+
+    return {
+        'status': 'success',
+        'recommendations': recommendations[:3]  # Top 3 recomendaciones
+    }
+
+# Índice global de preguntas similares (memoria mapeada), cargado en el primer uso
+_question_index = None
+
+def get_question_index():
+    """Devuelve el índice global, recargándolo si se reconstruyó en disco"""
+    global _question_index
+    from ml_question_index import DEFAULT_INDEX_DIR, QuestionIndex
+
+    meta_path = os.path.join(DEFAULT_INDEX_DIR, 'meta.json')
+    mtime = os.path.getmtime(meta_path)
+    if _question_index is None or _question_index[0] != mtime:
+        _question_index = (mtime, QuestionIndex(DEFAULT_INDEX_DIR))
+    return _question_index[1]
+
+def handle_request(request_data):
+    """Atiende una solicitud del modo residente"""
+    if request_data.get('op') == 'similar':
+        results = get_question_index().search(
+            request_data.get('text', ''),
+            int(request_data.get('k', 5)),
+            request_data.get('category')
+        )
+        return {'status': 'success', 'results': results}
+    if request_data.get('op') == 'cache_stats':
+        model_cache = get_model_cache()
+        return {'status': 'success', 'cache': dict(model_cache.stats, bytes=model_cache.current_bytes)}
+    return recommend_questions(request_data.get('user_history', []))
+
+def serve(argv):
+    """Modo residente: solicitudes NDJSON por stdin, respuestas NDJSON por stdout"""
+    from ml_worker import serve_ndjson, serve_ndjson_pool
+
+    workers = 1
+    if '--workers' in argv:
+        workers = int(argv[argv.index('--workers') + 1])
+
+    if workers > 1:
+        serve_ndjson_pool(handle_request, workers)
+    else:
+        serve_ndjson(handle_request)
+
+def stream_question_request(request_data, stream):
+    """
+    Atiende una solicitud en streaming (ml_worker.NdjsonStream): encabezado
+    en cuanto se leyó la solicitud, antes de vectorizar; luego cada
+    recomendación (escrita y volcada al producirse) y un cierre con los
+    tiempos totales.
+    """
+    trace = current_trace()
+    stream.header(timings=trace.to_dict() if trace else None)
+    result = recommend_questions(request_data.get('user_history', []))
+    for rank, recommendation in enumerate(result['recommendations'], 1):
+        stream.record(dict(recommendation, rank=rank))
+    stream.end(timings=trace.to_dict() if trace else None)
+
+def main(argv):
+    # Entrada: argumento JSON, stdin si no hay argumento o es "-", o --input-fd N.
+    # --stream: NDJSON (encabezado antes del cálculo, una línea por recomendación, cierre con tiempos);
+    # --timing: informe de importación y tramos en stderr
+    from ml_worker import NdjsonStream, parse_cli_args, read_request
+
+    arg, options = parse_cli_args(argv)
+    stream = NdjsonStream() if options['stream'] else None
+    try:
+        with RequestTrace('cli') as trace:
+            input_data = json.loads(read_request(arg, options['input_fd']))
+            if stream is not None:
+                stream_question_request(input_data, stream)
+            else:
+                print(json.dumps(recommend_questions(input_data.get('user_history', []))))
+        if options['timing']:
+            report_timing('ml_question_recommender', _STARTED, trace)
+
     except Exception as e:
+        if stream is not None:
+            stream.fail(f"Processing error: {str(e)}")
         print(json.dumps({
             'status': 'error',
             'message': f"Processing error: {str(e)}"
@@ -81,4 +179,7 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,202 @@
+"""
+Pesos de la puntuación combinada de abogados, aprendidos fuera de línea.
+
+El recomendador ordena por
+    w_sim * similitud + w_rating * calificación normalizada + w_exp * experiencia normalizada
+con los pesos por defecto de ml_scoring (0.5 / 0.3 / 0.2). El entrenamiento
+ajusta esos pesos a partir de las citas con resultado conocido:
+
+- Ejemplos: citas completadas (positivas) y canceladas (negativas); las
+  pendientes y confirmadas aún no tienen resultado.
+- Características: las mismas que usa el recomendador en la solicitud. La
+  similitud se calcula entre la especialidad del abogado y las últimas
+  preguntas del usuario antes de la cita (el mismo texto que envía
+  app/api/appointments); calificación y experiencia se normalizan min-max
+  sobre el roster.
+- Modelo: regresión logística con clases balanceadas. Los coeficientes
+  negativos se recortan a 0 y se normalizan para que sumen 1 (la escala de
+  overall_score no cambia), y se combinan con los pesos por defecto como
+  prior: (PRIOR_SAMPLES * defecto + n * aprendidos) / (PRIOR_SAMPLES + n).
+
+El artefacto es un JSON pequeño con número de versión, que se reemplaza de
+forma atómica. El recomendador lo relee cuando cambia en disco.
+
+Uso:
+    python scripts/ml_ranking_weights.py train [--output DIR] [--min-samples 50]
+    python scripts/ml_ranking_weights.py show [--weights DIR]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from ml_scoring import DEFAULT_WEIGHTS
+
+DEFAULT_WEIGHTS_DIR = os.getenv(
+    "LAWYER_RANKING_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "ranking_weights")
+)
+
+# Orden de las características y de los pesos
+FEATURES = ('similarity', 'rating', 'experience')
+
+# Resultado de cada estado de cita (los demás no se usan para entrenar)
+OUTCOME_LABELS = {'completed': 1, 'cancelled': 0}
+
+# Citas equivalentes que aportan los pesos por defecto
+PRIOR_SAMPLES = 200
+
+# Mínimo de citas con resultado para entrenar
+MIN_SAMPLES = 50
+
+# Preguntas del usuario que forman la descripción del caso (como en app/api/appointments)
+CASE_QUESTIONS = 10
+
+
+def load_outcomes(conn):
+    """Citas con resultado: (id de abogado, descripción del caso, etiqueta)"""
+    from psycopg2.extras import RealDictCursor
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("""
+        SELECT a.lawyer_id, a.status,
+               (SELECT string_agg(q.question, ' ' ORDER BY q.created_at DESC)
+                FROM (SELECT uq.question, uq.created_at
+                      FROM user_questions uq
+                      WHERE uq.user_id = a.user_id AND uq.created_at <= a.created_at
+                      ORDER BY uq.created_at DESC
+                      LIMIT %s) q) AS case_description
+        FROM appointments a
+        WHERE a.status IN ('completed', 'cancelled')
+    """, (CASE_QUESTIONS,))
+    outcomes = [(str(row['lawyer_id']), row['case_description'] or '', OUTCOME_LABELS[row['status']])
+                for row in cursor.fetchall()]
+    cursor.close()
+    return outcomes
+
+
+def feature_matrix(recommender, outcomes):
+    """Características de cada cita con el vectorizador y la normalización del recomendador"""
+    rows = []
+    cases = []
+    labels = []
+    for lawyer_id, case_description, label in outcomes:
+        pos = recommender._position(lawyer_id)
+        if pos is not None:
+            rows.append(pos)
+            cases.append(case_description)
+            labels.append(label)
+    if not rows:
+        return np.zeros((0, len(FEATURES))), np.zeros(0, dtype=int)
+
+    rows = np.asarray(rows)
+    case_vectors = recommender.vectorizer.transform(cases)
+    # Producto fila a fila caso · especialidad (ambos normalizados L2)
+    similarity = np.asarray(case_vectors.multiply(recommender.specialty_vectors[rows]).sum(axis=1)).ravel()
+    lawyers_df = recommender.lawyers_df
+    features = np.column_stack([
+        similarity,
+        lawyers_df['normalized_rating'].to_numpy(dtype=float)[rows],
+        lawyers_df['normalized_experience'].to_numpy(dtype=float)[rows]
+    ])
+    return features, np.asarray(labels)
+
+
+def fit_weights(features, labels):
+    """Pesos aprendidos combinados con los de defecto, y métricas de ordenamiento"""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import roc_auc_score
+
+    model = LogisticRegression(class_weight='balanced')
+    model.fit(features, labels)
+    learned = np.clip(model.coef_[0], 0, None)
+    default = np.array([DEFAULT_WEIGHTS[name] for name in FEATURES])
+    if learned.sum() > 0:
+        learned = learned / learned.sum()
+        samples = len(labels)
+        weights = (PRIOR_SAMPLES * default + samples * learned) / (PRIOR_SAMPLES + samples)
+    else:
+        # Ninguna característica predice un buen resultado: se mantienen los de defecto
+        weights = default
+    metrics = {
+        'auc_default': float(roc_auc_score(labels, features @ default)),
+        'auc': float(roc_auc_score(labels, features @ weights))
+    }
+    return dict(zip(FEATURES, (float(weight) for weight in weights))), metrics
+
+
+def save_weights(weights, output_dir, **info):
+    """Escribe el artefacto con la versión siguiente, reemplazándolo de forma atómica"""
+    previous = load_weights(output_dir)
+    version = previous['version'] + 1 if previous else 1
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, 'weights.json')
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(dict(info, version=version, weights=weights, trained_at=time.time()), handle)
+    os.replace(tmp_path, path)
+    return version
+
+
+def load_weights(weights_dir=DEFAULT_WEIGHTS_DIR):
+    """Artefacto de pesos (diccionario con 'version' y 'weights'), o None si no existe"""
+    path = os.path.join(weights_dir, 'weights.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as handle:
+        artifact = json.load(handle)
+    weights = artifact.get('weights', {})
+    if set(weights) != set(FEATURES) or any(weights[name] < 0 for name in FEATURES):
+        raise ValueError(f"Pesos inválidos en {path}: {weights}")
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='ajustar los pesos con las citas de la base de datos')
+    train_parser.add_argument('--output', default=DEFAULT_WEIGHTS_DIR)
+    train_parser.add_argument('--min-samples', type=int, default=MIN_SAMPLES)
+    show_parser = subparsers.add_parser('show', help='mostrar el artefacto actual')
+    show_parser.add_argument('--weights', default=DEFAULT_WEIGHTS_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        artifact = load_weights(args.weights)
+        print(json.dumps({'status': 'success', 'artifact': artifact, 'default': DEFAULT_WEIGHTS}))
+        return
+
+    from ml_db import get_connection, release_connection
+    from ml_lawyer_recommender import LawyerRecommender, load_env, load_lawyers
+    load_env()
+    conn = None
+    try:
+        conn = get_connection()
+        lawyers = load_lawyers(conn)
+        outcomes = load_outcomes(conn)
+    except Exception as e:
+        print(json.dumps({'status': 'error', 'message': f"Error cargando citas: {e}"}), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        release_connection(conn)
+
+    start = time.perf_counter()
+    features, labels = feature_matrix(LawyerRecommender(lawyers_df=lawyers), outcomes)
+    positives = int(labels.sum())
+    if len(labels) < args.min_samples or positives in (0, len(labels)):
+        # Sin datos suficientes se conserva el artefacto actual (o los pesos por defecto)
+        print(json.dumps({'status': 'skipped', 'samples': len(labels), 'positives': positives,
+                          'min_samples': args.min_samples}))
+        return
+    weights, metrics = fit_weights(features, labels)
+    version = save_weights(weights, args.output, samples=len(labels), positives=positives,
+                           prior_samples=PRIOR_SAMPLES, metrics=metrics)
+    print(json.dumps({'status': 'success', 'version': version, 'weights': weights, 'metrics': metrics,
+                      'samples': len(labels), 'output': args.output,
+                      'seconds': time.perf_counter() - start}))
+
+
+if __name__ == '__main__':
+    main()
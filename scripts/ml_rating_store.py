@@ -0,0 +1,303 @@
+"""
+Ingesta de calificaciones de abogados con escrituras agrupadas.
+
+Antes cada calificación era un UPDATE lawyers SET rating = (rating + x) / 2
+con su propio commit: una media móvil con pérdida (el último voto pesa la
+mitad) y un bloqueo de la fila del abogado por voto, que se acumulaba en las
+ráfagas de calificaciones al terminar las sesiones.
+
+Ahora los votos se acumulan en memoria por abogado (suma y cantidad) y un
+hilo los vuelca cada RATING_FLUSH_INTERVAL segundos, o al llegar a
+RATING_FLUSH_SIZE votos pendientes, en una sola transacción:
+
+- Un upsert agrupado sobre lawyer_rating_aggregates (suma/cantidad, ver
+  add_lawyer_rating_aggregates.sql), con una fila por abogado.
+- Un único UPDATE de lawyers.rating con la media exacta (redondeada a la
+  escala de la columna), que ven la API y la sincronización incremental.
+
+Los abogados se escriben en orden de id, de modo que varios procesos que
+vuelcan a la vez toman los bloqueos en el mismo orden. Si el volcado falla
+por la conexión, los votos vuelven a quedar pendientes; si falla por los
+datos (p. ej. un abogado borrado), se reintenta abogado por abogado y los
+votos de las filas que siguen fallando se descartan (con su registro en el
+log y en stats['dropped_votes']) en lugar de reintentarse para siempre.
+
+La media en memoria (agregado confirmado más votos pendientes) es exacta
+desde el primer voto, y el recomendador la aplica de inmediato, pero solo
+una vez cargados los agregados: sin ellos, una media de los votos nuevos
+reemplazaría la calificación histórica. Si la carga falla, el hilo de
+volcado la reintenta.
+"""
+import os
+import threading
+import time
+import uuid
+
+from ml_db import pooled_connection
+from ml_metrics import log_event, log_exception, span
+
+# Rango válido de una calificación
+MIN_RATING = 0.0
+MAX_RATING = 5.0
+
+UPSERT_AGGREGATES = """
+    INSERT INTO lawyer_rating_aggregates AS a (lawyer_id, rating_sum, rating_count)
+    VALUES %s
+    ON CONFLICT (lawyer_id) DO UPDATE
+    SET rating_sum = a.rating_sum + EXCLUDED.rating_sum,
+        rating_count = a.rating_count + EXCLUDED.rating_count,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING lawyer_id, rating_sum, rating_count
+"""
+
+UPDATE_LAWYER_RATINGS = """
+    UPDATE lawyers AS l
+    SET rating = v.rating
+    FROM (VALUES %s) AS v (id, rating)
+    WHERE l.id = v.id::uuid AND l.rating IS DISTINCT FROM v.rating::numeric
+"""
+
+
+def _is_row_error(error):
+    """Error de los datos de una fila (no de la conexión): reintentarla no cambiaría el resultado"""
+    import psycopg2
+    return isinstance(error, psycopg2.Error) and not isinstance(
+        error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+def lawyer_key(lawyer_id):
+    """Identificador de abogado en forma canónica (UUID en minúsculas); ValueError si no es un UUID"""
+    try:
+        return str(uuid.UUID(str(lawyer_id)))
+    except ValueError:
+        raise ValueError(f"Identificador de abogado inválido: {lawyer_id}") from None
+
+
+class RatingStore:
+    """Acumula calificaciones y las vuelca en lotes a la base de datos"""
+
+    def __init__(self, flush_interval=None, flush_size=None):
+        self.flush_interval = float(flush_interval if flush_interval is not None
+                                    else os.getenv("RATING_FLUSH_INTERVAL", "2"))
+        self.flush_size = int(flush_size if flush_size is not None else os.getenv("RATING_FLUSH_SIZE", "500"))
+        # Agregados confirmados en la base de datos: id -> (suma, cantidad)
+        self.totals = {}
+        # Votos aún no volcados: id -> [suma, cantidad]
+        self._pending = {}
+        self._pending_votes = 0
+        # Votos del volcado en curso (siguen contando en la media hasta confirmarse)
+        self._inflight = {}
+        # Abogados cuyo agregado cambió al volcar, para aplicarlo al recomendador
+        self._flushed = set()
+        self._lock = threading.Lock()
+        # Solo un volcado a la vez (hilo de fondo, close o volcado explícito)
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Agregados cargados: hasta entonces las medias no se aplican al recomendador
+        self.loaded = False
+        self.stats = {
+            'votes': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'dropped_votes': 0,
+            'last_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+            'errors': 0
+        }
+
+    def load(self):
+        """Carga los agregados existentes; hasta lograrlo las medias no se aplican"""
+        # Sin volcados simultáneos: un agregado devuelto por un volcado no se pisa con uno anterior
+        with self._flush_lock:
+            try:
+                with pooled_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT lawyer_id, rating_sum, rating_count FROM lawyer_rating_aggregates")
+                    rows = cursor.fetchall()
+                    cursor.close()
+                    conn.rollback()
+            except Exception:
+                self.stats['errors'] += 1
+                log_exception("Error cargando agregados de calificaciones")
+                return False
+            with self._lock:
+                self.totals = {str(lawyer_id): (float(total), int(count)) for lawyer_id, total, count in rows}
+                # Los votos recibidos antes de la carga se aplican en el próximo drain_updates
+                self._flushed.update(self._pending)
+                self.loaded = True
+        return True
+
+    def _mean(self, lawyer_id):
+        total, count = self.totals.get(lawyer_id, (0.0, 0))
+        for votes in (self._inflight, self._pending):
+            pending = votes.get(lawyer_id)
+            if pending is not None:
+                total += pending[0]
+                count += pending[1]
+        return total / count if count else None
+
+    def mean(self, lawyer_id):
+        """Media actual de un abogado (confirmada más pendiente), o None si no tiene votos o no hay agregados"""
+        with self._lock:
+            return self._mean(lawyer_key(lawyer_id)) if self.loaded else None
+
+    def means_for(self, lawyer_ids):
+        """Medias exactas de los abogados indicados que tienen votos ({} si no hay agregados)"""
+        with self._lock:
+            if not self.loaded:
+                return {}
+            means = {}
+            for lawyer_id in map(str, lawyer_ids):
+                mean = self._mean(lawyer_id)
+                if mean is not None:
+                    means[lawyer_id] = mean
+            return means
+
+    def add(self, lawyer_id, rating):
+        """Registra un voto y devuelve la nueva media del abogado (None si los agregados no se cargaron)"""
+        rating = float(rating)
+        if not MIN_RATING <= rating <= MAX_RATING:
+            raise ValueError(f"La calificación debe estar entre {MIN_RATING:g} y {MAX_RATING:g}")
+        lawyer_id = lawyer_key(lawyer_id)
+        with self._lock:
+            pending = self._pending.setdefault(lawyer_id, [0.0, 0])
+            pending[0] += rating
+            pending[1] += 1
+            self._pending_votes += 1
+            self.stats['votes'] += 1
+            mean = self._mean(lawyer_id) if self.loaded else None
+            full = self._pending_votes >= self.flush_size
+        if full:
+            self._wake.set()
+        return mean
+
+    def drain_updates(self):
+        """Medias actuales de los abogados cuyo agregado se volcó desde la última llamada"""
+        with self._lock:
+            if not self.loaded:
+                return {}
+            flushed, self._flushed = self._flushed, set()
+            return {lawyer_id: self._mean(lawyer_id) for lawyer_id in flushed}
+
+    @property
+    def pending_votes(self):
+        return self._pending_votes
+
+    @staticmethod
+    def _write(conn, rows):
+        """Escribe los agregados y las medias de las filas en una transacción; devuelve los agregados"""
+        from psycopg2.extras import execute_values
+
+        try:
+            cursor = conn.cursor()
+            aggregates = execute_values(cursor, UPSERT_AGGREGATES, rows, template="(%s::uuid, %s, %s)",
+                                        page_size=len(rows), fetch=True)
+            # Misma escala que lawyers.rating (DECIMAL(3,2))
+            ratings = sorted((str(lawyer_id), round(float(total) / count, 2))
+                             for lawyer_id, total, count in aggregates)
+            execute_values(cursor, UPDATE_LAWYER_RATINGS, ratings, page_size=len(ratings))
+            conn.commit()
+            cursor.close()
+            return aggregates
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _write_rows(self, rows):
+        """
+        Reintenta abogado por abogado tras un error de datos del lote: descarta
+        las filas que fallan por sus datos y devuelve (agregados escritos,
+        filas a reintentar por un error de conexión).
+        """
+        aggregates = []
+        done = 0
+        try:
+            with pooled_connection() as conn:
+                for row in rows:
+                    try:
+                        aggregates.extend(self._write(conn, [row]))
+                    except Exception as e:
+                        if not _is_row_error(e):
+                            raise
+                        with self._lock:
+                            self.stats['dropped_votes'] += row[2]
+                        log_exception("Calificaciones descartadas", lawyer_id=row[0], votes=row[2])
+                    done += 1
+        except Exception:
+            log_exception("Error volcando calificaciones abogado por abogado", lawyers=len(rows) - done)
+        return aggregates, rows[done:]
+
+    def _requeue(self, rows):
+        """Devuelve votos a pendientes para el próximo volcado (con el lock tomado)"""
+        for lawyer_id, total, count in rows:
+            pending = self._pending.setdefault(lawyer_id, [0.0, 0])
+            pending[0] += total
+            pending[1] += count
+            self._pending_votes += count
+
+    def flush(self):
+        """Vuelca los votos pendientes; devuelve la cantidad de abogados escritos"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._pending_votes = self._pending, {}, 0
+                self._inflight = batch
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            rows = [(lawyer_id, total, count) for lawyer_id, (total, count) in sorted(batch.items())]
+            retry = []
+            try:
+                with span('ratings.flush'), pooled_connection() as conn:
+                    aggregates = self._write(conn, rows)
+            except Exception as e:
+                log_exception("Error volcando calificaciones", lawyers=len(batch))
+                if _is_row_error(e):
+                    aggregates, retry = self._write_rows(rows)
+                else:
+                    # Error de conexión: los votos vuelven a quedar pendientes
+                    aggregates, retry = [], rows
+
+            with self._lock:
+                self._inflight = {}
+                self._requeue(retry)
+                if retry:
+                    self.stats['errors'] += 1
+                for lawyer_id, total, count in aggregates:
+                    self.totals[str(lawyer_id)] = (float(total), int(count))
+                # También los descartados: su media vuelve a la confirmada
+                self._flushed.update(batch)
+                if not aggregates:
+                    return 0
+                elapsed = time.perf_counter() - start
+                self.stats['flushes'] += 1
+                self.stats['rows_flushed'] += len(aggregates)
+                self.stats['last_flush_seconds'] = elapsed
+                self.stats['total_flush_seconds'] += elapsed
+            return len(aggregates)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self.loaded:
+                self.load()
+            self.flush()
+
+    def start(self):
+        """Inicia el hilo que vuelca los votos periódicamente"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='rating-store', daemon=True)
+            self._thread.start()
+            log_event('rating_store', flush_interval=self.flush_interval, flush_size=self.flush_size)
+
+    def close(self):
+        """Detiene el hilo y vuelca los votos pendientes"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
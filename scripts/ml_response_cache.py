@@ -0,0 +1,315 @@
+"""
+Caché semántica de respuestas del chatbot.
+
+Muchas consultas son casi duplicadas ("¿cómo solicito pensión por
+invalidez?" / "como solicito una pension por invalidez"). Antes de
+generar una respuesta se busca una consulta equivalente ya respondida:
+
+- Acierto exacto: misma consulta normalizada (ml_text.normalize).
+- Acierto cercano: consulta del mismo tema (LegalAIChatbot.find_best_topic)
+  con similitud coseno TF-IDF (tokens con stemming) mayor o igual al umbral.
+  Solo se comparan las entradas que comparten algún término con la consulta.
+  Las negaciones se conservan como términos y deben coincidir: "¿puedo...?"
+  y "¿no puedo...?" no comparten respuesta.
+
+Las entradas expiran por TTL y, al superar el tamaño máximo, se expulsan
+las menos usadas (LRU). Opcionalmente se persisten en SQLite y se recargan
+al reiniciar.
+
+Modo residente (NDJSON por stdin/stdout, ver ml_worker):
+    python scripts/ml_response_cache.py --serve
+    {"op": "lookup", "message": "..."}
+    {"op": "store", "message": "...", "response": {...}}
+    {"op": "stats"} / {"op": "clear"}
+"""
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from ml_metrics import log_exception
+from ml_text import SPANISH_STOPWORDS, normalize, stem, tokenize
+
+# Stopwords que invierten el sentido de la consulta: se conservan en los términos
+NEGATIONS = frozenset((
+    'no', 'ni', 'nunca', 'jamas', 'tampoco', 'sin', 'nada', 'nadie', 'ningun', 'ninguna', 'ninguno'
+))
+_STEMMED_NEGATIONS = frozenset(stem(word) for word in NEGATIONS)
+
+
+class CacheEntry:
+    """Consulta cacheada con su respuesta (sin diccionario por instancia)"""
+    __slots__ = ("key", "topic", "terms", "value", "created_at")
+
+    def __init__(self, key, topic, terms, value, created_at):
+        self.key = key
+        self.topic = topic
+        self.terms = terms
+        self.value = value
+        self.created_at = created_at
+
+
+def term_counts(message):
+    """Frecuencia de los términos (sin stopwords salvo negaciones, con stemming) de una consulta"""
+    counts = {}
+    for token in tokenize(message, remove_stopwords=False):
+        if token in SPANISH_STOPWORDS and token not in NEGATIONS:
+            continue
+        token = stem(token)
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def negations(terms):
+    """Negaciones presentes entre los términos (con stemming) de una consulta"""
+    return _STEMMED_NEGATIONS.intersection(terms)
+
+
+class SemanticResponseCache:
+    """Caché de respuestas con búsqueda de consultas casi duplicadas, TTL, LRU y disco opcional"""
+
+    def __init__(self, max_entries=None, ttl=None, threshold=None, path=None):
+        self.max_entries = int(max_entries if max_entries is not None
+                               else os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+        self.ttl = float(ttl if ttl is not None else os.getenv("RESPONSE_CACHE_TTL", "86400"))
+        self.threshold = float(threshold if threshold is not None
+                               else os.getenv("RESPONSE_CACHE_THRESHOLD", "0.8"))
+        self.path = path if path is not None else os.getenv("RESPONSE_CACHE_PATH")
+        self._entries = OrderedDict()
+        # Término -> claves de las entradas que lo contienen (y su frecuencia documental)
+        self._postings = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                      'expirations': 0}
+        if self.path:
+            self._open_store()
+
+    def get(self, message, topic=None):
+        """Respuesta cacheada para la consulta y su similitud; (None, 0.0) si no hay"""
+        key = normalize(message)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(entry, 'expirations')
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry.value, 1.0
+
+            entry, similarity = self._nearest(term_counts(message), topic, now)
+            if entry is not None:
+                self._entries.move_to_end(entry.key)
+                self.stats['near_hits'] += 1
+                return entry.value, similarity
+
+            self.stats['misses'] += 1
+            return None, 0.0
+
+    def put(self, message, value, topic=None):
+        """Guarda la respuesta de una consulta"""
+        key = normalize(message)
+        if not key:
+            return
+        entry = CacheEntry(key, topic, term_counts(message), value, time.time())
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._remove(previous)
+            self._insert(entry)
+            self.stats['stores'] += 1
+            # Expulsar las entradas menos recientes hasta volver al tamaño máximo
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._unindex(evicted)
+                self._delete_from_store(evicted.key)
+                self.stats['evictions'] += 1
+            self._save_to_store(entry)
+
+    def clear(self):
+        """Vacía la caché en memoria y en disco"""
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_cache")
+                self._db.commit()
+
+    def snapshot_stats(self):
+        """Contadores más el tamaño actual"""
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
+
+    def _expired(self, entry, now):
+        return now - entry.created_at >= self.ttl
+
+    def _idf(self, term):
+        # Misma fórmula que TfidfVectorizer(smooth_idf=True)
+        return math.log((1 + len(self._entries)) / (1 + len(self._postings.get(term, ())))) + 1
+
+    def _weights(self, terms):
+        weights = {term: count * self._idf(term) for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return weights, norm
+
+    def _nearest(self, terms, topic, now):
+        """Entrada del mismo tema más similar a la consulta, si supera el umbral"""
+        if not terms:
+            return None, 0.0
+        candidates = set()
+        for term in terms:
+            candidates.update(self._postings.get(term, ()))
+        if not candidates:
+            return None, 0.0
+
+        query, query_norm = self._weights(terms)
+        query_negations = negations(terms)
+        best, best_similarity = None, 0.0
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.topic != topic or negations(entry.terms) != query_negations:
+                continue
+            if self._expired(entry, now):
+                self._remove(entry, 'expirations')
+                continue
+            weights, norm = self._weights(entry.terms)
+            dot = sum(weight * weights[term] for term, weight in query.items() if term in weights)
+            similarity = min(dot / (query_norm * norm), 1.0)
+            # A igualdad de similitud gana la clave menor, para que el resultado sea determinista
+            if similarity > best_similarity or (similarity == best_similarity and best is not None
+                                                and key < best.key):
+                best, best_similarity = entry, similarity
+
+        if best is None or best_similarity < self.threshold:
+            return None, 0.0
+        return best, best_similarity
+
+    def _insert(self, entry):
+        self._entries[entry.key] = entry
+        for term in entry.terms:
+            self._postings.setdefault(term, set()).add(entry.key)
+
+    def _unindex(self, entry):
+        for term in entry.terms:
+            keys = self._postings.get(term)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._postings[term]
+
+    def _remove(self, entry, counter=None):
+        del self._entries[entry.key]
+        self._unindex(entry)
+        self._delete_from_store(entry.key)
+        if counter:
+            self.stats[counter] += 1
+
+    def _open_store(self):
+        """Abre la base SQLite y carga las entradas vigentes más recientes"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                message TEXT NOT NULL,
+                topic TEXT,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("DELETE FROM response_cache WHERE created_at <= ?", (time.time() - self.ttl,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT message, topic, value, created_at FROM response_cache ORDER BY created_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for message, topic, value, created_at in reversed(rows):
+            try:
+                self._insert(CacheEntry(normalize(message), topic, term_counts(message), json.loads(value),
+                                        created_at))
+            except ValueError:
+                log_exception("Error leyendo respuesta cacheada", topic=topic)
+
+    def _save_to_store(self, entry):
+        if self._db is None:
+            return
+        try:
+            # Se guarda la clave normalizada como mensaje: reproduce los mismos términos al recargar
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache (key, message, topic, value, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (entry.key, entry.key, entry.topic, json.dumps(entry.value, ensure_ascii=False),
+                 entry.created_at)
+            )
+            self._db.commit()
+        except (sqlite3.Error, TypeError, ValueError):
+            log_exception("Error guardando respuesta cacheada", topic=entry.topic)
+
+    def _delete_from_store(self, key):
+        if self._db is None:
+            return
+        try:
+            self._db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            self._db.commit()
+        except sqlite3.Error:
+            log_exception("Error eliminando respuesta cacheada")
+
+
+# Caché y clasificador de temas del proceso residente, creados en el primer uso
+_cache = None
+_chatbot = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = SemanticResponseCache()
+    return _cache
+
+
+def find_topic(message):
+    """Tema de la consulta según LegalAIChatbot.find_best_topic (None si no se identifica)"""
+    global _chatbot
+    if _chatbot is None:
+        # chatbot_ml.py vive en la raíz del repositorio
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from chatbot_ml import LegalAIChatbot
+        _chatbot = LegalAIChatbot()
+    return _chatbot.find_best_topic(message)[0]
+
+
+def handle_request(request_data):
+    """Atiende una solicitud del modo residente"""
+    op = request_data.get('op', 'lookup')
+    cache = get_cache()
+    if op == 'stats':
+        return {'status': 'success', 'cache': cache.snapshot_stats()}
+    if op == 'clear':
+        cache.clear()
+        return {'status': 'success'}
+
+    message = request_data.get('message', '')
+    topic = find_topic(message)
+    if op == 'store':
+        cache.put(message, request_data.get('response'), topic)
+        return {'status': 'success'}
+    if op == 'lookup':
+        value, similarity = cache.get(message, topic)
+        return {'status': 'success', 'hit': value is not None, 'similarity': similarity, 'response': value}
+    return {'status': 'error', 'message': f"Operación desconocida: {op}"}
+
+
+if __name__ == '__main__':
+    if '--serve' in sys.argv[1:]:
+        from ml_worker import serve_ndjson
+        serve_ndjson(handle_request)
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,237 @@
+"""
+Motor de puntuación de abogados sobre arreglos NumPy compactos.
+
+Mantiene las columnas numéricas del roster (calificación, experiencia,
+disponibilidad y sus valores normalizados) como arreglos, calcula las
+similitudes de muchos casos con un único producto de matrices dispersas
+y selecciona los mejores candidatos con argpartition, materializando
+solo las filas que se devuelven.
+
+Los filtros de preferencias (disponibilidad, experiencia y calificación
+mínimas) se aplican antes de puntuar: solo se calculan similitudes y
+puntajes de los abogados candidatos, de modo que siempre se devuelven
+top_n resultados si hay suficientes candidatos.
+"""
+import numpy as np
+
+from ml_metrics import span
+
+# Pesos por defecto de la puntuación combinada (ml_ranking_weights.py train los aprende)
+SIMILARITY_WEIGHT = 0.5
+RATING_WEIGHT = 0.3
+EXPERIENCE_WEIGHT = 0.2
+
+DEFAULT_WEIGHTS = {
+    'similarity': SIMILARITY_WEIGHT,
+    'rating': RATING_WEIGHT,
+    'experience': EXPERIENCE_WEIGHT
+}
+
+# Casos por bloque en el modo batch (limita la matriz densa casos x abogados)
+CASE_CHUNK_SIZE = 256
+
+# Con menos candidatos que esta fracción del roster, las similitudes se calculan
+# sobre una copia de sus columnas en vez de sobre todo el roster
+PUSHDOWN_FRACTION = 0.5
+
+# Combinaciones de preferencias con candidatos cacheados por motor
+CANDIDATE_CACHE_SIZE = 8
+
+
+def _column_list(lawyers_df, column):
+    if column in lawyers_df.columns:
+        return [None if value is None or value != value else value for value in lawyers_df[column]]
+    return [None] * len(lawyers_df)
+
+
+def preference_key(user_preferences):
+    """(experiencia mínima, calificación mínima) de las preferencias del usuario"""
+    if not user_preferences:
+        return (0, 0)
+    return (user_preferences.get('preferred_experience') or 0, user_preferences.get('preferred_rating') or 0)
+
+
+def filter_mask(available, experience, rating, min_experience, min_rating):
+    """Abogados disponibles con la experiencia y calificación mínimas"""
+    mask = available.copy()
+    if min_experience > 0:
+        mask &= experience >= min_experience
+    if min_rating > 0:
+        mask &= rating >= min_rating
+    return mask
+
+
+def select_top_k(candidate_scores, top_n):
+    """
+    Índices de los top_n mejores puntajes de los candidatos (en orden de
+    posición), en orden descendente; a igualdad, el de menor índice.
+    """
+    k = min(top_n, len(candidate_scores))
+    if k <= 0:
+        return np.arange(0)
+
+    if k < len(candidate_scores):
+        selected = np.argpartition(-candidate_scores, k - 1)[:k]
+        # Empates en el límite del top-k: entran los de menor posición, no los
+        # que argpartition haya dejado primero
+        kth = candidate_scores[selected].min()
+        above = np.flatnonzero(candidate_scores > kth)
+        ties = np.flatnonzero(candidate_scores == kth)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(candidate_scores))
+    # Orden estable: mayor puntaje primero, a igualdad el de menor posición
+    return selected[np.lexsort((selected, -candidate_scores[selected]))]
+
+
+class LawyerScoringEngine:
+    """Puntúa y ordena abogados para uno o muchos casos"""
+
+    def __init__(self, lawyers_df, specialty_vectors, weights=None):
+        self.size = len(lawyers_df)
+        # Transpuesta en CSR: casos (CSR) x especialidades^T es un solo producto disperso
+        self.specialty_vectors_t = specialty_vectors.T.tocsr()
+
+        # Solo se guardan las columnas necesarias para construir la salida
+        self.ids = [str(lawyer_id) for lawyer_id in lawyers_df['id']]
+        self.full_names = _column_list(lawyers_df, 'full_name')
+        self.specialties = _column_list(lawyers_df, 'specialty')
+        self.avatar_urls = _column_list(lawyers_df, 'avatar_url')
+
+        # Columnas de afinidad por categoría alineadas con este roster (ver ml_lawyer_affinity)
+        self.affinity_columns = {}
+
+        self.update_features(lawyers_df, weights or DEFAULT_WEIGHTS)
+
+    def update_features(self, lawyers_df, weights=None):
+        """Relee las columnas numéricas (calificación, experiencia, disponibilidad) y, si se dan, los pesos"""
+        if weights is not None:
+            self.weights = dict(weights)
+            self.similarity_weight = self.weights['similarity']
+        # Copias propias: update_value las modifica en su lugar
+        self.rating = lawyers_df['rating'].to_numpy(dtype=float, copy=True)
+        self.experience = lawyers_df['experience_years'].to_numpy(dtype=float, copy=True)
+        self.available = (lawyers_df['available'] == True).to_numpy(dtype=bool)
+        self.normalized_rating = lawyers_df['normalized_rating'].to_numpy(dtype=float, copy=True)
+        self.normalized_experience = lawyers_df['normalized_experience'].to_numpy(dtype=float, copy=True)
+        self.base_score = (
+            self.weights['rating'] * self.normalized_rating +
+            self.weights['experience'] * self.normalized_experience
+        )
+        self._candidate_cache = {}
+        # Cambia con cada relectura, para quien replique estas columnas (ver ml_sharded_scoring)
+        self.features_version = getattr(self, 'features_version', 0) + 1
+
+    def update_value(self, pos, column, value, normalized):
+        """
+        Actualiza en su lugar la calificación o la experiencia ('rating' /
+        'experience_years') de un abogado y su valor normalizado, sin releer
+        el roster. Solo se descartan los candidatos cacheados cuyo filtro
+        cambia de resultado para ese abogado.
+        """
+        if column == 'rating':
+            values, normalized_values = self.rating, self.normalized_rating
+        else:
+            values, normalized_values = self.experience, self.normalized_experience
+        old_value = values[pos]
+        values[pos] = value
+        normalized_values[pos] = normalized
+        # Misma expresión que en update_features: el puntaje queda idéntico al de una relectura
+        self.base_score[pos] = (
+            self.weights['rating'] * self.normalized_rating[pos] +
+            self.weights['experience'] * self.normalized_experience[pos]
+        )
+        if self.available[pos]:
+            for key in list(self._candidate_cache):
+                threshold = key[1] if column == 'rating' else key[0]
+                if threshold > 0 and (old_value >= threshold) != (value >= threshold):
+                    del self._candidate_cache[key]
+        self.features_version += 1
+
+    def preference_candidates(self, user_preferences=None):
+        """
+        Posiciones de los abogados disponibles que cumplen las preferencias y,
+        si son pocos, sus columnas de especialidad (cacheado por preferencias).
+        """
+        key = preference_key(user_preferences)
+        entry = self._candidate_cache.get(key)
+        if entry is None:
+            positions = np.flatnonzero(filter_mask(self.available, self.experience, self.rating, *key))
+            columns = None
+            if len(positions) < PUSHDOWN_FRACTION * self.size:
+                # Mismos términos en el mismo orden: similitudes idénticas a las del roster completo
+                columns = self.specialty_vectors_t[:, positions].tocsr()
+            if len(self._candidate_cache) >= CANDIDATE_CACHE_SIZE:
+                self._candidate_cache.pop(next(iter(self._candidate_cache)))
+            entry = self._candidate_cache[key] = (positions, columns)
+        return entry
+
+    def similarities(self, case_vectors):
+        """Similitud coseno casos x abogados (los vectores TF-IDF ya están normalizados L2)"""
+        return (case_vectors @ self.specialty_vectors_t).toarray()
+
+    def candidate_similarities(self, case_vectors, candidates):
+        """Similitud de los casos solo con los candidatos de preference_candidates"""
+        positions, columns = candidates
+        if columns is None:
+            return self.similarities(case_vectors)[:, positions]
+        return (case_vectors @ columns).toarray()
+
+    def materialize(self, pos, similarity, score):
+        """Construye el diccionario de salida de un abogado"""
+        return {
+            'id': self.ids[pos],
+            'full_name': self.full_names[pos],
+            'specialty': self.specialties[pos],
+            'experience_years': int(self.experience[pos]),
+            'rating': float(self.rating[pos]),
+            'similarity_score': float(similarity),
+            'overall_score': float(score),
+            'avatar_url': self.avatar_urls[pos]
+        }
+
+    def _select(self, positions, similarities, top_n):
+        """Top-n entre los candidatos, a partir de sus similitudes"""
+        with span('lawyers.scoring'):
+            scores = self.similarity_weight * similarities + self.base_score[positions]
+        with span('lawyers.select'):
+            selected = select_top_k(scores, top_n)
+        with span('lawyers.materialize'):
+            return [self.materialize(positions[i], similarities[i], scores[i]) for i in selected]
+
+    def rank(self, similarities, user_preferences=None, top_n=3):
+        """Ordena los abogados para un caso a partir de su fila de similitudes"""
+        with span('lawyers.filter'):
+            positions = self.preference_candidates(user_preferences)[0]
+        return self._select(positions, similarities[positions], top_n)
+
+    def rank_case(self, case_vector, user_preferences=None, top_n=3):
+        """Ordena los abogados para un caso (vector TF-IDF), puntuando solo a los candidatos"""
+        with span('lawyers.filter'):
+            candidates = self.preference_candidates(user_preferences)
+        with span('lawyers.similarity'):
+            similarities = self.candidate_similarities(case_vector, candidates)[0]
+        return self._select(candidates[0], similarities, top_n)
+
+    def rank_batch(self, case_vectors, preferences_list, top_n=3):
+        """Ordena los abogados para muchos casos, procesando los casos por bloques"""
+        return list(self.iter_rank_batch(case_vectors, preferences_list, top_n))
+
+    def iter_rank_batch(self, case_vectors, preferences_list, top_n=3):
+        """Como rank_batch, pero entrega el resultado de cada caso en cuanto se puntúa su bloque"""
+        for start in range(0, case_vectors.shape[0], CASE_CHUNK_SIZE):
+            block = case_vectors[start:start + CASE_CHUNK_SIZE]
+            # Casos del bloque agrupados por preferencias: un producto por grupo, solo con sus candidatos
+            groups = {}
+            with span('lawyers.filter'):
+                for offset in range(block.shape[0]):
+                    key = preference_key(preferences_list[start + offset])
+                    groups.setdefault(key, []).append(offset)
+            results = [None] * block.shape[0]
+            for rows in groups.values():
+                candidates = self.preference_candidates(preferences_list[start + rows[0]])
+                with span('lawyers.similarity'):
+                    similarities = self.candidate_similarities(block[rows], candidates)
+                for row, offset in enumerate(rows):
+                    results[offset] = self._select(candidates[0], similarities[row], top_n)
+            yield from results
@@ -0,0 +1,235 @@
+"""
+Puntuación de abogados repartida entre procesos, para rosters muy grandes.
+
+El roster se parte en fragmentos contiguos. Cada fragmento (sus columnas de
+la matriz de especialidades transpuesta en CSR, más calificación,
+experiencia, disponibilidad y puntaje base) se copia una sola vez a un
+bloque de memoria compartida (multiprocessing.shared_memory). Los procesos
+del pool se adjuntan a esos bloques sin copiarlos y, para cada bloque de
+casos, calculan las similitudes y el top-k de su fragmento; el proceso
+principal combina los candidatos de todos los fragmentos.
+
+El pool es uno solo por proceso y dura lo que el proceso (se cierra al
+salir): cada reconstrucción del motor (recarga, sincronización) solo crea
+bloques nuevos, y los procesos del pool se adjuntan a ellos por nombre en
+la primera tarea y sueltan los de generaciones anteriores. Los procesos se
+lanzan con el contexto 'spawn': el servidor residente tiene hilos (volcado
+de calificaciones, HTTP) y un fork podría heredar un lock tomado.
+
+El resultado es idéntico al de LawyerScoringEngine: el producto disperso de
+cada columna suma los mismos términos en el mismo orden, el puntaje se
+calcula igual y, a igualdad de puntaje, gana la menor posición tanto dentro
+de cada fragmento como al combinarlos.
+
+Variables de entorno (LawyerRecommender / modo residente):
+    LAWYER_SCORING_WORKERS=4   procesos del pool (0 o sin definir: desactivado)
+    LAWYER_SCORING_SHARDS=8    fragmentos (por defecto, uno por proceso)
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+from ml_metrics import span
+from ml_scoring import CASE_CHUNK_SIZE, filter_mask, preference_key, select_top_k
+
+# Columnas numéricas replicadas en cada fragmento (se reescriben al cambiar las calificaciones)
+FEATURE_COLUMNS = ('base_score', 'available', 'experience', 'rating')
+
+
+def _pack(arrays):
+    """Copia los arreglos a un bloque de memoria compartida; devuelve el bloque y su disposición"""
+    layout = []
+    offset = 0
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        # Alineación de 8 bytes para cada arreglo
+        offset = (offset + 7) // 8 * 8
+        layout.append((key, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    views = _views(block, layout)
+    for key, array in arrays.items():
+        views[key][...] = array
+    return block, layout, views
+
+
+def _views(block, layout):
+    """Arreglos NumPy sobre el bloque compartido, sin copia"""
+    return {key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+            for key, dtype, shape, offset in layout}
+
+
+class _Shard:
+    """Vista de un fragmento dentro de un proceso (principal o del pool)"""
+
+    def __init__(self, start, views, vocabulary_size):
+        self.start = start
+        self.features = views
+        size = len(views['base_score'])
+        self.specialty_vectors_t = sparse.csr_matrix(
+            (views['data'], views['indices'], views['indptr']), shape=(vocabulary_size, size), copy=False
+        )
+
+    def top_candidates(self, case_vectors, similarity_weight, preferences, top_n):
+        """Para cada caso: posiciones globales, similitudes y puntajes del top-k del fragmento"""
+        similarities = (case_vectors @ self.specialty_vectors_t).toarray()
+        scores = similarity_weight * similarities + self.features['base_score']
+        features = self.features
+        results = []
+        candidates = {}
+        for row, key in enumerate(preferences):
+            positions = candidates.get(key)
+            if positions is None:
+                positions = candidates[key] = np.flatnonzero(
+                    filter_mask(features['available'], features['experience'], features['rating'], *key))
+            top = positions[select_top_k(scores[row, positions], top_n)]
+            results.append((top + self.start, similarities[row, top], scores[row, top]))
+        return results
+
+
+# Fragmentos adjuntados por cada proceso del pool: nombre del bloque -> (bloque compartido, _Shard)
+_worker_shards = {}
+
+
+def _attached_shard(spec, live, vocabulary_size):
+    """Fragmento de la especificación, adjuntándolo si hace falta; suelta los que ya no están en `live`"""
+    name, layout, start = spec
+    entry = _worker_shards.get(name)
+    if entry is None:
+        for stale in [stale for stale in _worker_shards if stale not in live]:
+            _worker_shards.pop(stale)[0].close()
+        block = shared_memory.SharedMemory(name=name)
+        entry = _worker_shards[name] = (block, _Shard(start, _views(block, layout), vocabulary_size))
+    return entry[1]
+
+
+def _score_shard(spec, live, case_data, case_indices, case_indptr, vocabulary_size, similarity_weight,
+                 preferences, top_n):
+    shard = _attached_shard(spec, live, vocabulary_size)
+    case_vectors = sparse.csr_matrix((case_data, case_indices, case_indptr),
+                                     shape=(len(case_indptr) - 1, vocabulary_size))
+    return shard.top_candidates(case_vectors, similarity_weight, preferences, top_n)
+
+
+# Pool del proceso, compartido por todos los ShardedScorer: (procesos, ProcessPoolExecutor)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """Pool de procesos del proceso actual; solo se recrea si cambia la cantidad de procesos"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[0] != workers:
+            _pool[1].shutdown(wait=True)
+            _pool = None
+        if _pool is None:
+            _pool = (workers, ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')))
+        return _pool[1]
+
+
+def shutdown_pool():
+    """Detiene el pool del proceso (al salir, o tras un proceso del pool caído)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool[1].shutdown(wait=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+class ShardedScorer:
+    """
+    Puntúa los casos de un LawyerScoringEngine repartiendo su roster entre
+    procesos. La salida de rank/rank_batch es la de engine.rank/rank_batch.
+    """
+
+    def __init__(self, engine, workers=None, shards=None):
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        shard_count = max(1, min(shards or self.workers, engine.size or 1))
+        self.vocabulary_size = engine.specialty_vectors_t.shape[0]
+
+        bounds = np.linspace(0, engine.size, shard_count + 1).astype(int)
+        self._blocks = []
+        self._feature_views = []
+        specs = []
+        with span('lawyers.shard'):
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                columns = engine.specialty_vectors_t[:, start:end].tocsr()
+                arrays = {'data': columns.data, 'indices': columns.indices, 'indptr': columns.indptr}
+                arrays.update(self._feature_arrays(start, end))
+                block, layout, views = _pack(arrays)
+                self._blocks.append(block)
+                self._feature_views.append((start, end, views))
+                specs.append((block.name, layout, int(start)))
+        self._features_version = engine.features_version
+        self._specs = specs
+        self._live = frozenset(spec[0] for spec in specs)
+
+    def _feature_arrays(self, start, end):
+        return {column: getattr(self.engine, column)[start:end] for column in FEATURE_COLUMNS}
+
+    def sync_features(self):
+        """Reescribe en memoria compartida las columnas numéricas si el motor las releyó (o cambió sus pesos)"""
+        if self._features_version == self.engine.features_version:
+            return
+        for start, end, views in self._feature_views:
+            for column, array in self._feature_arrays(start, end).items():
+                views[column][...] = array
+        self._features_version = self.engine.features_version
+
+    def rank(self, case_vector, user_preferences=None, top_n=3):
+        """Top-n de abogados para un caso (vector TF-IDF de una fila)"""
+        return self.rank_batch(case_vector, [user_preferences], top_n)[0]
+
+    def rank_batch(self, case_vectors, preferences_list, top_n=3):
+        """Top-n para cada caso, puntuando cada fragmento en un proceso del pool"""
+        self.sync_features()
+        case_vectors = sparse.csr_matrix(case_vectors)
+        results = []
+        for start in range(0, case_vectors.shape[0], CASE_CHUNK_SIZE):
+            block = case_vectors[start:start + CASE_CHUNK_SIZE]
+            preferences = [preference_key(p) for p in preferences_list[start:start + CASE_CHUNK_SIZE]]
+            with span('lawyers.sharded_scoring'):
+                pool = get_pool(self.workers)
+                try:
+                    futures = [pool.submit(_score_shard, spec, self._live, block.data, block.indices, block.indptr,
+                                           self.vocabulary_size, self.engine.similarity_weight,
+                                           preferences, top_n)
+                               for spec in self._specs]
+                    per_shard = [future.result() for future in futures]
+                except BrokenProcessPool:
+                    # Un proceso del pool murió: la próxima solicitud lanza un pool nuevo
+                    shutdown_pool()
+                    raise
+            with span('lawyers.merge'):
+                for row in range(block.shape[0]):
+                    results.append(self._merge([shard[row] for shard in per_shard], top_n))
+        return results
+
+    def _merge(self, candidates, top_n):
+        positions = np.concatenate([item[0] for item in candidates])
+        similarities = np.concatenate([item[1] for item in candidates])
+        scores = np.concatenate([item[2] for item in candidates])
+        # Mayor puntaje primero, a igualdad la menor posición global
+        order = np.lexsort((positions, -scores))[:top_n]
+        return [self.engine.materialize(positions[i], similarities[i], scores[i]) for i in order]
+
+    def close(self):
+        """Libera la memoria compartida (el pool sigue activo para el próximo puntuador)"""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+        self._feature_views = []
+        self._specs = []
@@ -0,0 +1,152 @@
+"""
+Sincronización incremental de abogados y casos.
+
+En lugar de recargar las tablas completas, se guarda una marca de agua
+por tabla (updated_at de lawyers, created_at de user_questions) y se
+traen solo las filas posteriores, que se fusionan en el recomendador en
+memoria. Las filas borradas físicamente no se detectan; una recarga
+completa ('reload') las elimina. De los casos solo se traen los
+`cases_limit` más recientes, los únicos que conserva el recomendador.
+
+Una transacción que confirma tarde puede dejar filas con marca anterior
+a la última vista; por eso cada consulta vuelve a traer una ventana de
+SYNC_OVERLAP segundos antes de la marca. Aplicar dos veces la misma fila
+no cambia nada (upsert_lawyer y merge_cases son idempotentes).
+
+Sin marca de agua (la instantánea se cargó sin marca) no se traen las
+tablas completas fila a fila: se recarga una instantánea.
+"""
+import os
+import time
+
+import pandas as pd
+from psycopg2.extras import RealDictCursor
+
+from ml_db import pooled_connection
+from ml_metrics import log_exception, span
+
+CHANGED_LAWYERS_QUERY = """
+    SELECT id, full_name, specialty, experience_years, rating, available, avatar_url, updated_at
+    FROM lawyers
+    WHERE %(since)s::timestamptz IS NULL
+       OR updated_at > %(since)s::timestamptz - make_interval(secs => %(overlap)s)
+    ORDER BY updated_at
+"""
+
+NEW_CASES_QUERY = """
+    SELECT uq.id, uq.question as description, uq.category, uq.created_at,
+           string_agg(lq.category, ', ') as keywords
+    FROM user_questions uq
+    LEFT JOIN legal_questions lq ON uq.category = lq.category
+    WHERE %(since)s::timestamptz IS NULL
+       OR uq.created_at > %(since)s::timestamptz - make_interval(secs => %(overlap)s)
+    GROUP BY uq.id, uq.question, uq.category, uq.created_at
+    ORDER BY uq.created_at DESC
+    LIMIT %(limit)s
+"""
+
+
+def _latest(current, candidate):
+    return candidate if current is None or candidate > current else current
+
+
+class DeltaSync:
+    """Trae solo los cambios posteriores a la última carga y los aplica al recomendador"""
+
+    def __init__(self, interval=None, overlap=None, cases_limit=100):
+        self.interval = float(interval if interval is not None else os.getenv("SYNC_INTERVAL", "10"))
+        # Segundos antes de la marca que se vuelven a consultar (filas confirmadas tarde)
+        self.overlap = float(overlap if overlap is not None else os.getenv("SYNC_OVERLAP", "30"))
+        # El recomendador solo conserva los casos más recientes: no se traen más
+        self.cases_limit = cases_limit
+        self.watermarks = {'lawyers': None, 'user_questions': None}
+        # rows_synced cuenta las filas que cambiaron el recomendador; rows_fetched
+        # incluye las que la ventana de solapamiento vuelve a traer sin cambios
+        self.stats = {
+            'syncs': 0,
+            'rows_synced': {'lawyers': 0, 'user_questions': 0},
+            'rows_fetched': {'lawyers': 0, 'user_questions': 0},
+            'last_rows_synced': 0,
+            'last_sync_seconds': 0.0,
+            'total_sync_seconds': 0.0,
+            'snapshot_loads': 0,
+            'errors': 0
+        }
+        self._last_sync = time.monotonic()
+
+    def reset(self, marker, cases_since=None):
+        """
+        Parte de la marca de la instantánea de abogados (max updated_at, conteo)
+        y del created_at del caso más reciente cargado
+        """
+        if marker is not None:
+            self.watermarks['lawyers'] = marker[0]
+        if cases_since is not None:
+            self.watermarks['user_questions'] = cases_since
+        self._last_sync = time.monotonic()
+
+    def needs_snapshot(self):
+        """Sin marca de agua de abogados, una sincronización traería la tabla completa fila a fila"""
+        return self.watermarks['lawyers'] is None
+
+    def maybe_sync(self, recommender, reload=None, rating_store=None):
+        """Sincroniza si pasó el intervalo configurado desde la última vez"""
+        if time.monotonic() - self._last_sync >= self.interval:
+            self.sync(recommender, reload, rating_store)
+
+    def sync(self, recommender, reload=None, rating_store=None):
+        """
+        Aplica al recomendador las filas nuevas o modificadas desde las marcas
+        de agua y devuelve cuántas lo cambiaron. Sin marcas, llama a `reload`
+        (carga de una instantánea, que debe llamar a reset con su marca) si se
+        proporciona.
+
+        Con `rating_store` (ml_rating_store), la media exacta de los abogados
+        con votos reemplaza a lawyers.rating: cada volcado actualiza la fila
+        (y su updated_at) con la media redondeada a DECIMAL(3,2).
+        """
+        start = time.perf_counter()
+        self._last_sync = time.monotonic()
+        if reload is not None and self.needs_snapshot():
+            reload()
+            self.stats['snapshot_loads'] += 1
+            return 0
+        try:
+            with span('sync.db_load'), pooled_connection() as conn:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(CHANGED_LAWYERS_QUERY, {'since': self.watermarks['lawyers'], 'overlap': self.overlap})
+                lawyers = cursor.fetchall()
+                cursor.execute(NEW_CASES_QUERY, {'since': self.watermarks['user_questions'],
+                                                 'overlap': self.overlap, 'limit': self.cases_limit})
+                cases = cursor.fetchall()
+                cursor.close()
+                conn.rollback()
+        except Exception:
+            self.stats['errors'] += 1
+            log_exception("Error en la sincronización incremental")
+            return 0
+
+        exact = rating_store.means_for(lawyer['id'] for lawyer in lawyers) if rating_store is not None and lawyers else {}
+        changed_lawyers = sum(
+            bool(recommender.upsert_lawyer(dict(lawyer, rating=exact.get(str(lawyer['id']), lawyer['rating']))))
+            for lawyer in lawyers
+        )
+        new_cases = recommender.merge_cases(pd.DataFrame(cases)) if cases else 0
+
+        # Avanzar las marcas solo hasta lo efectivamente aplicado (la ventana puede traer solo filas ya vistas)
+        if lawyers:
+            self.watermarks['lawyers'] = _latest(self.watermarks['lawyers'], lawyers[-1]['updated_at'])
+        if cases:
+            self.watermarks['user_questions'] = _latest(self.watermarks['user_questions'], cases[0]['created_at'])
+
+        elapsed = time.perf_counter() - start
+        rows = changed_lawyers + new_cases
+        self.stats['syncs'] += 1
+        self.stats['rows_synced']['lawyers'] += changed_lawyers
+        self.stats['rows_synced']['user_questions'] += new_cases
+        self.stats['rows_fetched']['lawyers'] += len(lawyers)
+        self.stats['rows_fetched']['user_questions'] += len(cases)
+        self.stats['last_rows_synced'] = rows
+        self.stats['last_sync_seconds'] = elapsed
+        self.stats['total_sync_seconds'] += elapsed
+        return rows
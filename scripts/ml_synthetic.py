@@ -0,0 +1,102 @@
+"""
+Generadores de datos sintéticos para benchmarks y pruebas sin base de datos.
+
+Todos los generadores son deterministas para una semilla dada.
+"""
+import random
+import uuid
+
+import pandas as pd
+
+SPECIALTY_TERMS = [
+    'Derechos de Discapacidad', 'Accesibilidad', 'Inclusión', 'Derecho Laboral', 'Discriminación',
+    'Derecho Civil', 'Herencias', 'Testamentos', 'Patrimonio Protegido', 'Pensiones',
+    'Seguridad Social', 'Incapacidad Laboral', 'Derechos Humanos', 'Litigios', 'Derecho Familiar',
+    'Derecho Administrativo', 'Salud', 'Educación Inclusiva', 'Transporte Accesible', 'Vivienda'
+]
+
+CASE_TERMS = [
+    'discriminación', 'trabajo', 'adaptaciones', 'pensión', 'invalidez', 'seguridad social',
+    'testamento', 'herencia', 'patrimonio', 'accesibilidad', 'barreras', 'edificio', 'despido',
+    'rampa', 'transporte', 'certificado', 'discapacidad', 'salud', 'educación', 'vivienda'
+]
+
+FIRST_NAMES = ['María', 'Carlos', 'Ana', 'Javier', 'Laura', 'Pedro', 'Lucía', 'Jorge', 'Rosa', 'Luis']
+LAST_NAMES = ['González', 'Rodríguez', 'Martínez', 'López', 'Sánchez', 'Pérez', 'Torres', 'Flores']
+
+
+def make_lawyers(size, seed=42):
+    """Roster sintético con las mismas columnas que la tabla lawyers"""
+    rng = random.Random(seed)
+    return pd.DataFrame([
+        {
+            # UUID como en la tabla lawyers (el almacén de calificaciones los valida)
+            'id': str(uuid.UUID(int=lawyer_id)),
+            'full_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'specialty': ', '.join(rng.sample(SPECIALTY_TERMS, rng.randint(2, 4))),
+            'experience_years': rng.randint(1, 40),
+            'rating': round(rng.uniform(3.0, 5.0), 2),
+            'available': rng.random() < 0.9,
+            'avatar_url': None
+        }
+        for lawyer_id in range(1, size + 1)
+    ])
+
+
+def make_cases(size, seed=42):
+    """Descripciones de casos sintéticas"""
+    rng = random.Random(seed)
+    return [
+        "Necesito ayuda con " + ' '.join(rng.sample(CASE_TERMS, rng.randint(3, 8)))
+        for _ in range(size)
+    ]
+
+
+QUESTION_TEMPLATES = {
+    'pensiones': ['¿Cómo solicito la pensión por {}?', '¿Qué requisitos tiene la pensión de {}?'],
+    'laboral': ['¿Qué hago si sufro {} en el trabajo?', '¿Me pueden despedir por {}?'],
+    'herencias': ['¿Cómo protejo la herencia de {}?', '¿Qué es la legítima para {}?'],
+    'accesibilidad': ['¿Dónde denuncio {} en un edificio público?', '¿Qué norma exige {}?'],
+    'general': ['¿Qué derechos tengo sobre {}?', 'Necesito información sobre {}']
+}
+
+
+def make_question_history(size, seed=42):
+    """Historial de preguntas de un usuario con la forma que recibe ml_question_recommender"""
+    rng = random.Random(seed)
+    categories = list(QUESTION_TEMPLATES)
+    history = []
+    for _ in range(size):
+        category = rng.choice(categories)
+        template = rng.choice(QUESTION_TEMPLATES[category])
+        history.append({
+            'question': template.format(' '.join(rng.sample(CASE_TERMS, rng.randint(1, 3)))),
+            'category': category
+        })
+    return history
+
+
+KEYWORD_SYLLABLES = ['pen', 'sion', 'de', 're', 'cho', 'tra', 'ba', 'jo', 'he', 'ren', 'cia', 'tes', 'ta',
+                     'men', 'to', 'ac', 'ce', 'si', 'bi', 'li', 'dad', 'in', 'va', 'lu', 'cer', 'ti', 'fi', 'ca']
+
+
+def make_knowledge_base(size, seed=42):
+    """Base de conocimiento sintética con la forma de data/legal_knowledge.json"""
+    rng = random.Random(seed)
+    info_fields = ['legal_articles', 'requirements', 'protections', 'regulations']
+
+    def keyword():
+        return ''.join(rng.choice(KEYWORD_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    knowledge_base = {}
+    for topic_id in range(size):
+        knowledge_base[f"tema_{topic_id}"] = {
+            'keywords': [keyword() for _ in range(rng.randint(3, 6))],
+            'responses': [
+                f"Respuesta {topic_id}.{i}: " + ' '.join(rng.sample(CASE_TERMS, rng.randint(8, 15)))
+                for i in range(rng.randint(2, 4))
+            ],
+            rng.choice(info_fields): [f"Ley {rng.randint(100, 2000)} de {rng.randint(1990, 2024)}"
+                                      for _ in range(rng.randint(1, 4))]
+        }
+    return knowledge_base
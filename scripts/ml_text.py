@@ -0,0 +1,111 @@
+"""
+Normalización y tokenización de texto en español compartida por los
+scripts de ML (chatbot, recomendador de preguntas y de abogados).
+
+- Expresiones regulares y tablas de traducción precompiladas.
+- Stopwords en español (la lista de NLTK) incluidas en el módulo, sin
+  depender de nltk ni de descargas en tiempo de ejecución.
+- Plegado de tildes (á -> a, ü -> u; la ñ se conserva).
+- Stemming ligero opcional (plurales y -iones).
+- Caché LRU: el mismo texto se tokeniza una sola vez por proceso.
+"""
+import re
+from functools import lru_cache
+
+# Lista de stopwords en español de NLTK (corpora/stopwords/spanish)
+_NLTK_SPANISH_STOPWORDS = """
+de la que el en y a los del se las por un para con no una su al lo como más pero sus le ya o este sí
+porque esta entre cuando muy sin sobre también me hasta hay donde quien desde todo nos durante todos
+uno les ni contra otros ese eso ante ellos e esto mí antes algunos qué unos yo otro otras otra él tanto
+esa estos mucho quienes nada muchos cual poco ella estar estas algunas algo nosotros mi mis tú te ti tu
+tus ellas nosotras vosotros vosotras os mío mía míos mías tuyo tuya tuyos tuyas suyo suya suyos suyas
+nuestro nuestra nuestros nuestras vuestro vuestra vuestros vuestras esos esas estoy estás está estamos
+estáis están esté estés estemos estéis estén estaré estarás estará estaremos estaréis estarán estaría
+estarías estaríamos estaríais estarían estaba estabas estábamos estabais estaban estuve estuviste estuvo
+estuvimos estuvisteis estuvieron estuviera estuvieras estuviéramos estuvierais estuvieran estuviese
+estuvieses estuviésemos estuvieseis estuviesen estando estado estada estados estadas estad he has ha
+hemos habéis han haya hayas hayamos hayáis hayan habré habrás habrá habremos habréis habrán habría
+habrías habríamos habríais habrían había habías habíamos habíais habían hube hubiste hubo hubimos
+hubisteis hubieron hubiera hubieras hubiéramos hubierais hubieran hubiese hubieses hubiésemos hubieseis
+hubiesen habiendo habido habida habidos habidas soy eres es somos sois son sea seas seamos seáis sean
+seré serás será seremos seréis serán sería serías seríamos seríais serían era eras éramos erais eran fui
+fuiste fue fuimos fuisteis fueron fuera fueras fuéramos fuerais fueran fuese fueses fuésemos fueseis
+fuesen sintiendo sentido sentida sentidos sentidas siente sentid tengo tienes tiene tenemos tenéis
+tienen tenga tengas tengamos tengáis tengan tendré tendrás tendrá tendremos tendréis tendrán tendría
+tendrías tendríamos tendríais tendrían tenía tenías teníamos teníais tenían tuve tuviste tuvo tuvimos
+tuvisteis tuvieron tuviera tuvieras tuviéramos tuvierais tuvieran tuviese tuvieses tuviésemos tuvieseis
+tuviesen teniendo tenido tenida tenidos tenidas tened
+""".split()
+
+# Tildes y diéresis -> vocal simple (la ñ es una letra distinta y se conserva)
+_ACCENT_TABLE = str.maketrans("áéíóúüàèìòùâêîôûäëïö", "aeiouuaeiouaeiouaeio")
+
+# Todo lo que no sea letra, dígito o espacio se descarta
+_NON_WORD_RE = re.compile(r"[^\w\s]|_")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Reglas de stemming ligero: (sufijo, reemplazo, letras previas admitidas o None)
+_STEM_RULES = (
+    ("iones", "ion", None),
+    ("ces", "z", None),
+    ("es", "", "lrnd"),
+    ("s", "", "aeo"),
+)
+_STEM_MIN_ROOT = 3
+
+
+def fold_accents(text):
+    """Elimina tildes y diéresis"""
+    return text.translate(_ACCENT_TABLE)
+
+
+SPANISH_STOPWORDS = frozenset(fold_accents(word) for word in _NLTK_SPANISH_STOPWORDS)
+
+
+@lru_cache(maxsize=8192)
+def normalize(text):
+    """Minúsculas, sin tildes, sin signos de puntuación y con espacios simples"""
+    text = fold_accents(text.lower())
+    text = _NON_WORD_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def stem(token):
+    """Stemming ligero para español: quita plurales y unifica -iones/-ion"""
+    for suffix, replacement, previous in _STEM_RULES:
+        if token.endswith(suffix):
+            root = token[:-len(suffix)]
+            if len(root) < _STEM_MIN_ROOT:
+                return token
+            if previous is not None and root[-1] not in previous:
+                continue
+            return root + replacement
+    return token
+
+
+@lru_cache(maxsize=8192)
+def tokenize(text, remove_stopwords=True, min_length=2, stemming=False):
+    """Tokens normalizados del texto (tupla, cacheada por argumentos)"""
+    tokens = normalize(text).split()
+    if remove_stopwords:
+        tokens = [token for token in tokens if token not in SPANISH_STOPWORDS]
+    if min_length > 1:
+        tokens = [token for token in tokens if len(token) >= min_length]
+    if stemming:
+        tokens = [stem(token) for token in tokens]
+    return tuple(tokens)
+
+
+def analyze(text):
+    """Analizador para TfidfVectorizer(analyzer=...): tokens sin stopwords"""
+    return tokenize(text)
+
+
+def analyze_stemmed(text):
+    """Analizador para TfidfVectorizer(analyzer=...): tokens sin stopwords y con stemming"""
+    return tokenize(text, stemming=True)
+
+
+def cache_info():
+    """Estadísticas de las cachés de normalización y tokenización"""
+    return {'normalize': normalize.cache_info()._asdict(), 'tokenize': tokenize.cache_info()._asdict()}
@@ -0,0 +1,267 @@
+"""
+Utilidades para ejecutar los scripts de ML como procesos residentes.
+
+Un proceso residente mantiene los modelos cargados en memoria y atiende
+solicitudes JSON delimitadas por líneas (NDJSON) por stdin/stdout, o
+solicitudes HTTP en un puerto local. Cada solicitud puede incluir un "id"
+que se copia en la respuesta para poder multiplexar varias solicitudes
+sobre el mismo proceso.
+
+Cada solicitud se traza con ml_metrics: con "timings": true la respuesta
+incluye la duración de cada tramo, con "profile": true el informe de
+cProfile, y {"op": "metrics"} devuelve las métricas del proceso en formato
+Prometheus (en modo pool, las del proceso que atiende esa solicitud).
+
+Los CLI de un solo uso pueden leer la solicitud de stdin o de un
+descriptor (read_request) y emitir la respuesta en streaming con
+NdjsonStream: un encabezado con tiempos, un registro por recomendación
+(o por caso) en cuanto está listo y un cierre con el total.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+
+from ml_metrics import REGISTRY, RequestTrace, log_event, log_exception, span, start_metrics_server
+
+
+def _error_response(message):
+    return {'status': 'error', 'message': message}
+
+
+def handle_line(handler, line):
+    """Procesa una línea NDJSON y devuelve la respuesta como diccionario (o None si está vacía)"""
+    line = line.strip()
+    if not line:
+        return None
+
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        response = _error_response(f"JSON inválido: {e}")
+        response['id'] = None
+        return response
+
+    if not isinstance(request, dict):
+        response = _error_response("La solicitud debe ser un objeto JSON")
+        response['id'] = None
+        return response
+
+    request_id = request.get('id')
+    op = request.get('op', 'request')
+    if op == 'metrics':
+        return {'status': 'success', 'metrics': REGISTRY.render(), 'id': request_id}
+
+    with RequestTrace(op, request_id, profile=request.get('profile')) as trace:
+        try:
+            response = handler(request)
+        except Exception as e:
+            log_exception("Error atendiendo solicitud", op=op, id=request_id)
+            response = _error_response(str(e))
+        trace.status = response.get('status', 'success')
+
+    if request.get('timings'):
+        response['timings'] = trace.to_dict()
+    if trace.profile_report is not None:
+        response['profile'] = trace.profile_report
+    response['id'] = request_id
+    return response
+
+
+def encode_response(response):
+    """Serializa una respuesta como una línea NDJSON"""
+    with span('serialize'):
+        return json.dumps(response) + '\n'
+
+
+def serve_ndjson(handler, input_stream=None, output_stream=None):
+    """Atiende solicitudes NDJSON: una solicitud por línea y una respuesta por línea"""
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    # Endpoint opcional de métricas Prometheus para el proceso residente
+    if os.getenv("ML_METRICS_PORT"):
+        start_metrics_server(int(os.getenv("ML_METRICS_PORT")))
+
+    for line in input_stream:
+        response = handle_line(handler, line)
+        if response is None:
+            continue
+        output_stream.write(encode_response(response))
+        output_stream.flush()
+
+
+def serve_ndjson_pool(handler, workers, initializer=None, input_stream=None, output_stream=None,
+                      max_in_flight=None):
+    """
+    Atiende solicitudes NDJSON repartiéndolas entre un pool de procesos.
+
+    Las respuestas se escriben en cuanto terminan, no en el orden de llegada;
+    el cliente las empareja por "id". El número de solicitudes en curso se
+    limita para que un productor rápido no acumule trabajo sin control.
+    El manejador debe poder serializarse (función de nivel de módulo).
+    """
+    import multiprocessing
+
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    in_flight = threading.BoundedSemaphore(max_in_flight or workers * 4)
+    write_lock = threading.Lock()
+
+    def write_response(response):
+        try:
+            if response is not None:
+                payload = encode_response(response)
+                with write_lock:
+                    output_stream.write(payload)
+                    output_stream.flush()
+        finally:
+            in_flight.release()
+
+    def write_failure(request_id, error):
+        log_event("Error enviando solicitud al pool", level='error', id=request_id, error=str(error))
+        write_response(dict(_error_response(str(error)), id=request_id))
+
+    with multiprocessing.Pool(workers, initializer=initializer) as pool:
+        for line in input_stream:
+            if not line.strip():
+                continue
+            in_flight.acquire()
+            # El id se lee antes de enviar: si la serialización falla, el cliente aún puede emparejar el error
+            request_id = _request_id(line)
+            try:
+                pool.apply_async(handle_line, (handler, line), callback=write_response,
+                                 error_callback=functools.partial(write_failure, request_id))
+            except Exception as e:
+                write_failure(request_id, e)
+        pool.close()
+        pool.join()
+
+
+def _request_id(line):
+    """Id de una línea NDJSON (None si no es un objeto JSON válido)"""
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request.get('id') if isinstance(request, dict) else None
+
+
+def read_request(arg=None, input_fd=None):
+    """
+    Texto JSON de la solicitud de un CLI: el argumento, stdin si el argumento
+    es "-" o falta, o el descriptor heredado `input_fd` (historiales grandes
+    sin el límite de tamaño de argv).
+    """
+    if input_fd is not None:
+        with os.fdopen(input_fd, encoding='utf-8') as handle:
+            return handle.read()
+    if arg is not None and arg != '-':
+        return arg
+    return sys.stdin.read()
+
+
+def parse_cli_args(argv):
+    """Separa las opciones comunes de los CLI (--timing, --stream, --input-fd N) del argumento JSON"""
+    options = {'timing': '--timing' in argv, 'stream': '--stream' in argv, 'input_fd': None}
+    args = [arg for arg in argv if arg not in ('--timing', '--stream')]
+    if '--input-fd' in args:
+        position = args.index('--input-fd')
+        options['input_fd'] = int(args[position + 1])
+        del args[position:position + 2]
+    return (args[0] if args else None), options
+
+
+class NdjsonStream:
+    """
+    Salida NDJSON incremental de un CLI:
+
+        {"type": "header", "status": "success", "timings": {...}, ...}
+        {"type": "recommendation", "rank": 1, ...}
+        ...
+        {"type": "end", "count": N, "timings": {...}}
+
+    Si la solicitud falla antes del encabezado, el encabezado lleva
+    "status": "error"; si falla después, se emite {"type": "error"}.
+    """
+
+    def __init__(self, output_stream=None):
+        self.output_stream = output_stream or sys.stdout
+        self.count = 0
+        self.header_written = False
+
+    def write(self, record):
+        self.output_stream.write(encode_response(record))
+        self.output_stream.flush()
+
+    def header(self, **fields):
+        self.header_written = True
+        self.write(dict({'type': 'header', 'status': 'success'}, **fields))
+
+    def record(self, data, record_type='recommendation'):
+        self.count += 1
+        self.write(dict({'type': record_type}, **data))
+
+    def end(self, **fields):
+        self.write(dict({'type': 'end', 'count': self.count}, **fields))
+
+    def fail(self, message):
+        if self.header_written:
+            self.write({'type': 'error', 'status': 'error', 'message': message})
+        else:
+            self.header(status='error', message=message)
+
+
+def serve_http(handler, host='127.0.0.1', port=8765):
+    """Atiende solicitudes POST con cuerpo JSON en un servidor HTTP local"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    # El manejador no es seguro entre hilos: se serializa el acceso al modelo
+    lock = threading.Lock()
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status_code, payload):
+            with span('serialize'):
+                body = json.dumps(payload).encode('utf-8')
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                body = REGISTRY.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, _error_response("Ruta no encontrada"))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            line = self.rfile.read(length).decode('utf-8')
+            with lock:
+                response = handle_line(handler, line)
+            if response is None:
+                self._send_json(400, _error_response("Solicitud vacía"))
+                return
+            status_code = 200 if response.get('status') != 'error' else 400
+            self._send_json(status_code, response)
+
+        def log_message(self, format, *args):
+            # Los registros de acceso van a stderr para no mezclarse con las respuestas
+            sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    print(f"Servidor ML escuchando en http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los módulos de ML viven en scripts/ y el chatbot en la raíz del repositorio
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
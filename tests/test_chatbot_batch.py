@@ -0,0 +1,84 @@
+"""
+Clasificación por lotes: las categorías escritas en user_questions son las
+de la aplicación (lib/ai.ts), no los nombres de los temas.
+"""
+import psycopg2.extras
+
+from chatbot_batch import UPDATE_CATEGORIES, DatabaseOutput, classify_chunks
+from chatbot_ml import APP_CATEGORIES, GENERAL_CATEGORY, TOPIC_CATEGORIES, LegalAIChatbot
+
+QUESTIONS = {
+    '00000000-0000-0000-0000-000000000001': "Me despidieron del trabajo por discriminación laboral",
+    '00000000-0000-0000-0000-000000000002': "¿Cómo pido la pensión por invalidez?",
+    '00000000-0000-0000-0000-000000000003': "Quiero hacer un testamento para la herencia",
+    '00000000-0000-0000-0000-000000000004': "El transporte público tiene barreras arquitectónicas",
+    '00000000-0000-0000-0000-000000000005': "Hola, buenos días",
+    # Un tema con una sola palabra coincidente entre muchas: confianza menor a 0.3
+    '00000000-0000-0000-0000-000000000006': "Necesito ayuda urgente con un papel del banco sobre mi pensión mensual",
+}
+
+EXPECTED = {
+    '00000000-0000-0000-0000-000000000001': 'laboral',
+    '00000000-0000-0000-0000-000000000002': 'pensiones',
+    '00000000-0000-0000-0000-000000000003': 'herencias',
+    '00000000-0000-0000-0000-000000000004': 'accesibilidad',
+    '00000000-0000-0000-0000-000000000005': GENERAL_CATEGORY,
+    '00000000-0000-0000-0000-000000000006': GENERAL_CATEGORY,
+}
+
+
+class FakeCursor:
+    rowcount = 0
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_topic_categories_are_app_categories():
+    assert set(TOPIC_CATEGORIES.values()) <= APP_CATEGORIES
+    assert set(TOPIC_CATEGORIES) == set(LegalAIChatbot().knowledge_base)
+
+
+def test_write_db_stores_app_categories(monkeypatch):
+    written = []
+
+    def execute_values(cursor, query, rows, **kwargs):
+        assert query == UPDATE_CATEGORIES
+        written.extend(rows)
+
+    monkeypatch.setattr(psycopg2.extras, 'execute_values', execute_values)
+    conn = FakeConnection()
+    output = DatabaseOutput(conn)
+    records = [(position, question_id, text) for position, (question_id, text) in enumerate(QUESTIONS.items())]
+    for _, results in classify_chunks(records, chunk_size=4):
+        output.write(results)
+
+    assert dict(written) == EXPECTED
+    assert conn.commits == 2
+
+
+def test_low_confidence_topic_is_general():
+    result = LegalAIChatbot(deterministic=True).classify(QUESTIONS['00000000-0000-0000-0000-000000000006'])
+    assert result['topic'] == 'pension_discapacidad'
+    assert result['confidence'] < 0.3
+    assert result['category'] == GENERAL_CATEGORY
+
+
+def test_zero_threshold_keeps_the_topic():
+    result = LegalAIChatbot(deterministic=True).classify(QUESTIONS['00000000-0000-0000-0000-000000000006'],
+                                                         min_confidence=0.0)
+    assert result['category'] == 'pensiones'
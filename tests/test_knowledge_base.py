@@ -0,0 +1,135 @@
+import json
+import random
+
+import pytest
+
+from chatbot_ml import KeywordIndex, LegalAIChatbot
+from ml_knowledge_base import KnowledgeBase, KnowledgeBaseStore, keyword_pieces
+
+MESSAGES = [
+    "me despidieron del trabajo sin causa",
+    "¿cómo solicito la pensión por invalidez?",
+    "herencia de mi padre con testamento",
+    "el edificio no tiene rampa de accesibilidad",
+    "hola",
+]
+
+
+# Subcadenas en ambos sentidos, empates entre temas y mensajes sin coincidencias
+REFERENCE_MESSAGES = [
+    "pensiones y herencias de trabajadores",        # la palabra clave dentro de la palabra
+    "pens testa arqui acces",                       # la palabra dentro de la palabra clave
+    "accesibilidad",                                # empate: aparece en dos temas
+    "discriminacion por discapacidad",              # empate entre temas distintos
+    "barreras en el empleo y el transporte",
+    "sucesiones patrimoniales",
+    "hola buenas tardes",
+    "",
+    "xyz",
+]
+
+
+def reference_best_topic(knowledge_base, user_keywords):
+    """Recorrido lineal original de find_best_topic con calculate_similarity"""
+    best_topic, best_score = None, 0.0
+    for topic, data in knowledge_base.items():
+        topic_keywords = data["keywords"]
+        if not user_keywords or not topic_keywords:
+            score = 0.0
+        else:
+            matches = sum(1 for keyword in user_keywords
+                          if any(tk in keyword or keyword in tk for tk in topic_keywords))
+            score = matches / len(user_keywords)
+        if score > best_score:
+            best_score, best_topic = score, topic
+    return best_topic, best_score
+
+
+def fuzz_messages(knowledge_base, count=200, seed=3):
+    """Mensajes con recortes y extensiones de las palabras clave, mezclados con ruido"""
+    rng = random.Random(seed)
+    keywords = [tk for data in knowledge_base.values() for tk in data["keywords"]]
+    messages = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(1, 5)):
+            tk = rng.choice(keywords)
+            start = rng.randint(0, len(tk) - 3)
+            end = rng.randint(start + 3, len(tk))
+            words.append(rng.choice([tk[start:end], tk + rng.choice(["es", "ales", "mente"]),
+                                     rng.choice(["pre", "sub"]) + tk, "ruido", "consulta"]))
+        messages.append(" ".join(words))
+    return messages
+
+
+@pytest.fixture(scope="module")
+def source_knowledge(tmp_path_factory):
+    store = KnowledgeBaseStore(artifact_dir=str(tmp_path_factory.mktemp("kb")))
+    with open(store.source, encoding="utf-8") as handle:
+        return store, json.load(handle)
+
+
+def test_indexes_match_linear_scan(source_knowledge):
+    store, knowledge = source_knowledge
+    bot = LegalAIChatbot(knowledge_store=store)
+    compiled = store.get().keyword_index
+    index = KeywordIndex(knowledge)
+    for message in REFERENCE_MESSAGES + fuzz_messages(knowledge):
+        keywords = bot.extract_keywords(message)
+        expected = reference_best_topic(knowledge, keywords)
+        assert index.best_topic(keywords) == expected, message
+        assert compiled.best_topic(keywords) == expected, message
+        assert bot.find_best_topic(message) == expected, message
+
+
+def test_reference_messages_cover_each_case(source_knowledge):
+    _, knowledge = source_knowledge
+    bot = LegalAIChatbot(knowledge_store=source_knowledge[0])
+
+    def best(message):
+        return reference_best_topic(knowledge, bot.extract_keywords(message))
+
+    assert best("pensiones") == ("pension_discapacidad", 1.0)
+    assert best("testa") == ("herencias_testamentos", 1.0)
+    # A igualdad gana el primer tema de la base
+    assert best("accesibilidad") == ("discapacidad_derechos", 1.0)
+    assert best("hola buenas tardes") == (None, 0.0)
+
+
+def test_keyword_pieces_respect_lengths():
+    assert list(keyword_pieces("abcd", [2, 3, 5])) == ["ab", "bc", "cd", "abc", "bcd"]
+
+
+def test_compiled_index_matches_dictionary_index(tmp_path):
+    store = KnowledgeBaseStore(artifact_dir=str(tmp_path))
+    knowledge_base = store.get()
+    assert isinstance(knowledge_base, KnowledgeBase)
+    with open(store.source, encoding='utf-8') as handle:
+        index = KeywordIndex(json.load(handle))
+    bot = LegalAIChatbot(knowledge_store=store)
+    for message in MESSAGES:
+        keywords = bot.extract_keywords(message)
+        assert knowledge_base.keyword_index.best_topic(keywords) == index.best_topic(keywords)
+
+
+def test_unwritable_artifact_dir_compiles_elsewhere(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    knowledge_base = KnowledgeBaseStore(artifact_dir=str(blocker / "knowledge_base")).get()
+    assert isinstance(knowledge_base, KnowledgeBase)
+
+
+def test_failed_load_falls_back_to_source_dictionary(tmp_path):
+    store = KnowledgeBaseStore(artifact_dir=str(tmp_path))
+    store._load = lambda: (_ for _ in ()).throw(RuntimeError("artefacto dañado"))
+    bot = LegalAIChatbot(knowledge_store=store, deterministic=True)
+    reference = LegalAIChatbot(knowledge_store=KnowledgeBaseStore(artifact_dir=str(tmp_path)), deterministic=True)
+    assert isinstance(bot.knowledge_base, dict)
+    for message in MESSAGES:
+        assert bot.find_best_topic(message) == reference.find_best_topic(message)
+
+
+def test_missing_source_starts_with_empty_base(tmp_path):
+    store = KnowledgeBaseStore(source=str(tmp_path / "missing.json"), artifact_dir=str(tmp_path))
+    bot = LegalAIChatbot(knowledge_store=store)
+    assert bot.find_best_topic(MESSAGES[0]) == (None, 0.0)
@@ -0,0 +1,21 @@
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts",
+                      "ml_lawyer_recommender.py")
+
+
+def run_cli(request):
+    """Ejecuta el CLI con -X importtime: stderr lista cada módulo importado"""
+    result = subprocess.run([sys.executable, "-X", "importtime", SCRIPT, json.dumps(request)],
+                            capture_output=True, text=True, check=True)
+    imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if '|' in line}
+    return json.loads(result.stdout), imported
+
+
+def test_trivial_request_skips_heavy_imports():
+    response, imported = run_cli({'case_description': 'despido', 'top_n': 0})
+    assert response == {'status': 'success', 'recommendations': []}
+    assert not {'dotenv', 'pandas', 'sklearn', 'psycopg2'} & imported
@@ -0,0 +1,184 @@
+"""
+Equivalencia del motor de puntuación (LawyerScoringEngine) con la
+implementación anterior de recommend_lawyers, con los pesos por defecto.
+"""
+import json
+import uuid
+
+import numpy as np
+import pytest
+
+import ml_ranking_weights
+from ml_lawyer_recommender import LawyerRecommender
+from ml_scoring import DEFAULT_WEIGHTS
+from ml_synthetic import make_cases, make_lawyers
+
+PREFERENCES = [None, {'preferred_experience': 10, 'preferred_rating': 4.5}, {'preferred_rating': 4.9}]
+
+
+def reference_recommend(recommender, case_description, user_preferences=None, top_n=3):
+    """Implementación anterior (DataFrame completo, filtros posteriores) con orden estable en empates"""
+    case_vector = recommender.get_case_vector(case_description)
+    df = recommender.lawyers_df.copy()
+    df['similarity'] = (case_vector @ recommender.specialty_vectors.T).toarray()[0]
+    df = df[df['available'] == True]
+    df['score'] = (
+        DEFAULT_WEIGHTS['similarity'] * df['similarity'] +
+        DEFAULT_WEIGHTS['rating'] * df['normalized_rating'] +
+        DEFAULT_WEIGHTS['experience'] * df['normalized_experience']
+    )
+    if user_preferences:
+        if user_preferences.get('preferred_experience', 0) > 0:
+            df = df[df['experience_years'] >= user_preferences['preferred_experience']]
+        if user_preferences.get('preferred_rating', 0) > 0:
+            df = df[df['rating'] >= user_preferences['preferred_rating']]
+    df = df.sort_values('score', ascending=False, kind='stable').head(top_n)
+    return [(str(row['id']), float(row['similarity']), float(row['score'])) for _, row in df.iterrows()]
+
+
+def summary(recommendations):
+    return [(rec['id'], rec['similarity_score'], rec['overall_score']) for rec in recommendations]
+
+
+@pytest.fixture(scope='module')
+def recommender():
+    return LawyerRecommender(lawyers_df=make_lawyers(3000), ranking_weights=DEFAULT_WEIGHTS)
+
+
+def test_default_weights_are_pinned():
+    assert DEFAULT_WEIGHTS == {'similarity': 0.5, 'rating': 0.3, 'experience': 0.2}
+
+
+@pytest.mark.parametrize('top_n', [1, 5, 50])
+def test_engine_matches_reference(recommender, top_n):
+    for i, case in enumerate(make_cases(30)):
+        preferences = PREFERENCES[i % len(PREFERENCES)]
+        expected = reference_recommend(recommender, case, preferences, top_n)
+        actual = summary(recommender.recommend_lawyers(case, preferences, top_n))
+        assert [item[0] for item in actual] == [item[0] for item in expected]
+        np.testing.assert_allclose([item[1:] for item in actual], [item[1:] for item in expected],
+                                   rtol=0, atol=1e-12)
+
+
+def test_batch_matches_single(recommender):
+    cases = make_cases(40)
+    preferences = [PREFERENCES[i % len(PREFERENCES)] for i in range(len(cases))]
+    batch = recommender.recommend_lawyers_batch(cases, preferences, 5)
+    assert batch == [recommender.recommend_lawyers(case, prefs, 5) for case, prefs in zip(cases, preferences)]
+
+
+def test_filters_return_top_n_when_enough_candidates(recommender):
+    strict = {'preferred_experience': 30, 'preferred_rating': 4.8}
+    candidates = recommender.lawyers_df[
+        (recommender.lawyers_df['available'] == True) &
+        (recommender.lawyers_df['experience_years'] >= 30) &
+        (recommender.lawyers_df['rating'] >= 4.8)
+    ]
+    results = recommender.recommend_lawyers(make_cases(1)[0], strict, 10)
+    assert len(results) == min(10, len(candidates))
+    assert all(rec['experience_years'] >= 30 and rec['rating'] >= 4.8 for rec in results)
+
+
+def test_in_place_rating_update_matches_rebuild(recommender):
+    lawyers = make_lawyers(500)
+    live = LawyerRecommender(lawyers_df=lawyers.copy(), ranking_weights=DEFAULT_WEIGHTS)
+    case = make_cases(1)[0]
+    live.recommend_lawyers(case)
+    ids = list(lawyers['id'])
+    for lawyer_id, rating in [(ids[0], 4.0), (ids[1], 3.5), (ids[2], 4.95), (ids[0], 3.2)]:
+        assert live.update_rating(lawyer_id, rating)
+        lawyers.loc[lawyers['id'] == lawyer_id, 'rating'] = rating
+    rebuilt = LawyerRecommender(lawyers_df=lawyers, ranking_weights=DEFAULT_WEIGHTS)
+    for preferences in PREFERENCES:
+        assert live.recommend_lawyers(case, preferences, 10) == rebuilt.recommend_lawyers(case, preferences, 10)
+
+
+def test_trained_weights_do_not_affect_pinned_recommender(tmp_path, monkeypatch, recommender):
+    with open(tmp_path / 'weights.json', 'w', encoding='utf-8') as handle:
+        json.dump({'version': 1, 'weights': {'similarity': 0.1, 'rating': 0.1, 'experience': 0.8}}, handle)
+    monkeypatch.setattr(ml_ranking_weights, 'DEFAULT_WEIGHTS_DIR', str(tmp_path))
+
+    case = make_cases(1)[0]
+    pinned = LawyerRecommender(lawyers_df=make_lawyers(3000), ranking_weights=DEFAULT_WEIGHTS)
+    assert summary(pinned.recommend_lawyers(case, None, 5)) == reference_recommend(pinned, case, None, 5)
+
+    trained = LawyerRecommender(lawyers_df=make_lawyers(3000))
+    assert trained.get_scoring_engine().weights['experience'] == 0.8
+
+
+ROSTER_COLUMNS = ['id', 'full_name', 'specialty', 'experience_years', 'rating', 'available', 'avatar_url']
+
+
+def new_lawyer(number, specialty, experience_years=10, rating=4.0):
+    return {'id': str(uuid.UUID(int=100000 + number)), 'full_name': f"Abogado {number}",
+            'specialty': specialty, 'experience_years': experience_years, 'rating': rating,
+            'available': True, 'avatar_url': None}
+
+
+def assert_matches_rebuild(live):
+    """El índice actualizado en su lugar recomienda lo mismo que uno construido desde cero"""
+    rebuilt = LawyerRecommender(lawyers_df=live.lawyers_df[ROSTER_COLUMNS].copy(), ranking_weights=DEFAULT_WEIGHTS)
+    for i, case in enumerate(make_cases(20, seed=7)):
+        preferences = PREFERENCES[i % len(PREFERENCES)]
+        actual = summary(live.recommend_lawyers(case, preferences, 10))
+        expected = summary(rebuilt.recommend_lawyers(case, preferences, 10))
+        assert [item[0] for item in actual] == [item[0] for item in expected]
+        np.testing.assert_allclose([item[1:] for item in actual], [item[1:] for item in expected],
+                                   rtol=0, atol=1e-12)
+
+
+@pytest.fixture
+def live():
+    live = LawyerRecommender(lawyers_df=make_lawyers(300), ranking_weights=DEFAULT_WEIGHTS)
+    # Con el motor ya construido, las actualizaciones recorren la ruta incremental
+    live.recommend_lawyers(make_cases(1)[0])
+    return live
+
+
+def test_add_lawyer_with_known_vocabulary_matches_rebuild(live):
+    live.add_lawyer(new_lawyer(1, 'Pensiones, Seguridad Social, Derecho Laboral'))
+    live.add_lawyer(new_lawyer(2, 'Herencias, Testamentos', experience_years=20, rating=4.5))
+    assert_matches_rebuild(live)
+
+
+def test_add_lawyer_with_new_vocabulary_matches_rebuild(live):
+    live.add_lawyer(new_lawyer(1, 'Derecho Migratorio, Pensiones'))
+    assert 'migratori' in ' '.join(live.vectorizer.vocabulary_)
+    assert_matches_rebuild(live)
+
+
+def test_add_lawyer_outside_bounds_matches_rebuild(live):
+    live.add_lawyer(new_lawyer(1, 'Accesibilidad, Vivienda', experience_years=60, rating=5.0))
+    live.add_lawyer(new_lawyer(2, 'Salud, Inclusión', experience_years=0, rating=1.0))
+    assert live.feature_bounds['experience_years'] == (0.0, 60.0)
+    assert_matches_rebuild(live)
+
+
+def test_remove_lawyer_matches_rebuild(live):
+    df = live.lawyers_df
+    bound_ids = [df.loc[df['experience_years'].idxmax(), 'id'], df.loc[df['rating'].idxmin(), 'id']]
+    for lawyer_id in bound_ids + [df.loc[5, 'id'], df.loc[len(df) - 1, 'id']]:
+        assert live.remove_lawyer(lawyer_id)
+    assert not live.remove_lawyer(bound_ids[0])
+    assert_matches_rebuild(live)
+
+
+def test_remove_last_lawyer_with_a_term_matches_rebuild(live):
+    live.add_lawyer(new_lawyer(1, 'Derecho Migratorio, Pensiones'))
+    live.recommend_lawyers(make_cases(1)[0])
+    assert live.remove_lawyer(new_lawyer(1, '')['id'])
+    assert not any('migratori' in term for term in live.vectorizer.vocabulary_)
+    assert_matches_rebuild(live)
+
+
+def test_set_availability_matches_rebuild(live):
+    ids = list(live.lawyers_df['id'])
+    ranked = [rec['id'] for rec in live.recommend_lawyers(make_cases(1)[0], None, 3)]
+    for lawyer_id in ranked[:2]:
+        assert live.set_availability(lawyer_id, False)
+    unavailable = live.lawyers_df.loc[live.lawyers_df['available'] == False, 'id'].iloc[0]
+    assert live.set_availability(unavailable, True)
+    assert not live.set_availability('00000000-0000-0000-0000-000000000000', True)
+    assert ranked[0] not in [rec['id'] for rec in live.recommend_lawyers(make_cases(1)[0], None, 3)]
+    assert ids == list(live.lawyers_df['id'])
+    assert_matches_rebuild(live)
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ml_question_cache import TfidfModelCache
+from ml_text import analyze
+
+QUESTIONS = [
+    "¿Cómo solicito la pensión por invalidez?",
+    "¿Qué documentos necesito para la pensión?",
+    "Me despidieron por mi discapacidad",
+    "¿Puedo reclamar una indemnización por despido?",
+    "¿Cuánto tarda el trámite del certificado de discapacidad?",
+]
+
+
+def reference_similarities(questions):
+    matrix = TfidfVectorizer(analyzer=analyze).fit_transform(questions)
+    return (matrix @ matrix.T).toarray()
+
+
+def similarities(matrix):
+    return (matrix @ matrix.T).toarray()
+
+
+def test_fit_matches_tfidf_vectorizer():
+    cache = TfidfModelCache(cache_dir='')
+    np.testing.assert_allclose(similarities(cache.get_matrix(QUESTIONS)), reference_similarities(QUESTIONS))
+
+
+@pytest.mark.parametrize('base, questions', [
+    (QUESTIONS[:-1], QUESTIONS),
+    (QUESTIONS[1:], QUESTIONS),
+])
+def test_append_recomputes_idf(base, questions):
+    cache = TfidfModelCache(cache_dir='')
+    cache.get_matrix(base)
+    matrix = cache.get_matrix(questions)
+    assert cache.stats['appends'] == 1
+    np.testing.assert_allclose(similarities(matrix), reference_similarities(questions))
+
+
+def test_only_stopwords_raises():
+    with pytest.raises(ValueError):
+        TfidfModelCache(cache_dir='').get_matrix(["el de la", "y o"])
+
+
+def test_disk_cache_is_bounded(tmp_path):
+    cache = TfidfModelCache(cache_dir=str(tmp_path), max_disk_bytes=1)
+    for end in range(2, len(QUESTIONS) + 1):
+        cache.get_matrix(QUESTIONS[:end])
+    assert len(os.listdir(tmp_path)) == 1
+    assert cache.stats['disk_evictions'] == len(QUESTIONS) - 2
+
+    restarted = TfidfModelCache(cache_dir=str(tmp_path))
+    restarted.get_matrix(QUESTIONS)
+    assert restarted.stats['disk_hits'] == 1
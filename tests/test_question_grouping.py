@@ -0,0 +1,72 @@
+"""
+group_by_category frente a la agrupación anterior con pandas (fillna,
+str.strip e iterrows), incluido el orden de categorías y preguntas.
+"""
+import math
+from collections import defaultdict
+
+import pandas as pd
+import pytest
+
+from ml_question_recommender import group_by_category, recommend_questions
+from ml_synthetic import make_question_history
+
+HISTORIES = {
+    'missing_categories': [
+        {'question': '¿Cómo pido la pensión?', 'category': None},
+        {'question': '¿Qué papeles necesito?', 'category': float('nan')},
+        {'question': 'Me despidieron', 'category': 'laboral'},
+        {'question': '¿Y la pensión de invalidez?'},
+    ],
+    'padded_and_empty_questions': [
+        {'question': '   ¿Puedo heredar?  ', 'category': 'herencias'},
+        {'question': '', 'category': 'herencias'},
+        {'question': '\t\n', 'category': 'herencias'},
+        {'question': None, 'category': 'herencias'},
+        {'category': 'laboral'},
+        {'question': ' rampa ', 'category': 'accesibilidad'},
+    ],
+    'duplicate_categories': [
+        {'question': f"pregunta {i}", 'category': category}
+        for i, category in enumerate(['laboral', 'pensiones', 'laboral', None, 'pensiones', 'laboral', 'general'])
+    ],
+}
+
+
+def legacy_group(user_history):
+    """Agrupación anterior de ml_question_recommender.main"""
+    df = pd.DataFrame(user_history)
+    df['category'] = df['category'].fillna('general')
+    df['question'] = df['question'].str.strip()
+    category_questions = defaultdict(list)
+    for _, row in df.iterrows():
+        category_questions[row['category']].append(row['question'])
+    return category_questions
+
+
+def comparable(groups):
+    """Lista ordenada de (categoría, preguntas) con NaN comparables por igualdad"""
+    return [(category, ['<NaN>' if isinstance(q, float) and math.isnan(q) else q for q in questions])
+            for category, questions in groups.items()]
+
+
+@pytest.mark.parametrize('name', sorted(HISTORIES))
+def test_grouping_matches_pandas(name):
+    history = HISTORIES[name]
+    assert comparable(group_by_category(history)) == comparable(legacy_group(history))
+
+
+def test_grouping_matches_pandas_on_generated_history():
+    history = make_question_history(2000)
+    assert comparable(group_by_category(history)) == comparable(legacy_group(history))
+
+
+def test_recommendations_match_legacy_grouping(monkeypatch):
+    import ml_question_recommender
+
+    history = HISTORIES['duplicate_categories'] + HISTORIES['padded_and_empty_questions'][:3]
+    expected = None
+    with monkeypatch.context() as patch:
+        patch.setattr(ml_question_recommender, 'group_by_category', legacy_group)
+        expected = recommend_questions(history)
+    assert recommend_questions(history) == expected
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+from ml_question_index import QuestionIndex, build_index, load_corpus
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+def test_rebuild_does_not_touch_mapped_version(tmp_path):
+    corpus = load_corpus(None)
+    build_index(corpus, str(tmp_path))
+    index = QuestionIndex(str(tmp_path))
+    before = index.search("pensión por discapacidad", k=3)
+
+    rebuilt = [dict(row, question=f"{row['question']} reconstruida") for row in corpus[:2]]
+    build_index(rebuilt, str(tmp_path))
+    # El índice abierto sigue leyendo su versión, intacta
+    assert index.search("pensión por discapacidad", k=3) == before
+
+    fresh = QuestionIndex(str(tmp_path))
+    assert fresh.size == 2
+    assert all(result['question'].endswith("reconstruida") for result in fresh.search("pensión", k=5))
+
+
+def test_old_versions_are_pruned(tmp_path):
+    corpus = load_corpus(None)
+    for _ in range(4):
+        build_index(corpus, str(tmp_path))
+    versions = [name for name in os.listdir(tmp_path) if os.path.isdir(tmp_path / name)]
+    assert len(versions) == 2
+    assert not any(name.startswith('.') for name in versions)
+
+
+def test_query_path_skips_build_dependencies(tmp_path):
+    build_index(load_corpus(None), str(tmp_path))
+    code = (
+        "import sys, ml_question_index as m\n"
+        f"m.QuestionIndex({str(tmp_path)!r}).search('pensión')\n"
+        "assert 'sklearn' not in sys.modules and 'psycopg2' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=SCRIPTS, check=True)
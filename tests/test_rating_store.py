@@ -0,0 +1,134 @@
+"""
+Almacén de calificaciones sin base de datos: validación de abogados, medias
+solo con los agregados cargados y filas que fallan descartadas al volcar.
+"""
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+import ml_rating_store
+from ml_lawyer_recommender import LawyerRecommender
+from ml_rating_store import RatingStore
+from ml_scoring import DEFAULT_WEIGHTS
+from ml_synthetic import make_lawyers
+
+LAWYERS = make_lawyers(20)
+IDS = list(LAWYERS['id'])
+UNKNOWN_ID = '00000000-0000-0000-0000-0000000000ff'
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def fake_pool(monkeypatch, rows=(), error=None):
+    @contextmanager
+    def pooled_connection():
+        if error is not None:
+            raise error
+        yield FakeConnection(rows)
+    monkeypatch.setattr(ml_rating_store, 'pooled_connection', pooled_connection)
+
+
+def fake_database(monkeypatch, bad_ids=()):
+    """_write que acumula agregados y falla por datos con los abogados de `bad_ids`"""
+    stored = {}
+
+    def write(conn, rows):
+        if any(row[0] in bad_ids for row in rows):
+            raise psycopg2.DataError("fila inválida")
+        aggregates = []
+        for lawyer_id, total, count in rows:
+            previous = stored.get(lawyer_id, (0.0, 0))
+            stored[lawyer_id] = (previous[0] + total, previous[1] + count)
+            aggregates.append((lawyer_id,) + stored[lawyer_id])
+        return aggregates
+
+    fake_pool(monkeypatch)
+    monkeypatch.setattr(RatingStore, '_write', staticmethod(write))
+    return stored
+
+
+def loaded_store(monkeypatch, rows=()):
+    store = RatingStore()
+    fake_pool(monkeypatch, rows)
+    assert store.load()
+    return store
+
+
+def test_rejects_invalid_ids():
+    store = RatingStore()
+    with pytest.raises(ValueError):
+        store.add('no-es-un-uuid', 4)
+    recommender = LawyerRecommender(lawyers_df=LAWYERS.copy(), ranking_weights=DEFAULT_WEIGHTS)
+    with pytest.raises(ValueError):
+        recommender.update_lawyer_rating(UNKNOWN_ID, 4, rating_store=store)
+    assert store.pending_votes == 0
+
+
+def test_means_wait_for_loaded_aggregates(monkeypatch):
+    store = RatingStore()
+    fake_pool(monkeypatch, error=psycopg2.OperationalError("sin conexión"))
+    assert not store.load()
+    assert store.add(IDS[0], 5) is None
+    assert store.drain_updates() == {}
+
+    # Con los agregados cargados se aplica la media histórica más el voto pendiente
+    fake_pool(monkeypatch, rows=[(IDS[0], 12.0, 4)])
+    assert store.load()
+    assert store.drain_updates() == {IDS[0]: pytest.approx(17.0 / 5)}
+    assert store.add(IDS[0], 3) == pytest.approx(20.0 / 6)
+
+
+def test_failing_rows_are_dropped_not_requeued(monkeypatch):
+    store = loaded_store(monkeypatch)
+    stored = fake_database(monkeypatch, bad_ids={IDS[1]})
+    store.add(IDS[0], 4)
+    store.add(IDS[1], 2)
+    store.add(IDS[1], 3)
+
+    assert store.flush() == 1
+    assert stored == {IDS[0]: (4.0, 1)}
+    assert store.pending_votes == 0
+    assert store.stats['dropped_votes'] == 2
+    # El descartado vuelve a no tener media
+    assert store.drain_updates() == {IDS[0]: 4.0, IDS[1]: None}
+    assert store.flush() == 0
+
+
+def test_connection_errors_requeue_votes(monkeypatch):
+    store = loaded_store(monkeypatch)
+    store.add(IDS[0], 4)
+    fake_pool(monkeypatch, error=psycopg2.OperationalError("sin conexión"))
+    assert store.flush() == 0
+    assert store.pending_votes == 1
+    assert store.mean(IDS[0]) == 4.0
+
+    stored = fake_database(monkeypatch)
+    assert store.flush() == 1
+    assert stored == {IDS[0]: (4.0, 1)}
@@ -0,0 +1,18 @@
+from ml_response_cache import SemanticResponseCache
+
+
+def test_negation_does_not_share_answer():
+    cache = SemanticResponseCache(max_entries=10, ttl=3600, threshold=0.5, path='')
+    cache.put("¿Puedo cobrar la pensión por invalidez si trabajo?", {'response': 'sí'}, topic='pensiones')
+
+    value, _ = cache.get("¿No puedo cobrar la pensión por invalidez si trabajo?", topic='pensiones')
+    assert value is None
+
+
+def test_near_duplicate_shares_answer():
+    cache = SemanticResponseCache(max_entries=10, ttl=3600, threshold=0.5, path='')
+    cache.put("¿No puedo cobrar la pensión por invalidez si trabajo?", {'response': 'no'}, topic='pensiones')
+
+    value, similarity = cache.get("no puedo cobrar pension por invalidez si trabajo", topic='pensiones')
+    assert value == {'response': 'no'}
+    assert similarity > 0.5
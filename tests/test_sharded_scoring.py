@@ -0,0 +1,44 @@
+"""
+Puntuación repartida entre procesos: mismos resultados que el motor de un
+solo proceso y un único pool para toda la vida del proceso.
+"""
+import pytest
+
+import ml_sharded_scoring
+from ml_lawyer_recommender import LawyerRecommender
+from ml_scoring import DEFAULT_WEIGHTS
+from ml_synthetic import make_cases, make_lawyers
+
+PREFERENCES = [None, {'preferred_experience': 10, 'preferred_rating': 4.5}]
+
+
+@pytest.fixture
+def recommender():
+    recommender = LawyerRecommender(lawyers_df=make_lawyers(2000), ranking_weights=DEFAULT_WEIGHTS)
+    yield recommender
+    recommender.close()
+
+
+def recommend_all(recommender, cases):
+    return [recommender.recommend_lawyers(case, PREFERENCES[i % 2], 5) for i, case in enumerate(cases)]
+
+
+def test_sharded_matches_engine_and_pool_survives_rebuild(recommender):
+    cases = make_cases(10)
+    expected = recommend_all(recommender, cases)
+
+    recommender.scoring_workers = 2
+    assert recommend_all(recommender, cases) == expected
+    pool = ml_sharded_scoring.get_pool(2)
+    first_scorer = recommender._sharded_scorer
+
+    # Una reconstrucción del motor crea bloques nuevos pero reutiliza el pool
+    lawyer = recommender.lawyers_df.iloc[0].to_dict()
+    recommender.remove_lawyer(lawyer['id'])
+    recommender.add_lawyer(lawyer)
+    recommender.scoring_workers = 0
+    expected = recommend_all(recommender, cases)
+    recommender.scoring_workers = 2
+    assert recommend_all(recommender, cases) == expected
+    assert recommender._sharded_scorer is not first_scorer
+    assert ml_sharded_scoring.get_pool(2) is pool
@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+import ml_lawyer_recommender
+from ml_db import SnapshotStore
+from ml_lawyer_recommender import RecommenderService
+from ml_synthetic import make_lawyers
+
+
+class FlakyLoader:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_failed_refresh_keeps_previous_snapshot():
+    loader = FlakyLoader({'rows': 'live'}, ConnectionError("sin base de datos"), {'rows': 'new'})
+    store = SnapshotStore(loader, ttl=0, check_interval=3600, fallback=lambda: {'rows': 'sample'})
+    first = store.get()
+
+    assert store.get() is first
+    # El reintento espera check_interval: no se consulta en cada lectura
+    assert store.get() is first
+    assert loader.calls == 2
+
+    store._retry_at = 0.0
+    assert store.get().data == {'rows': 'new'}
+
+
+def test_fallback_only_without_snapshot():
+    loader = FlakyLoader(ConnectionError("sin base de datos"), {'rows': 'live'})
+    store = SnapshotStore(loader, marker_loader=lambda: ('2026-01-01', 3), ttl=3600, check_interval=0,
+                          fallback=lambda: {'rows': 'sample'})
+    sample = store.get()
+    assert sample.data == {'rows': 'sample'}
+    assert sample.marker is None
+
+    # Con la base de datos de vuelta, la marca difiere y se renueva
+    live = store.get()
+    assert live.data == {'rows': 'live'}
+    assert live.version == sample.version + 1
+
+
+def test_failure_without_fallback_raises():
+    store = SnapshotStore(FlakyLoader(ConnectionError("sin base de datos")))
+    with pytest.raises(ConnectionError):
+        store.get()
+
+
+def test_cases_refresh_does_not_rebuild_recommender(monkeypatch):
+    monkeypatch.setattr(ml_lawyer_recommender, '_rating_store', None)
+    lawyers = SnapshotStore(lambda: {'lawyers': make_lawyers(20)}, ttl=3600)
+    cases = SnapshotStore(FlakyLoader({'cases': pd.DataFrame()}, {'cases': pd.DataFrame()}), ttl=0)
+    service = RecommenderService(snapshot_store=lawyers, cases_store=cases)
+    recommender = service.recommender
+
+    assert service.current_recommender() is recommender
+    assert recommender.cases_version == 2
+
+
+def test_snapshot_rebuild_keeps_exact_ratings(monkeypatch):
+    from ml_rating_store import RatingStore
+
+    roster = make_lawyers(20)
+    lawyer_id = roster.loc[0, 'id']
+    store = RatingStore()
+    store.totals = {lawyer_id: (13.0, 3)}
+    store.loaded = True
+    monkeypatch.setattr(ml_lawyer_recommender, '_rating_store', store)
+
+    service = RecommenderService(snapshot_store=SnapshotStore(lambda: {'lawyers': roster}, ttl=3600),
+                                 cases_store=SnapshotStore(lambda: {'cases': pd.DataFrame()}, ttl=3600))
+    recommender = service.recommender
+    assert recommender.lawyers_df.loc[recommender._position(lawyer_id), 'rating'] == 13.0 / 3
+    # La instantánea compartida no se modifica
+    assert roster.loc[0, 'rating'] != 13.0 / 3
@@ -0,0 +1,185 @@
+"""
+DeltaSync contra una base de datos falsa que reproduce el filtro de las
+consultas (marca de agua menos la ventana de solapamiento).
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import ml_sync
+from ml_lawyer_recommender import LawyerRecommender
+from ml_scoring import DEFAULT_WEIGHTS
+from ml_sync import CHANGED_LAWYERS_QUERY, DeltaSync
+from ml_synthetic import make_lawyers
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+
+    def execute(self, query, params):
+        since, overlap = params['since'], timedelta(seconds=params['overlap'])
+        if query == CHANGED_LAWYERS_QUERY:
+            rows = [row for row in self.database.lawyers if since is None or row['updated_at'] > since - overlap]
+            self.rows = sorted(rows, key=lambda row: row['updated_at'])
+        else:
+            rows = [row for row in self.database.cases if since is None or row['created_at'] > since - overlap]
+            self.rows = sorted(rows, key=lambda row: row['created_at'], reverse=True)[:params['limit']]
+        self.database.queries += 1
+
+    def fetchall(self):
+        return [dict(row) for row in self.rows]
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, lawyers):
+        self.lawyers = lawyers
+        self.cases = []
+        self.queries = 0
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def lawyer(self, lawyer_id):
+        return next(row for row in self.lawyers if row['id'] == lawyer_id)
+
+    def touch(self, lawyer_id, seconds, **changes):
+        self.lawyer(lawyer_id).update(changes, updated_at=START + timedelta(seconds=seconds))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    roster = make_lawyers(30)
+    roster = roster[roster['available']].reset_index(drop=True)
+    database = FakeDatabase([dict(row, updated_at=START) for row in roster.to_dict('records')])
+
+    @contextmanager
+    def pooled_connection():
+        yield database
+
+    monkeypatch.setattr(ml_sync, 'pooled_connection', pooled_connection)
+    return database
+
+
+@pytest.fixture
+def recommender(database):
+    columns = ['id', 'full_name', 'specialty', 'experience_years', 'rating', 'available', 'avatar_url']
+    lawyers = make_lawyers(30)
+    return LawyerRecommender(lawyers_df=lawyers[lawyers['available']][columns].reset_index(drop=True),
+                             ranking_weights=DEFAULT_WEIGHTS)
+
+
+@pytest.fixture
+def delta_sync():
+    delta_sync = DeltaSync(interval=0, overlap=30, cases_limit=5)
+    delta_sync.reset((START, 0), START)
+    return delta_sync
+
+
+def test_idle_overlap_rereads_are_not_counted(database, recommender, delta_sync):
+    assert delta_sync.sync(recommender) == 0
+    assert delta_sync.sync(recommender) == 0
+    # La ventana vuelve a traer todo el roster (updated_at == marca), pero nada cambia
+    assert delta_sync.stats['rows_fetched']['lawyers'] == 2 * len(database.lawyers)
+    assert delta_sync.stats['rows_synced'] == {'lawyers': 0, 'user_questions': 0}
+    assert delta_sync.watermarks['lawyers'] == START
+
+
+def test_update_is_applied_once_and_advances_watermark(database, recommender, delta_sync):
+    lawyer_id = database.lawyers[0]['id']
+    database.touch(lawyer_id, 60, rating=3.1)
+
+    assert delta_sync.sync(recommender) == 1
+    assert recommender.lawyers_df.loc[recommender._position(lawyer_id), 'rating'] == 3.1
+    assert delta_sync.watermarks['lawyers'] == START + timedelta(seconds=60)
+
+    # La misma fila vuelve en la ventana de solapamiento sin contarse otra vez
+    assert delta_sync.sync(recommender) == 0
+    assert delta_sync.stats['rows_fetched']['lawyers'] == len(database.lawyers) + 1
+    assert delta_sync.stats['rows_synced']['lawyers'] == 1
+
+
+def test_insert_and_descriptive_change(database, recommender, delta_sync):
+    new_id = '00000000-0000-0000-0000-00000000abcd'
+    database.lawyers.append(dict(database.lawyers[0], id=new_id, full_name='Dra. Nueva',
+                                 updated_at=START + timedelta(seconds=10)))
+    database.touch(database.lawyers[1]['id'], 20, specialty='Derecho Migratorio')
+
+    assert delta_sync.sync(recommender) == 2
+    assert recommender._position(new_id) is not None
+    assert recommender.lawyers_df.loc[recommender._position(database.lawyers[1]['id']), 'specialty'] == \
+        'Derecho Migratorio'
+    assert delta_sync.watermarks['lawyers'] == START + timedelta(seconds=20)
+
+
+def test_deactivation_removes_lawyer(database, recommender, delta_sync):
+    lawyer_id = database.lawyers[2]['id']
+    database.touch(lawyer_id, 5, available=False)
+
+    assert delta_sync.sync(recommender) == 1
+    assert recommender._position(lawyer_id) is None
+    assert delta_sync.sync(recommender) == 0
+
+
+def test_late_commit_inside_overlap_is_applied(database, recommender, delta_sync):
+    database.touch(database.lawyers[0]['id'], 100, rating=4.99)
+    delta_sync.sync(recommender)
+
+    # Confirmada después, pero con updated_at anterior a la marca (dentro de la ventana)
+    late_id = database.lawyers[3]['id']
+    database.touch(late_id, 80, experience_years=39)
+    assert delta_sync.sync(recommender) == 1
+    assert recommender.lawyers_df.loc[recommender._position(late_id), 'experience_years'] == 39
+    # La marca no retrocede
+    assert delta_sync.watermarks['lawyers'] == START + timedelta(seconds=100)
+
+
+def test_new_cases_are_counted_once_and_bounded(database, recommender, delta_sync):
+    database.cases = [{'id': i, 'description': f"caso {i}", 'category': 'laboral', 'keywords': None,
+                       'created_at': START + timedelta(seconds=i)} for i in range(1, 9)]
+
+    assert delta_sync.sync(recommender) == 5
+    assert sorted(recommender.cases_df['id']) == [4, 5, 6, 7, 8]
+    assert delta_sync.watermarks['user_questions'] == START + timedelta(seconds=8)
+    assert delta_sync.sync(recommender) == 0
+
+
+def test_without_watermark_loads_a_snapshot(database, recommender):
+    delta_sync = DeltaSync(interval=0)
+    reloads = []
+
+    assert delta_sync.sync(recommender, reload=lambda: reloads.append(True)) == 0
+    assert reloads == [True]
+    assert delta_sync.stats['snapshot_loads'] == 1
+    assert database.queries == 0
+
+
+def test_exact_rating_survives_the_rating_flush_echo(database, recommender, delta_sync):
+    from ml_rating_store import RatingStore
+
+    lawyer_id = database.lawyers[0]['id']
+    store = RatingStore()
+    store.totals = {lawyer_id: (13.0, 3)}
+    store.loaded = True
+    recommender.update_rating(lawyer_id, 13.0 / 3)
+
+    # El volcado escribe la media redondeada y dispara updated_at
+    database.touch(lawyer_id, 40, rating=4.33)
+    assert delta_sync.sync(recommender, rating_store=store) == 0
+    assert recommender.lawyers_df.loc[recommender._position(lawyer_id), 'rating'] == 13.0 / 3
+
+    # Sin votos registrados, la fila de la base de datos sigue mandando
+    other_id = database.lawyers[1]['id']
+    database.touch(other_id, 50, rating=3.14)
+    assert delta_sync.sync(recommender, rating_store=store) == 1
+    assert recommender.lawyers_df.loc[recommender._position(other_id), 'rating'] == 3.14
@@ -0,0 +1,28 @@
+import io
+import json
+
+from ml_worker import serve_ndjson_pool
+
+
+def _echo(request):
+    return {'status': 'success', 'echo': request.get('value')}
+
+
+def test_pool_failure_keeps_request_id():
+    # Una lambda no se puede serializar: el envío al pool falla antes de llegar a un proceso
+    output = io.StringIO()
+    serve_ndjson_pool(lambda request: {'status': 'success'}, workers=1,
+                      input_stream=io.StringIO('{"id": 7}\n'), output_stream=output)
+
+    response = json.loads(output.getvalue())
+    assert response['status'] == 'error'
+    assert response['id'] == 7
+
+
+def test_pool_answers_by_id():
+    output = io.StringIO()
+    lines = ''.join(json.dumps({'id': i, 'value': i * 10}) + '\n' for i in range(4))
+    serve_ndjson_pool(_echo, workers=2, input_stream=io.StringIO(lines), output_stream=output)
+
+    responses = {r['id']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert {i: r['echo'] for i, r in responses.items()} == {i: i * 10 for i in range(4)}
@@ -89,6 +89,7 @@ export interface Database {
           available: boolean
           avatar_url: string | null
           created_at: string
+          updated_at: string
         }
         Insert: {
           id?: string
@@ -99,6 +100,7 @@ export interface Database {
           available?: boolean
           avatar_url?: string | null
           created_at?: string
+          updated_at?: string
         }
         Update: {
           full_name?: string